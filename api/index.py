@@ -5,7 +5,15 @@ import serverless_wsgi
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "backend"))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+# JSON API only: skip admin/sessions/messages/staticfiles and the browsable API
+# on cold start (set API_ONLY=False in the function env to bring them back)
+os.environ.setdefault("API_ONLY", "True")
+# API_ONLY also makes location pings write through (SHOPS_PING_WRITE_THROUGH):
+# nothing may wait in a buffer while the function is frozen between invocations.
 
+# Built once per container and reused by every warm invocation. The Mongo
+# client is created on the first query (apps/shops/db.py) and then kept for
+# the life of the container.
 from project.wsgi import application  # noqa
 
 def handler(event, context):
@@ -2,4 +2,21 @@ from django.apps import AppConfig
 
 class ShopsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.shops'
\ No newline at end of file
+    name = 'apps.shops'
+
+    def ready(self):
+        from . import conditional, counts, db, geo_index, nearby_cache, partitions, stats
+        db.configure()
+        from .signals import shop_saved, shop_deleted
+        shop_saved.connect(geo_index.on_shop_saved, dispatch_uid='shops.geo_index.saved')
+        shop_deleted.connect(geo_index.on_shop_deleted, dispatch_uid='shops.geo_index.deleted')
+        shop_saved.connect(nearby_cache.on_shop_saved, dispatch_uid='shops.nearby_cache.saved')
+        shop_deleted.connect(nearby_cache.on_shop_deleted, dispatch_uid='shops.nearby_cache.deleted')
+        shop_saved.connect(partitions.on_shop_saved, dispatch_uid='shops.partitions.saved')
+        shop_deleted.connect(partitions.on_shop_deleted, dispatch_uid='shops.partitions.deleted')
+        shop_saved.connect(counts.on_shop_saved, dispatch_uid='shops.counts.saved')
+        shop_deleted.connect(counts.on_shop_deleted, dispatch_uid='shops.counts.deleted')
+        shop_saved.connect(conditional.on_shop_saved, dispatch_uid='shops.conditional.saved')
+        shop_deleted.connect(conditional.on_shop_deleted, dispatch_uid='shops.conditional.deleted')
+        shop_saved.connect(stats.on_shop_saved, dispatch_uid='shops.stats.saved')
+        shop_deleted.connect(stats.on_shop_deleted, dispatch_uid='shops.stats.deleted')
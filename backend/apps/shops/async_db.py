@@ -0,0 +1,26 @@
+"""
+Shared async PyMongo client for the async serving mode.
+
+One AsyncMongoClient (and so one connection pool) per worker process,
+created lazily on first use inside that worker's event loop.
+"""
+from django.conf import settings
+
+from .db import client_options
+from .mongo_models import Shop
+
+_client = None
+
+
+def get_async_client():
+    global _client
+    if _client is None:
+        from pymongo import AsyncMongoClient
+        options = dict(client_options(), maxPoolSize=settings.MONGODB_ASYNC_MAX_POOL_SIZE)
+        _client = AsyncMongoClient(settings.MONGODB_URI, **options)
+    return _client
+
+
+def get_async_collection():
+    db = get_async_client().get_default_database(default='test')  # MongoEngine's default db name
+    return db[Shop._get_collection_name()]
@@ -0,0 +1,207 @@
+"""
+Native async Django views for the shop read paths (list, retrieve, nearby),
+backed by the async PyMongo driver. Enabled with SHOPS_ASYNC_VIEWS under an
+ASGI server (uvicorn workers); writes are still handled by ShopViewSet, which
+Django runs in a thread for us.
+
+Responses keep ShopViewSet's shape: same fields, DRF's JSON encoding and the
+same error bodies.
+"""
+import asyncio
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+from rest_framework.request import Request
+
+from . import ratelimit
+from .async_db import get_async_collection
+from .nearby import get_engine, nearby_params, ndjson_lines, select_fields
+from .nearby_cache import cached_search
+from .conditional import alist_version, is_not_modified, list_etag, not_modified
+from .counts import count_mode, aestimated_count, EXACT, ESTIMATED
+from .renderers import json_dumps
+from .pagination import InvalidCursor, NEWEST_FIRST, keyset_query, page_params, split_page, page_links, nearby_links
+from .queries import business_type_keys, shop_list_filter, page_pipeline, unpack_page
+from .serializers import READ_PROJECTION, row_to_dict
+from .views import ShopViewSet
+from .writes import DETAILS, FORBIDDEN, NOT_FOUND, WRITE_PROJECTION, object_id, validators
+
+
+def _json(data, status=200):
+    return HttpResponse(json_dumps(data), status=status, content_type='application/json')
+
+
+def _authenticate(request):
+    for authenticator in ShopViewSet().get_authenticators():
+        result = authenticator.authenticate(Request(request))
+        if result is not None:
+            return result[0]
+    return None
+
+
+def _auth_error(request, exc):
+    # an invalid/expired token, rendered like DRF does
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = _json(data, status=exc.status_code)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = ShopViewSet().get_authenticators()[0].authenticate_header(Request(request))
+    return response
+
+
+async def _user_or_401(request):
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except APIException as e:
+        return None, _auth_error(request, e)
+    if user is None or not user.is_authenticated:
+        return None, _json({'detail': NotAuthenticated.default_detail}, status=401)
+    return user, None
+
+
+async def _throttled(request, scope, user=None):
+    """429 response when the request is over `scope`'s quota, else None."""
+    allowed, wait = await sync_to_async(ratelimit.check)(request, scope, user)
+    if allowed:
+        return None
+    exc = Throttled(wait)
+    response = _json({'detail': exc.detail}, status=exc.status_code)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+async def shop_list(request):
+    user, error = await _user_or_401(request)
+    if error:
+        return error
+    throttled = await _throttled(request, 'shops.list', user)
+    if throttled:
+        return throttled
+    etag = list_etag(await alist_version(user.id), request.META)
+    if is_not_modified(request.META, etag):
+        return not_modified({'ETag': etag})
+    coll = get_async_collection()
+    params = request.GET
+    types = business_type_keys(params.getlist('business_type'))
+    query = shop_list_filter(user.id, types)
+    page, page_size = page_params(params)
+    cursor = params.get('cursor')
+    use_cursor = cursor is not None or settings.SHOPS_LIST_PAGINATION == 'cursor'
+    try:
+        mode = count_mode(params.get('count'), ESTIMATED if use_cursor else EXACT)
+    except ValueError as e:
+        return _json({'detail': str(e)}, status=400)
+
+    if use_cursor:
+        try:
+            boundary, sort, direction = keyset_query(cursor)
+        except InvalidCursor as e:
+            return _json({'detail': str(e)}, status=400)
+        skip, limit = 0, page_size + 1
+    else:
+        boundary, sort, direction = None, NEWEST_FIRST, None
+        skip, limit = (page - 1) * page_size, page_size
+
+    if mode == EXACT and settings.SHOPS_LIST_ENGINE == 'facet':
+        facet = await (await coll.aggregate(page_pipeline(query, sort, boundary, skip, limit))).next()
+        rows, total = unpack_page(facet)
+    else:
+        find = coll.find({**query, **(boundary or {})}, READ_PROJECTION).sort(sort).skip(skip).limit(limit)
+        if mode == EXACT:
+            # count and page fetch go out concurrently on the shared pool
+            rows, total = await asyncio.gather(find.to_list(None), coll.count_documents(query))
+        elif mode == ESTIMATED:
+            rows, total = await asyncio.gather(
+                find.to_list(None),
+                aestimated_count(
+                    user.id, types,
+                    lambda key: coll.count_documents(shop_list_filter(user.id, [key] if key else None)),
+                ),
+            )
+        else:
+            rows, total = await find.to_list(None), None
+
+    next_url = previous_url = None
+    if use_cursor:
+        rows, has_next, has_previous = split_page(rows, page_size, direction)
+    items = [row_to_dict(row) for row in rows]
+    if use_cursor:
+        next_url, previous_url = page_links(request, items, has_next, has_previous)
+    response = _json({'count': total, 'next': next_url, 'previous': previous_url, 'results': items})
+    response['ETag'] = etag
+    return response
+
+
+async def shop_retrieve(request, pk):
+    user, error = await _user_or_401(request)
+    if error:
+        return error
+    throttled = await _throttled(request, 'shops.retrieve', user)
+    if throttled:
+        return throttled
+    coll = get_async_collection()
+    _id = object_id(pk)
+    row = await coll.find_one({'_id': _id, 'vendor_id': user.id}, WRITE_PROJECTION) if _id else None
+    if row is None:
+        # only a miss pays for the second lookup that tells 404 from 403
+        other = await coll.find_one({'_id': _id}, {'vendor_id': 1}) if _id else None
+        code = FORBIDDEN if other is not None else NOT_FOUND
+        return _json({'detail': DETAILS[code]}, status=code)
+    headers = validators(row)
+    if is_not_modified(request.META, headers['ETag'], row['updated_at']):
+        return not_modified(headers)
+    response = _json(row_to_dict(row))
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+async def shop_nearby(request):
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except APIException as e:
+        # public, but a bad token is still a 401, as on ShopViewSet.nearby
+        return _auth_error(request, e)
+    throttled = await _throttled(request, 'shops.nearby', user)
+    if throttled:
+        return throttled
+    try:
+        params = nearby_params(request.GET)
+    except ValueError as e:
+        return _json({'detail': str(e)}, status=400)
+    lat, lng, radius_km = params['lat'], params['lng'], params['radius_km']
+    limit, after, fields = params['limit'], params['after'], params['fields']
+
+    engine = get_engine()
+    streaming = params['output'] == 'ndjson'
+    fetch = limit + 1 if limit is not None and not streaming else limit
+    if settings.SHOPS_NEARBY_CACHE:
+        data = await sync_to_async(cached_search)(engine, lat, lng, radius_km, fetch, after)
+    elif hasattr(engine, 'asearch'):
+        data = await engine.asearch(lat, lng, radius_km, fetch, after)
+    else:
+        data = await sync_to_async(engine.search)(lat, lng, radius_km, fetch, after)
+
+    if streaming:
+        async def lines():
+            for line in ndjson_lines(data, fields):
+                yield line
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    if not params['paged']:
+        return _json(select_fields(data, fields))
+    has_next = limit is not None and len(data) > limit
+    data = data[:limit]
+    next_url = nearby_links(request, (lat, lng, radius_km), data, has_next, after)
+    return _json({'next': next_url, 'results': select_fields(data, fields)})
+
+
+def hybrid(async_view, sync_view):
+    """GET goes to `async_view`; every other method to the sync ViewSet view."""
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            return await async_view(request, *args, **kwargs)
+        return await sync_to_async(sync_view)(request, *args, **kwargs)
+    view.csrf_exempt = True
+    return view
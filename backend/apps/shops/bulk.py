@@ -0,0 +1,135 @@
+"""
+Bulk import / export of a vendor's shops (NDJSON or CSV).
+
+Imports are validated with ShopSerializer a chunk at a time and written with
+unordered insert_many, so one bad row never blocks the rest; every rejected
+row is reported with its 1-based row number. Exports are generators, meant
+to be wrapped in a StreamingHttpResponse.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from itertools import islice
+
+from pymongo.errors import BulkWriteError
+
+from . import stats
+from .mongo_models import Shop
+from .renderers import json_dumps
+from .serializers import ShopSerializer, READ_FIELDS, READ_PROJECTION, row_to_dict
+from .signals import shop_saved
+from .utils import business_type_key, geo_fields
+
+WRITABLE_FIELDS = ('name', 'owner_name', 'business_type', 'latitude', 'longitude')
+EXPORT_FIELDS = ('id',) + READ_FIELDS
+
+
+def _lines(stream):
+    for line in stream:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def parse_ndjson(stream):
+    """Yields one dict per non-empty line, or a ValueError for unparsable lines."""
+    for line in _lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = ValueError(f'Invalid JSON: {e}')
+        else:
+            if not isinstance(row, dict):
+                row = ValueError('Each line must be a JSON object.')
+        yield row
+
+
+def parse_csv(stream):
+    for row in csv.DictReader(_lines(stream)):
+        yield {k: v for k, v in row.items() if k in WRITABLE_FIELDS}
+
+
+def import_rows(vendor_id, rows, chunk_size=500, max_rows=None):
+    """Validates and inserts `rows`; returns (inserted_count, errors)."""
+    coll = Shop._get_collection()
+    inserted, errors, offset = 0, [], 0
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        if max_rows is not None and offset + len(chunk) > max_rows:
+            errors.append({'row': max_rows + 1, 'errors': {'detail': f'Imports are limited to {max_rows} rows.'}})
+            chunk = chunk[:max(max_rows - offset, 0)]
+
+        docs, numbers = [], []
+        now = datetime.now(timezone.utc)
+        for i, row in enumerate(chunk, start=offset + 1):
+            if isinstance(row, Exception):
+                errors.append({'row': i, 'errors': {'detail': str(row)}})
+                continue
+            serializer = ShopSerializer(data=row)
+            if not serializer.is_valid():
+                errors.append({'row': i, 'errors': serializer.errors})
+                continue
+            data = serializer.validated_data
+            docs.append({
+                'vendor_id': vendor_id,
+                'name': data['name'],
+                'owner_name': data['owner_name'],
+                'business_type': data.get('business_type', ''),
+                'business_type_key': business_type_key(data.get('business_type', '')),
+                'latitude': data['latitude'],
+                'longitude': data['longitude'],
+                **geo_fields(data['latitude'], data['longitude']),
+                'created_at': now,
+                'updated_at': now,
+                'version': 0,
+            })
+            numbers.append(i)
+
+        failed = set()
+        if docs:
+            try:
+                coll.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for err in e.details.get('writeErrors', []):
+                    failed.add(err['index'])
+                    errors.append({'row': numbers[err['index']], 'errors': {'detail': err.get('errmsg', 'Write failed.')}})
+        with stats.batched():  # one stats bulk_write per chunk
+            for idx, doc in enumerate(docs):
+                if idx not in failed:
+                    inserted += 1
+                    shop_saved.send(sender=Shop, shop=row_to_dict(doc), previous=None)
+
+        offset += len(chunk)
+        if max_rows is not None and offset >= max_rows:
+            break
+
+    errors.sort(key=lambda e: e['row'])
+    return inserted, errors
+
+
+def _export_rows(vendor_id, batch_size=1000):
+    cursor = Shop._get_collection().find({'vendor_id': vendor_id}, READ_PROJECTION).sort('_id', 1)
+    for row in cursor.batch_size(batch_size):
+        yield row_to_dict(row)
+
+
+def export_ndjson(vendor_id):
+    for shop in _export_rows(vendor_id):
+        yield json_dumps(shop) + b'\n'
+
+
+def export_csv(vendor_id):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    for shop in _export_rows(vendor_id):
+        writer.writerow([shop[f].isoformat() if isinstance(shop[f], datetime) else shop[f] for f in EXPORT_FIELDS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
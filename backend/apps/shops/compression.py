@@ -0,0 +1,129 @@
+"""
+Response compression for large JSON payloads (shop lists, nearby results,
+NDJSON streams).
+
+Brotli when the client accepts it and the `brotli` package is installed
+(`pip install brotli`), gzip otherwise. Buffered responses are only
+compressed from SHOPS_COMPRESS_MIN_BYTES up; small bodies aren't worth the
+CPU and may even grow. Streams are compressed chunk by chunk and flushed
+after each one, so NDJSON rows still reach the client as they are produced.
+"""
+import gzip
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+
+
+def accepted_encoding(header):
+    """'br', 'gzip' or None for an Accept-Encoding header."""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=settings.SHOPS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=settings.SHOPS_GZIP_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._c = brotli.Compressor(quality=settings.SHOPS_BROTLI_QUALITY)
+            self.compress, self.flush = self._c.process, self._c.flush
+            self.finish = self._c.finish
+        else:
+            self._c = zlib.compressobj(settings.SHOPS_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+            self.compress = self._c.compress
+            self.flush = lambda: self._c.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = self._c.flush
+
+    def chunk(self, data):
+        return self.compress(data) + self.flush()
+
+
+def _compress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    for data in chunks:
+        yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+async def _acompress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    async for data in chunks:
+        yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    # async-capable, so ASGI requests to the async views stay on the event loop
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if not settings.SHOPS_COMPRESSION or response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').split(';')[0].strip() not in COMPRESSIBLE_TYPES:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = _compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.SHOPS_COMPRESS_MIN_BYTES:
+                return response
+            body = compress(response.content, encoding)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response['Content-Length'] = str(len(body))
+
+        # the compressed bytes differ from the identity ones (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
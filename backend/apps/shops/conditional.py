@@ -0,0 +1,129 @@
+"""
+Conditional GET for shop reads.
+
+A shop's validators are its version (ETag) and updated_at (Last-Modified),
+see writes.validators. A vendor's list ETag hashes a per-vendor version token
+with the query string, so a matching If-None-Match gets its 304 before the
+page is fetched.
+
+With a shared default cache (CACHE_URL) the token lives there and every write
+to one of the vendor's shops replaces it (signal receivers below): the check
+costs no Mongo query. A process-local cache can't be trusted for this, since
+a write in one worker (or serverless container) would leave the others
+answering 304 for a stale list. The token is then derived from the data
+instead: the vendor's shop count and newest updated_at, two index-only
+queries on (vendor_id, updated_at).
+"""
+import asyncio
+import hashlib
+import uuid
+from datetime import timezone
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, parse_http_date_safe
+
+from .mongo_models import Shop
+
+
+def _version_key(vendor_id):
+    return f'shops:list-version:{vendor_id}'
+
+
+def shared_cache():
+    """Whether the default cache is seen by every worker."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _data_version(count, latest):
+    return f"{count}:{latest['updated_at'].isoformat() if latest else '-'}"
+
+
+def _latest_query(vendor_id):
+    return {'vendor_id': vendor_id}, {'_id': 0, 'updated_at': 1}
+
+
+def list_version(vendor_id):
+    if not shared_cache():
+        coll = Shop._get_collection()
+        query, projection = _latest_query(vendor_id)
+        latest = coll.find_one(query, projection, sort=[('updated_at', -1)])
+        return _data_version(coll.count_documents(query), latest)
+    key = _version_key(vendor_id)
+    token = cache.get(key)
+    if token is None:
+        # a fresh token never matches an ETag handed out before
+        cache.add(key, uuid.uuid4().hex, settings.SHOPS_LIST_VERSION_TTL)
+        token = cache.get(key)
+    return token
+
+
+async def alist_version(vendor_id):
+    if not shared_cache():
+        from .async_db import get_async_collection
+        coll = get_async_collection()
+        query, projection = _latest_query(vendor_id)
+        count, latest = await asyncio.gather(
+            coll.count_documents(query), coll.find_one(query, projection, sort=[('updated_at', -1)]),
+        )
+        return _data_version(count, latest)
+    key = _version_key(vendor_id)
+    token = await cache.aget(key)
+    if token is None:
+        await cache.aadd(key, uuid.uuid4().hex, settings.SHOPS_LIST_VERSION_TTL)
+        token = await cache.aget(key)
+    return token
+
+
+def list_etag(token, meta):
+    """Weak ETag of one list page: the vendor's version token, query string and Accept header."""
+    raw = f"{token}|{meta.get('QUERY_STRING', '')}|{meta.get('HTTP_ACCEPT', '')}"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def _opaque(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def is_not_modified(meta, etag, last_modified=None):
+    """
+    Whether If-None-Match (weak comparison) or, without it, If-Modified-Since
+    says the client's copy is current. `last_modified` is a datetime.
+    """
+    if_none_match = meta.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        return tags == ['*'] or _opaque(etag) in {_opaque(tag) for tag in tags}
+    since = meta.get('HTTP_IF_MODIFIED_SINCE')
+    if since and last_modified is not None:
+        timestamp = parse_http_date_safe(since)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return timestamp is not None and int(last_modified.timestamp()) <= timestamp
+    return False
+
+
+def not_modified(headers):
+    """304 carrying the validators (ETag, Last-Modified) of the current representation."""
+    response = HttpResponseNotModified()
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+# -- signal receivers (connected in ShopsConfig.ready) ------------------------
+
+def _bump(vendor_id):
+    if shared_cache():
+        cache.set(_version_key(vendor_id), uuid.uuid4().hex, settings.SHOPS_LIST_VERSION_TTL)
+
+
+def on_shop_saved(sender, shop, previous=None, **kwargs):
+    _bump(shop['vendor_id'])
+
+
+def on_shop_deleted(sender, shop, **kwargs):
+    _bump(shop['vendor_id'])
@@ -0,0 +1,88 @@
+"""
+Shop list counts.
+
+`?count=` picks how the list total is produced:
+  exact      counted by Mongo in the same round trip as the page ($facet)
+  estimated  per-vendor (and per business type) counts from the Django cache,
+             bumped on create/destroy/type change and recomputed on a miss
+  none       not computed (count is null)
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .utils import business_type_key
+
+EXACT, ESTIMATED, NONE = 'exact', 'estimated', 'none'
+_ALIASES = {'true': None, '1': None, 'yes': None, 'false': NONE, '0': NONE, 'no': NONE}
+
+
+def count_mode(value, default):
+    if value is None:
+        return default
+    value = value.lower()
+    if value in _ALIASES:
+        return _ALIASES[value] or default
+    if value not in (EXACT, ESTIMATED, NONE):
+        raise ValueError('count must be exact, estimated or none.')
+    return value
+
+
+def count_key(vendor_id, business_type=None):
+    # the total and the per-type counts live under different prefixes, so the
+    # total never shares a key with the blank business type
+    if business_type is None:
+        return f"shops:count:{vendor_id}:all"
+    return f"shops:count:{vendor_id}:type:{business_type_key(business_type)}"
+
+
+def estimated_count(vendor_id, business_types, compute):
+    """
+    Cached total for a vendor, optionally restricted to business types.
+    `compute(key)` counts one normalized type (or all shops when key is None)
+    on a cache miss; a multi-type filter is the sum of its per-type counts.
+    """
+    total = 0
+    for key in business_types or [None]:
+        cache_key = count_key(vendor_id, key)
+        value = cache.get(cache_key)
+        if value is None:
+            value = compute(key)
+            cache.add(cache_key, value, settings.SHOPS_LIST_COUNT_TTL)
+        total += value
+    return total
+
+
+async def aestimated_count(vendor_id, business_types, compute):
+    total = 0
+    for key in business_types or [None]:
+        cache_key = count_key(vendor_id, key)
+        value = await cache.aget(cache_key)
+        if value is None:
+            value = await compute(key)
+            await cache.aadd(cache_key, value, settings.SHOPS_LIST_COUNT_TTL)
+        total += value
+    return total
+
+
+def _bump(vendor_id, business_type, delta):
+    for key in (count_key(vendor_id), count_key(vendor_id, business_type or '')):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass  # not cached; the next read counts from Mongo
+
+
+def on_shop_saved(sender, shop, previous=None, **kwargs):
+    if previous is None:
+        _bump(shop['vendor_id'], shop['business_type'], 1)
+    elif business_type_key(previous['business_type']) != business_type_key(shop['business_type']):
+        # total is unchanged; move one shop between the two type counts
+        for bt, delta in ((previous['business_type'], -1), (shop['business_type'], 1)):
+            try:
+                cache.incr(count_key(shop['vendor_id'], bt or ''), delta)
+            except ValueError:
+                pass
+
+
+def on_shop_deleted(sender, shop, **kwargs):
+    _bump(shop['vendor_id'], shop['business_type'], -1)
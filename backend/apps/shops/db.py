@@ -0,0 +1,179 @@
+"""
+MongoDB connection management for the shops app.
+
+The connection is registered with MongoEngine at app start-up but the
+PyMongo client is only created on first use, inside the worker process that
+uses it (gunicorn forks before that). If a client did get created before a
+fork, the child drops it and builds its own. Pool sizing, timeouts, read
+preference and compression come from settings (MONGODB_* env vars), and a
+set of PyMongo monitoring listeners feeds the /api/health/ endpoint.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import mongoengine as me
+from django.conf import settings
+from pymongo import ReadPreference, monitoring
+
+from .instrumentation import command_timer
+
+ALIAS = 'default'
+
+
+class PoolStats(monitoring.ConnectionPoolListener, monitoring.ServerHeartbeatListener):
+    """Connection pool checkout waits, in-use connections and heartbeat RTT."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._started = {}   # thread id -> checkout start (perf_counter)
+        self.waits_ms = deque(maxlen=window)
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.connections_open = 0
+        self.heartbeat_ms = None
+        self.heartbeat_failures = 0
+
+    # -- pool events ---------------------------------------------------------
+
+    def connection_check_out_started(self, event):
+        self._started[threading.get_ident()] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = self._started.pop(threading.get_ident(), None)
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            if started is not None:
+                self.waits_ms.append((time.perf_counter() - started) * 1000)
+
+    def connection_check_out_failed(self, event):
+        self._started.pop(threading.get_ident(), None)
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(self.connections_open - 1, 0)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    # -- heartbeat events ----------------------------------------------------
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.heartbeat_ms = round(event.duration * 1000, 3)
+
+    def failed(self, event):
+        self.heartbeat_failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self.waits_ms)
+            in_use, max_in_use = self.in_use, self.max_in_use
+            checkouts, failures, open_ = self.checkouts, self.checkout_failures, self.connections_open
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))], 3) if waits else None
+
+        return {
+            'max_pool_size': settings.MONGODB_MAX_POOL_SIZE,
+            'connections_open': open_,
+            'in_use': in_use,
+            'max_in_use': max_in_use,
+            'checkouts': checkouts,
+            'checkout_failures': failures,
+            'checkout_wait_ms': {'p50': pct(50), 'p95': pct(95), 'max': round(waits[-1], 3) if waits else None},
+            'heartbeat_rtt_ms': self.heartbeat_ms,
+            'heartbeat_failures': self.heartbeat_failures,
+        }
+
+
+pool_stats = PoolStats()
+_configured_pid = None
+
+
+def read_preference(name):
+    # "secondary_preferred" -> ReadPreference.SECONDARY_PREFERRED
+    return getattr(ReadPreference, name.strip().upper())
+
+
+def client_options():
+    """Keyword arguments for MongoClient / AsyncMongoClient."""
+    options = {
+        'maxPoolSize': settings.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': settings.MONGODB_MIN_POOL_SIZE,
+        'waitQueueTimeoutMS': settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': settings.MONGODB_CONNECT_TIMEOUT_MS,
+        'read_preference': read_preference(settings.MONGODB_READ_PREFERENCE),
+        'event_listeners': [pool_stats],
+    }
+    if settings.SHOPS_METRICS_ENABLED:
+        options['event_listeners'].append(command_timer)
+    if settings.MONGODB_COMPRESSORS:
+        options['compressors'] = settings.MONGODB_COMPRESSORS
+    return options
+
+
+def partition_alias(prefix):
+    return f'shops-{prefix}'
+
+
+def configure():
+    """Register (not open) the MongoEngine connections for this process."""
+    global _configured_pid
+    if not settings.MONGODB_URI:
+        return
+    me.disconnect(alias=ALIAS)
+    me.register_connection(alias=ALIAS, host=settings.MONGODB_URI, connect=False, **client_options())
+    # per-region copies, see partitions.py
+    for prefix, uri in settings.SHOPS_GEO_PARTITIONS.items():
+        me.disconnect(alias=partition_alias(prefix))
+        me.register_connection(alias=partition_alias(prefix), host=uri, connect=False, **client_options())
+    _configured_pid = os.getpid()
+
+
+def _after_fork_in_child():
+    # a client inherited from the parent must not be used; the next query reconnects lazily
+    if _configured_pid is not None and _configured_pid != os.getpid():
+        configure()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def ping():
+    """Server round-trip time of a `ping` command, in milliseconds."""
+    db = me.get_db(ALIAS)
+    started = time.perf_counter()
+    db.command('ping')
+    return round((time.perf_counter() - started) * 1000, 3)
@@ -0,0 +1,177 @@
+"""
+In-process grid index over shop coordinates for the `grid` nearby engine.
+
+Shops are bucketed into fixed lat/lng cells. A nearby query only visits the
+cells overlapping its bounding box (split at the antimeridian), or the
+occupied cells when that is fewer, so it is answered from memory without a
+Mongo round trip. Distances are computed outside the index lock. The index is
+updated incrementally from the shop_saved / shop_deleted signals and
+reconciled against Mongo every SHOPS_GRID_RECONCILE_SECONDS (by polling
+`updated_at`) to pick up writes made by other worker processes. Each poll
+goes back SHOPS_GRID_RECONCILE_LAG_SECONDS before the newest `updated_at`
+seen: a write is stamped before it commits (a location flush stamps a whole
+bulk_write), so it can land after a poll with an older timestamp.
+"""
+import heapq
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+
+from .mongo_models import Shop
+from .nearby import after_floor, window
+from .serializers import READ_PROJECTION, row_to_dict
+from .utils import bounding_boxes, chord2_limit, chord2_to_km, unit_vector
+
+PROJECTION = dict(READ_PROJECTION, xyz=1)
+
+
+class GridIndex:
+    def __init__(self, cell_deg=0.1, reconcile_seconds=60, reconcile_lag_seconds=10):
+        self.cell_deg = float(cell_deg)
+        self.reconcile_seconds = reconcile_seconds
+        self.reconcile_lag = timedelta(seconds=reconcile_lag_seconds)
+        self._cells = {}      # (i, j) -> {shop_id: (shop dict, unit vector)}
+        self._cell_of = {}    # shop_id -> (i, j)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._synced_at = 0.0          # monotonic time of last reconcile
+        self._watermark = None         # max updated_at seen in Mongo
+
+    def cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    # -- incremental updates -------------------------------------------------
+
+    def upsert(self, shop, xyz=None):
+        xyz = xyz or unit_vector(shop['latitude'], shop['longitude'])
+        with self._lock:
+            self._discard(shop['id'])
+            key = self.cell(shop['latitude'], shop['longitude'])
+            self._cells.setdefault(key, {})[shop['id']] = (shop, xyz)
+            self._cell_of[shop['id']] = key
+
+    def remove(self, shop_id):
+        with self._lock:
+            self._discard(shop_id)
+
+    def _discard(self, shop_id):
+        key = self._cell_of.pop(shop_id, None)
+        if key is not None:
+            bucket = self._cells.get(key)
+            bucket.pop(shop_id, None)
+            if not bucket:
+                del self._cells[key]
+
+    # -- sync with Mongo -----------------------------------------------------
+
+    def load(self):
+        """Rebuild the whole index from Mongo."""
+        coll = Shop._get_collection()
+        cells, cell_of, watermark = {}, {}, None
+        for row in coll.find({}, PROJECTION):
+            shop = row_to_dict(row)
+            key = self.cell(shop['latitude'], shop['longitude'])
+            xyz = row.get('xyz') or unit_vector(shop['latitude'], shop['longitude'])
+            cells.setdefault(key, {})[shop['id']] = (shop, xyz)
+            cell_of[shop['id']] = key
+            if watermark is None or row['updated_at'] > watermark:
+                watermark = row['updated_at']
+        with self._lock:
+            self._cells, self._cell_of = cells, cell_of
+            self._watermark = watermark
+            self._loaded = True
+            self._synced_at = time.monotonic()
+
+    def reconcile(self):
+        """Apply rows changed since the last sync and drop shops deleted elsewhere."""
+        coll = Shop._get_collection()
+        # re-scan a margin before the watermark for writes that committed late
+        query = {'updated_at': {'$gte': self._watermark - self.reconcile_lag}} if self._watermark else {}
+        for row in coll.find(query, PROJECTION):
+            self.upsert(row_to_dict(row), row.get('xyz'))
+            if self._watermark is None or row['updated_at'] > self._watermark:
+                self._watermark = row['updated_at']
+        live = {str(row['_id']) for row in coll.find({}, {'_id': 1})}
+        with self._lock:
+            for shop_id in [s for s in self._cell_of if s not in live]:
+                self._discard(shop_id)
+            self._synced_at = time.monotonic()
+
+    def ensure_fresh(self):
+        # one refresh at a time; concurrent requests wait for it
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            elif time.monotonic() - self._synced_at >= self.reconcile_seconds:
+                self.reconcile()
+
+    # -- queries -------------------------------------------------------------
+
+    def _buckets(self, lat, lng, radius_km):
+        # caller holds the lock
+        ranges = []
+        for lat_min, lat_max, lng_min, lng_max in bounding_boxes(lat, lng, radius_km):
+            (i_min, j_min), (i_max, j_max) = self.cell(lat_min, lng_min), self.cell(lat_max, lng_max)
+            ranges.append((i_min, i_max, j_min, j_max))
+        visits = sum((i_max - i_min + 1) * (j_max - j_min + 1) for i_min, i_max, j_min, j_max in ranges)
+        if visits > len(self._cells):
+            # the box spans more cells than are occupied: walk the occupied ones,
+            # so a huge radius costs at most one pass over the index
+            return [bucket for (i, j), bucket in self._cells.items()
+                    if any(i_min <= i <= i_max and j_min <= j <= j_max for i_min, i_max, j_min, j_max in ranges)]
+        return [self._cells[(i, j)] for i_min, i_max, j_min, j_max in ranges
+                for i in range(i_min, i_max + 1) for j in range(j_min, j_max + 1) if (i, j) in self._cells]
+
+    def search(self, lat, lng, radius_km, limit=None, after=None):
+        with self._lock:
+            candidates = [entry for bucket in self._buckets(lat, lng, radius_km) for entry in bucket.values()]
+
+        # rank on squared chord length between unit vectors; km only for the hits
+        qx, qy, qz = unit_vector(lat, lng)
+        outer = chord2_limit(radius_km)
+        inner = chord2_limit(after_floor(after)) if after else -1.0
+        hits = []
+        for shop, (x, y, z) in candidates:
+            chord2 = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+            if inner < chord2 <= outer:
+                hits.append((chord2, shop))
+        if limit is not None and after is None:
+            hits = heapq.nsmallest(limit, hits, key=lambda hit: hit[0])  # bounded heap
+        else:
+            hits.sort(key=lambda hit: hit[0])
+        results = [dict(shop, distance_km=round(chord2_to_km(chord2), 3)) for chord2, shop in hits]
+        return window(results, limit, after)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = GridIndex(
+                    cell_deg=getattr(settings, 'SHOPS_GRID_CELL_DEG', 0.1),
+                    reconcile_seconds=getattr(settings, 'SHOPS_GRID_RECONCILE_SECONDS', 60),
+                    reconcile_lag_seconds=getattr(settings, 'SHOPS_GRID_RECONCILE_LAG_SECONDS', 10),
+                )
+    return _index
+
+
+def on_shop_saved(sender, shop, previous=None, **kwargs):
+    # only track writes once the index is in use in this process
+    if _index is not None and _index._loaded:
+        _index.upsert(shop)
+
+
+def on_shop_deleted(sender, shop, **kwargs):
+    if _index is not None and _index._loaded:
+        _index.remove(shop['id'])
@@ -0,0 +1,256 @@
+"""
+Per-request hot-path instrumentation.
+
+InstrumentationMiddleware times every request into a per-route latency
+histogram. A SHOPS_METRICS_SAMPLE_RATE fraction of requests is also traced
+in detail: Mongo commands (through CommandTimer, a PyMongo CommandListener
+registered on our clients), named phases inside the shop views (`phase()`)
+and DRF rendering. Those traces are returned in a `Server-Timing` header and
+aggregated into histograms, all exposed in Prometheus text format at
+/metrics (operators only, see permissions.ops_allowed). Metrics are per worker
+process.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import bson
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from pymongo import monitoring
+
+from .permissions import ops_allowed
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# -----------------------------------------------------------------------------
+# Minimal Prometheus registry (no client library needed)
+# -----------------------------------------------------------------------------
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.label_names + ('le',)
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_labels(names, key + (bound,))} {count}')
+                lines.append(f'{self.name}_bucket{_labels(names, key + ("+Inf",))} {series[-1]}')
+                lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {series[-2]:.6f}')
+                lines.append(f'{self.name}_count{_labels(self.label_names, key)} {series[-1]}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route.', ('route', 'method', 'status'))
+PHASE_LATENCY = Histogram('shops_phase_duration_seconds', 'Time spent in named view phases (sampled requests).', ('route', 'phase'))
+MONGO_LATENCY = Histogram('mongo_command_duration_seconds', 'Mongo command latency (sampled requests).', ('command',))
+MONGO_DOCS = Counter('mongo_command_documents_returned_total', 'Documents returned by Mongo commands (sampled requests).', ('command',))
+MONGO_BYTES = Counter('mongo_command_reply_bytes_total', 'BSON reply bytes of Mongo commands (sampled requests).', ('command',))
+METRICS = [REQUEST_LATENCY, PHASE_LATENCY, MONGO_LATENCY, MONGO_DOCS, MONGO_BYTES]
+
+
+# -----------------------------------------------------------------------------
+# Per-request trace
+# -----------------------------------------------------------------------------
+
+class Trace:
+    def __init__(self):
+        self.phases = {}     # name -> seconds
+        self.db_time = 0.0
+        self.db_commands = 0
+        self.db_docs = 0
+        self.db_bytes = 0
+        self.render_started = None
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_trace = ContextVar('shops_trace', default=None)
+
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as phase `name` of the current sampled request."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_phase(name, time.perf_counter() - started)
+
+
+def _docs_returned(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or ())
+    if 'n' in reply:
+        return int(reply['n'])
+    return 0
+
+
+class CommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        trace = _trace.get()
+        if trace is None:
+            return
+        seconds = event.duration_micros / 1e6
+        docs = _docs_returned(event.reply)
+        size = len(bson.encode(event.reply))
+        trace.db_time += seconds
+        trace.db_commands += 1
+        trace.db_docs += docs
+        trace.db_bytes += size
+        MONGO_LATENCY.observe(seconds, command=event.command_name)
+        MONGO_DOCS.inc(docs, command=event.command_name)
+        MONGO_BYTES.inc(size, command=event.command_name)
+
+    def failed(self, event):
+        trace = _trace.get()
+        if trace is not None:
+            trace.db_time += event.duration_micros / 1e6
+            trace.db_commands += 1
+
+
+command_timer = CommandTimer()
+
+
+# -----------------------------------------------------------------------------
+# Middleware and /metrics
+# -----------------------------------------------------------------------------
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    if match.route:
+        return match.route.replace('^', '').replace('$', '')
+    return match.view_name or 'unknown'
+
+
+def _server_timing(trace, total):
+    parts = [f'total;dur={total * 1000:.2f}']
+    if trace.db_commands:
+        parts.append(f'db;dur={trace.db_time * 1000:.2f};desc="{trace.db_commands} cmds, '
+                     f'{trace.db_docs} docs, {trace.db_bytes} B"')
+    for name, seconds in trace.phases.items():
+        parts.append(f'{name};dur={seconds * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class InstrumentationMiddleware:
+    # async-capable, so ASGI requests to the async views stay on the event loop
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.SHOPS_METRICS_ENABLED:
+            return self.get_response(request)
+        trace = Trace() if random.random() < settings.SHOPS_METRICS_SAMPLE_RATE else None
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _trace.reset(token)
+        return self._record(request, response, trace, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not settings.SHOPS_METRICS_ENABLED:
+            return await self.get_response(request)
+        trace = Trace() if random.random() < settings.SHOPS_METRICS_SAMPLE_RATE else None
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _trace.reset(token)
+        return self._record(request, response, trace, time.perf_counter() - started)
+
+    def _record(self, request, response, trace, total):
+        route = _route(request)
+        REQUEST_LATENCY.observe(total, route=route, method=request.method, status=response.status_code)
+        if trace is not None:
+            for name, seconds in trace.phases.items():
+                PHASE_LATENCY.observe(seconds, route=route, phase=name)
+            response['Server-Timing'] = _server_timing(trace, total)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that as "render"
+        trace = _trace.get()
+        if trace is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda r: trace.add_phase('render', time.perf_counter() - started)
+            )
+        return response
+
+
+def metrics_view(request):
+    if not ops_allowed(request):
+        return HttpResponseForbidden()
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from apps.shops.mongo_models import Shop
+from apps.shops.utils import business_type_key
+
+
+class Command(BaseCommand):
+    help = "Recompute business_type_key (normalized business_type) for every shop and build its list index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        Shop.ensure_indexes()
+        coll = Shop._get_collection()
+
+        ops, updated = [], 0
+        for row in coll.find({}, {'business_type': 1, 'business_type_key': 1}):
+            key = business_type_key(row.get('business_type'))
+            if row.get('business_type_key') == key:
+                continue
+            ops.append(UpdateOne({'_id': row['_id']}, {'$set': {'business_type_key': key}}))
+            if len(ops) >= batch_size:
+                updated += coll.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled business_type_key on {updated} shop(s)."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from apps.shops.mongo_models import Shop
+from apps.shops.utils import geo_fields
+
+
+class Command(BaseCommand):
+    help = "Recompute derived geo fields (GeoJSON location, geo_cell, ...) from latitude/longitude for every shop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        Shop.ensure_indexes()
+        coll = Shop._get_collection()
+
+        ops, updated = [], 0
+        for row in coll.find({}, {'latitude': 1, 'longitude': 1}):
+            ops.append(UpdateOne({'_id': row['_id']}, {'$set': geo_fields(row['latitude'], row['longitude'])}))
+            if len(ops) >= batch_size:
+                updated += coll.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled geo fields on {updated} shop(s)."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.shops import stats
+from apps.shops.mongo_models import VendorShopStats
+
+
+class Command(BaseCommand):
+    help = ("Recount every vendor's shop statistics (total, per business type, extent) "
+            "from the shops collection.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, action='append', dest='vendors',
+                            help="Only this vendor id (repeatable).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        VendorShopStats.ensure_indexes()
+        conflicts = stats.rebuild(options['vendors'], batch_size=options['batch_size'])
+        # vendors written to during the recount are recounted on their own
+        retried = [v for v in conflicts if stats.rebuild([v])]
+        rebuilt = VendorShopStats._get_collection().count_documents(
+            {'vendor_id': {'$in': options['vendors']}} if options['vendors'] else {})
+        if retried:
+            self.stdout.write(self.style.WARNING(
+                f"Stats for {len(retried)} vendor(s) kept changing; rerun for: {', '.join(map(str, retried))}"))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt shop statistics for {rebuilt} vendor(s)."))
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import DeleteOne, ReplaceOne
+
+from apps.shops import db, partitions
+from apps.shops.mongo_models import Shop
+from apps.shops.utils import business_type_key, geo_fields
+
+
+class Command(BaseCommand):
+    help = ("Copy every shop into its regional partition (SHOPS_GEO_PARTITIONS) "
+            "and drop copies that no longer belong there.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not settings.SHOPS_GEO_PARTITIONS:
+            raise CommandError("SHOPS_GEO_PARTITIONS is not configured.")
+        batch_size = options['batch_size']
+        aliases = {db.partition_alias(prefix) for prefix in settings.SHOPS_GEO_PARTITIONS}
+        colls = {alias: partitions.collection(alias) for alias in aliases}
+        for coll in colls.values():
+            partitions.ensure_indexes(coll)
+
+        ops = {alias: [] for alias in aliases}
+        owner, copied = {}, 0
+
+        def flush(alias, force=False):
+            nonlocal copied
+            if ops[alias] and (force or len(ops[alias]) >= batch_size):
+                result = colls[alias].bulk_write(ops[alias], ordered=False)
+                copied += result.upserted_count + result.modified_count
+                ops[alias] = []
+
+        for row in Shop._get_collection().find({}):
+            # derived fields are recomputed so regional copies never lag a backfill
+            row['business_type_key'] = business_type_key(row.get('business_type'))
+            row.update(geo_fields(row['latitude'], row['longitude']))
+            alias = partitions.partition_of(row['geo_cell'])
+            owner[row['_id']] = alias
+            if alias in ops:
+                ops[alias].append(ReplaceOne({'_id': row['_id']}, row, upsert=True))
+                flush(alias)
+        for alias in aliases:
+            flush(alias, force=True)
+
+        removed = 0
+        for alias, coll in colls.items():
+            stale = [DeleteOne({'_id': row['_id']}) for row in coll.find({}, {'_id': 1})
+                     if owner.get(row['_id']) != alias]
+            for i in range(0, len(stale), batch_size):
+                removed += coll.bulk_write(stale[i:i + batch_size], ordered=False).deleted_count
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {copied} shop(s) into {len(aliases)} partition(s); removed {removed} stale cop(ies)."))
@@ -1,14 +1,21 @@
 import mongoengine as me
 
+from .utils import business_type_key, geo_fields
+
 class Shop(me.Document):
     vendor_id = me.IntField(required=True)  # Django User.id
     name = me.StringField(required=True, max_length=255)
     owner_name = me.StringField(required=True, max_length=255)
     business_type = me.StringField(default='', max_length=100)
+    business_type_key = me.StringField(default='', max_length=100)  # lowercased business_type
     latitude = me.FloatField(required=True, min_value=-90, max_value=90)
     longitude = me.FloatField(required=True, min_value=-180, max_value=180)
+    location = me.PointField(auto_index=False)  # GeoJSON mirror of latitude/longitude
+    geo_cell = me.StringField()  # geohash of latitude/longitude; partition / shard key
+    xyz = me.ListField(me.FloatField())  # unit vector of latitude/longitude, for chord-distance ranking
     created_at = me.DateTimeField(required=True)
     updated_at = me.DateTimeField(required=True)
+    version = me.IntField(default=0)  # bumped by every update; the shop's ETag (see writes.py)
 
     meta = {
         'collection': 'shops',   # MongoDB collection name
@@ -16,6 +23,42 @@ class Shop(me.Document):
             'vendor_id',
             'business_type',
             {'fields': ['latitude', 'longitude']},
+            {'fields': ['(location']},  # 2dsphere, used by $geoNear
+            {'fields': ['geo_cell', 'latitude', 'longitude']},  # partitioned nearby
+            # keyset pagination of a vendor's list, with and without a type filter
+            {'fields': ['vendor_id', 'business_type_key', '-created_at', '-id']},
+            {'fields': ['vendor_id', '-created_at', '-id']},
+            {'fields': ['vendor_id', '-updated_at']},  # list ETags without a shared cache
         ],
         'ordering': ['-created_at'],
-    }
\ No newline at end of file
+    }
+
+    def clean(self):
+        # derived fields always follow their source fields on save()
+        self.business_type_key = business_type_key(self.business_type)
+        if self.latitude is not None and self.longitude is not None:
+            for field, value in geo_fields(self.latitude, self.longitude).items():
+                setattr(self, field, value)
+
+
+class VendorShopStats(me.Document):
+    """
+    Per-vendor shop totals, maintained with `$inc` on every write (see stats.py)
+    and rebuilt by `manage.py rebuild_vendor_shop_stats`.
+    """
+    vendor_id = me.IntField(required=True, unique=True)
+    total = me.IntField(default=0)
+    types = me.DictField()  # escaped business_type_key -> shop count
+    min_latitude = me.FloatField()
+    max_latitude = me.FloatField()
+    min_longitude = me.FloatField()
+    max_longitude = me.FloatField()
+    extent_stale = me.BooleanField(default=False)  # a shop on the extent's edge moved or went away
+    revision = me.IntField(default=0)  # bumped by every change; guards recomputes
+    built_at = me.DateTimeField()  # last full recount; unset while only increments are known
+    updated_at = me.DateTimeField()
+
+    meta = {
+        'collection': 'vendor_shop_stats',
+        'indexes': [],  # vendor_id's unique index comes from the field
+    }
@@ -0,0 +1,422 @@
+"""
+Nearby search engines behind ShopViewSet.nearby.
+
+Each engine takes (lat, lng, radius_km) and returns response-shaped dicts
+sorted by distance, each carrying distance_km. The active engine is picked
+with the SHOPS_NEARBY_ENGINE setting. Engines that talk to Mongo also offer
+`asearch`, the same query on the async driver (see async_views.py).
+With geo partitioning on, the Mongo engines only query the partitions whose
+geohash cells cover the query circle and merge their results
+(see partitions.py).
+
+All engines also take `limit` (top-k) and `after`, the (distance_km, ids)
+position of a nearby cursor (see pagination.py), and `iter_search` yields
+results nearest first as they are found, for streaming.
+"""
+import asyncio
+import heapq
+import math
+from itertools import islice
+
+from bson import ObjectId
+from django.conf import settings
+
+from . import partitions
+from .instrumentation import phase
+from .mongo_models import Shop
+from .pagination import decode_nearby_cursor
+from .renderers import json_dumps
+from .serializers import READ_FIELDS, READ_PROJECTION, row_to_dict
+from .utils import (bounding_boxes, chord_nearest_km, chord_nearest_km_many, haversine_batch_km, geo_point,
+                    geohash_cover, merge_boxes, unit_vector)
+
+# candidates also carry their unit vector for the chord-distance kernel
+NEARBY_PROJECTION = dict(READ_PROJECTION, xyz=1)
+
+# a limited bbox search scans these fractions of the radius in turn and stops
+# at the first ring that completes the page
+RING_FRACTIONS = (0.125, 0.25, 0.5, 1.0)
+
+
+def after_floor(after):
+    """Smallest unrounded distance that can still follow a cursor position."""
+    # distance_km is rounded to 3 decimals; keep a full metre of margin
+    return max(after[0] - 0.001, 0.0) if after else 0.0
+
+
+def window(results, limit=None, after=None):
+    """Results (nearest first) past the cursor position, at most `limit` of them."""
+    if after is not None:
+        distance, seen = after
+        results = [r for r in results
+                   if r['distance_km'] > distance or (r['distance_km'] == distance and r['id'] not in seen)]
+    return results if limit is None else results[:limit]
+
+
+def rings(radius_km, limit=None, after=None):
+    """(outer, inner) radii to scan; rows at or inside `inner` were already returned."""
+    floor = after_floor(after)
+    if limit is None:
+        return [(radius_km, floor)]
+    plan, inner = [], floor
+    for fraction in RING_FRACTIONS:
+        outer = radius_km * fraction
+        if outer > inner or fraction == 1.0:
+            plan.append((outer, inner))
+            inner = outer
+    return plan
+
+
+def box_filter(boxes):
+    """Mongo filter for shops inside any of the (lat_min, lat_max, lng_min, lng_max) boxes."""
+    filters = [
+        {'latitude': {'$gte': lat_min, '$lte': lat_max}, 'longitude': {'$gte': lng_min, '$lte': lng_max}}
+        for lat_min, lat_max, lng_min, lng_max in boxes
+    ]
+    return filters[0] if len(filters) == 1 else {'$or': filters}
+
+
+class BoundingBoxEngine:
+    """Bounding box prefilter in Mongo, batched distances + sort in Python."""
+
+    def query(self, lat, lng, radius_km, cells=None):
+        query = box_filter(bounding_boxes(lat, lng, radius_km))
+        if cells:
+            query = {'$and': [query, partitions.cell_filter(cells)]}
+        return query
+
+    def fetch(self, lat, lng, radius_km):
+        if not partitions.enabled():
+            return list(Shop._get_collection().find(self.query(lat, lng, radius_km), NEARBY_PROJECTION))
+        parts = partitions.fan_out(
+            geohash_cover(lat, lng, radius_km),
+            lambda coll, cells: list(coll.find(self.query(lat, lng, radius_km, cells), NEARBY_PROJECTION)),
+        )
+        return [row for rows in parts for row in rows]
+
+    def rank(self, rows, lat, lng, radius_km, min_km=None, k=None):
+        with phase('distance'):
+            if all(row.get('xyz') for row in rows):
+                top, distances = chord_nearest_km(
+                    lat, lng, [row['xyz'] for row in rows], radius_km=radius_km, k=k, min_km=min_km,
+                )
+            else:
+                # shops written before backfill_shop_geo have no xyz yet
+                all_distances, _, top = haversine_batch_km(
+                    lat, lng,
+                    [row['latitude'] for row in rows],
+                    [row['longitude'] for row in rows],
+                    radius_km=radius_km,
+                )
+                if min_km:
+                    top = [i for i in top if all_distances[i] > min_km]
+                top = top[:k] if k is not None else top
+                distances = [all_distances[i] for i in top]
+        with phase('serialize'):
+            results = []
+            for i, distance in zip(top, distances):
+                row = rows[i]
+                row['distance_km'] = round(float(distance), 3)
+                results.append(row_to_dict(row, include_distance=True))
+        return results
+
+    def _ring(self, rows, lat, lng, outer, inner, remaining, after):
+        # bounded top-k selection unless cursor ties have to be filtered first
+        k = remaining if after is None else None
+        return window(self.rank(rows, lat, lng, outer, min_km=inner, k=k), remaining, after)
+
+    def iter_search(self, lat, lng, radius_km, limit=None, after=None):
+        remaining = limit
+        for outer, inner in rings(radius_km, limit, after):
+            with phase('fetch'):
+                rows = self.fetch(lat, lng, outer)
+            batch = self._ring(rows, lat, lng, outer, inner, remaining, after)
+            yield from batch
+            if remaining is not None:
+                remaining -= len(batch)
+                if remaining <= 0:
+                    return
+
+    def search(self, lat, lng, radius_km, limit=None, after=None):
+        return list(self.iter_search(lat, lng, radius_km, limit, after))
+
+    async def asearch(self, lat, lng, radius_km, limit=None, after=None):
+        from .async_db import get_async_collection
+        if settings.SHOPS_GEO_PARTITIONS:
+            # regional instances are only reachable through the sync clients
+            return await asyncio.to_thread(self.search, lat, lng, radius_km, limit, after)
+        results, remaining = [], limit
+        for outer, inner in rings(radius_km, limit, after):
+            cells = geohash_cover(lat, lng, outer) if partitions.enabled() else None
+            cursor = get_async_collection().find(self.query(lat, lng, outer, cells), NEARBY_PROJECTION)
+            batch = self._ring(await cursor.to_list(None), lat, lng, outer, inner, remaining, after)
+            results.extend(batch)
+            if remaining is not None:
+                remaining -= len(batch)
+                if remaining <= 0:
+                    break
+        return results
+
+
+class GeoNearEngine:
+    """
+    Server-side search on the 2dsphere `location` index: distance, radius cut,
+    sort and limit all happen inside a single $geoNear aggregation.
+    Requires `location` to be populated (manage.py backfill_shop_geo).
+    """
+
+    def pipeline(self, lat, lng, radius_km, limit=None, cells=None, after=None):
+        geo_near = {
+            'near': geo_point(lat, lng),
+            'key': 'location',
+            'spherical': True,
+            'maxDistance': radius_km * 1000.0,  # metres
+            'distanceField': 'distance_km',
+            'distanceMultiplier': 0.001,        # metres -> km
+        }
+        if cells:
+            geo_near['query'] = partitions.cell_filter(cells)
+        if after is not None:
+            geo_near['minDistance'] = after_floor(after) * 1000.0
+        pipeline = [
+            {'$geoNear': geo_near},
+            {'$project': dict(READ_PROJECTION, distance_km={'$round': ['$distance_km', 3]})},
+        ]
+        if after is not None:
+            distance, seen = after
+            pipeline.append({'$match': {'$or': [
+                {'distance_km': {'$gt': distance}},
+                {'distance_km': distance, '_id': {'$nin': [ObjectId(i) for i in seen]}},
+            ]}})
+        if limit:
+            pipeline.append({'$limit': int(limit)})
+        return pipeline
+
+    def iter_search(self, lat, lng, radius_km, limit=None, after=None):
+        with phase('fetch'):
+            rows = self.fetch(lat, lng, radius_km, limit, after)
+        for row in rows:
+            yield row_to_dict(row, include_distance=True)
+
+    def search(self, lat, lng, radius_km, limit=None, after=None):
+        with phase('fetch'):
+            rows = list(self.fetch(lat, lng, radius_km, limit, after))
+        with phase('serialize'):
+            return [row_to_dict(row, include_distance=True) for row in rows]
+
+    def fetch(self, lat, lng, radius_km, limit=None, after=None):
+        """Rows nearest first; a plain aggregation cursor when unpartitioned."""
+        if not partitions.enabled():
+            return Shop._get_collection().aggregate(self.pipeline(lat, lng, radius_km, limit, after=after))
+        parts = partitions.fan_out(
+            geohash_cover(lat, lng, radius_km),
+            lambda coll, cells: list(coll.aggregate(self.pipeline(lat, lng, radius_km, limit, cells, after))),
+        )
+        # every partition answers nearest first
+        return list(islice(heapq.merge(*parts, key=lambda row: row['distance_km']), limit))
+
+    async def asearch(self, lat, lng, radius_km, limit=None, after=None):
+        from .async_db import get_async_collection
+        if settings.SHOPS_GEO_PARTITIONS:
+            return await asyncio.to_thread(self.search, lat, lng, radius_km, limit, after)
+        cells = geohash_cover(lat, lng, radius_km) if partitions.enabled() else None
+        cursor = await get_async_collection().aggregate(self.pipeline(lat, lng, radius_km, limit, cells, after))
+        return [row_to_dict(row, include_distance=True) async for row in cursor]
+
+
+class GridIndexEngine:
+    """Answers from the in-process grid index (see geo_index.py)."""
+
+    def search(self, lat, lng, radius_km, limit=None, after=None):
+        from .geo_index import get_index
+        index = get_index()
+        with phase('index_sync'):
+            index.ensure_fresh()
+        with phase('index_search'):
+            return index.search(lat, lng, radius_km, limit, after)
+
+    def iter_search(self, lat, lng, radius_km, limit=None, after=None):
+        return iter(self.search(lat, lng, radius_km, limit, after))
+
+
+ENGINES = {
+    'bbox': BoundingBoxEngine,
+    'geonear': GeoNearEngine,
+    'grid': GridIndexEngine,
+}
+
+
+def get_engine():
+    name = getattr(settings, 'SHOPS_NEARBY_ENGINE', 'bbox')
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown SHOPS_NEARBY_ENGINE {name!r}; expected one of {sorted(ENGINES)}")
+
+
+class TooManyCandidates(ValueError):
+    pass
+
+
+def search_many(engine, points, limit=None, max_candidates=None):
+    """
+    Nearby results for many (lat, lng, radius_km) points, one list per point.
+
+    The Mongo path merges the points' bounding boxes into a few covering
+    rectangles and fetches them in a single $or query, so each candidate
+    shop comes back once. Every point is then ranked against all the
+    candidates in one batched chord-distance pass. The grid engine already
+    answers from memory and is just asked once per point.
+
+    Raises TooManyCandidates when the boxes hold more than `max_candidates`
+    shops; at most that many + 1 are read to find out.
+    """
+    if isinstance(engine, GridIndexEngine):
+        return [engine.search(lat, lng, radius_km, limit) for lat, lng, radius_km in points]
+
+    boxes = merge_boxes([box for lat, lng, radius_km in points for box in bounding_boxes(lat, lng, radius_km)])
+    covering = box_filter(boxes)
+    cap = max_candidates + 1 if max_candidates else 0  # 0: no limit
+    with phase('fetch'):
+        if not partitions.enabled():
+            rows = list(Shop._get_collection().find(covering, NEARBY_PROJECTION).limit(cap))
+        else:
+            cells = sorted({c for lat, lng, radius_km in points for c in geohash_cover(lat, lng, radius_km)})
+            parts = partitions.fan_out(cells, lambda coll, cells: list(
+                coll.find({'$and': [covering, partitions.cell_filter(cells)]}, NEARBY_PROJECTION).limit(cap)))
+            rows = list({row['_id']: row for rows in parts for row in rows}.values())
+    if max_candidates and len(rows) > max_candidates:
+        raise TooManyCandidates(f'Too many shops under these points (more than {max_candidates}); '
+                                'use smaller radii or fewer points.')
+
+    with phase('distance'):
+        # shops written before backfill_shop_geo get their unit vector here
+        xyz = [row.get('xyz') or unit_vector(row['latitude'], row['longitude']) for row in rows]
+        ranked = chord_nearest_km_many(
+            [(lat, lng) for lat, lng, _ in points], xyz, [radius_km for _, _, radius_km in points], k=limit,
+        )
+    with phase('serialize'):
+        shops = {}
+        results = []
+        for top, distances in ranked:
+            found = []
+            for i, distance in zip(top, distances):
+                i = int(i)
+                if i not in shops:
+                    shops[i] = row_to_dict(rows[i])
+                found.append(dict(shops[i], distance_km=round(float(distance), 3)))
+            results.append(found)
+    return results
+
+
+# -- request parameters (shared by the sync and async views) ------------------
+
+NEARBY_FIELDS = ('id',) + READ_FIELDS + ('distance_km',)
+
+
+def parse_limit(limit):
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 1 <= limit <= settings.SHOPS_NEARBY_MAX_LIMIT:
+        raise ValueError(f'limit must be an integer between 1 and {settings.SHOPS_NEARBY_MAX_LIMIT}.')
+    return limit
+
+
+def parse_fields(fields):
+    """?fields=a,b (or a list) as a tuple of known response fields; None for all."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    fields = tuple(str(f).strip() for f in fields if str(f).strip())
+    unknown = sorted(set(fields) - set(NEARBY_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return fields or None
+
+
+def nearby_params(params):
+    """
+    Validated ?lat=&lng=&radius=&limit=&cursor=&fields=&output= as a dict.
+    Raises ValueError (or pagination.InvalidCursor) with the 400 message.
+    """
+    try:
+        lat = float(params.get('lat'))
+        lng = float(params.get('lng'))
+    except (TypeError, ValueError):
+        raise ValueError('lat and lng are required float query params.')
+    # float() also takes 'nan' and 'inf'
+    if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('lat must be within [-90, 90] and lng within [-180, 180].')
+    try:
+        radius_km = float(params.get('radius', 5))
+    except (TypeError, ValueError):
+        raise ValueError('radius must be a float.')
+    max_radius = settings.SHOPS_NEARBY_MAX_RADIUS_KM
+    if not (math.isfinite(radius_km) and 0 < radius_km <= max_radius):
+        raise ValueError(f'radius must be greater than 0 and at most {max_radius:g} km.')
+
+    limit = parse_limit(params.get('limit'))
+    cursor = params.get('cursor')
+    after = decode_nearby_cursor(cursor, (lat, lng, radius_km)) if cursor else None
+    fields = parse_fields(params.get('fields'))
+
+    output = params.get('output', 'json')
+    if output not in ('json', 'ndjson'):
+        raise ValueError('output must be json or ndjson.')
+
+    return {
+        'lat': lat, 'lng': lng, 'radius_km': radius_km,
+        'limit': limit, 'after': after, 'paged': limit is not None or after is not None,
+        'fields': fields, 'output': output,
+    }
+
+
+def nearby_batch_params(data):
+    """
+    Validated body of a batch nearby request:
+    {"points": [{"lat": .., "lng": .., "radius": ..}, ...], "radius": .., "limit": .., "fields": ..}
+    where `radius` (default 5) applies to points without their own.
+    Raises ValueError with the 400 message.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('points'), list) or not data['points']:
+        raise ValueError('points must be a non-empty list of {lat, lng, radius} objects.')
+    max_points = settings.SHOPS_NEARBY_BATCH_MAX_POINTS
+    if len(data['points']) > max_points:
+        raise ValueError(f'At most {max_points} points per request.')
+    limit, fields = parse_limit(data.get('limit')), parse_fields(data.get('fields'))
+    radius = data.get('radius', 5)
+
+    points = []
+    for n, point in enumerate(data['points']):
+        if not isinstance(point, dict):
+            raise ValueError(f'points[{n}]: expected an object with lat, lng and radius.')
+        try:
+            params = nearby_params({'lat': point.get('lat'), 'lng': point.get('lng'),
+                                    'radius': point.get('radius', radius)})
+        except ValueError as e:
+            raise ValueError(f'points[{n}]: {e}')
+        points.append((params['lat'], params['lng'], params['radius_km']))
+    max_area = settings.SHOPS_NEARBY_BATCH_MAX_AREA_KM2
+    if sum(math.pi * radius_km ** 2 for _, _, radius_km in points) > max_area:
+        raise ValueError(f'The circles of one request may cover at most {max_area:g} km² in total; '
+                         'use smaller radii or fewer points.')
+    return {'points': points, 'limit': limit, 'fields': fields}
+
+
+def select_fields(results, fields):
+    if not fields:
+        return results
+    return [{f: shop[f] for f in fields} for shop in results]
+
+
+def ndjson_lines(results, fields=None):
+    """One JSON document per shop; consumed lazily so rings stream as they are found."""
+    for shop in results:
+        if fields:
+            shop = {f: shop[f] for f in fields}
+        yield json_dumps(shop) + b'\n'
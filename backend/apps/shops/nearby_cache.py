@@ -0,0 +1,124 @@
+"""
+Response cache in front of the nearby engines.
+
+Map clients pan around, so nearly identical queries arrive with slightly
+different coordinates. Queries are snapped to a SHOPS_NEARBY_CACHE_GRID_DEG
+grid and the radius rounded up to a SHOPS_NEARBY_CACHE_RADIUS_STEP bucket;
+the candidate set for the snapped centre (radius widened by the snapping
+error) is cached, and exact distances for the real point are recomputed on it.
+
+Invalidation is per geo-cell: every coarse SHOPS_NEARBY_CACHE_CELL_DEG cell
+has a version token in the cache, entries are keyed by the versions of the
+cells they cover, and a shop write bumps the version of its cell(s).
+With a process-local backend other workers only see a write once their
+entries expire (SHOPS_NEARBY_CACHE_TTL); use a shared backend to avoid that.
+"""
+import hashlib
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .nearby import window
+from .utils import bounding_boxes, haversine_batch_km
+
+KM_PER_DEG = 111.32
+MAX_CELLS = 64          # larger queries bypass the cache
+MAX_CANDIDATES = 5000   # larger candidate sets are not cached
+
+
+def _cache():
+    return caches[settings.SHOPS_NEARBY_CACHE_ALIAS]
+
+
+def _cell(lat, lng):
+    size = settings.SHOPS_NEARBY_CACHE_CELL_DEG
+    return (math.floor(lat / size), math.floor(lng / size))
+
+
+def _version_key(cell):
+    return f"shops:nearby:v:{cell[0]}:{cell[1]}"
+
+
+def _covered_cells(lat, lng, radius_km):
+    ranges = []
+    for lat_min, lat_max, lng_min, lng_max in bounding_boxes(lat, lng, radius_km):
+        (i_min, j_min), (i_max, j_max) = _cell(lat_min, lng_min), _cell(lat_max, lng_max)
+        ranges.append((i_min, i_max, j_min, j_max))
+    if sum((i_max - i_min + 1) * (j_max - j_min + 1) for i_min, i_max, j_min, j_max in ranges) > MAX_CELLS:
+        return None
+    return sorted({(i, j) for i_min, i_max, j_min, j_max in ranges
+                   for i in range(i_min, i_max + 1) for j in range(j_min, j_max + 1)})
+
+
+def _versions(cache, cells):
+    keys = [_version_key(c) for c in cells]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # fresh random token, so an evicted version never revives old entries
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+    return [found[k] for k in keys]
+
+
+def quantize(lat, lng, radius_km):
+    """Snapped centre and the (widened) candidate radius cached for a query."""
+    grid = settings.SHOPS_NEARBY_CACHE_GRID_DEG
+    step = settings.SHOPS_NEARBY_CACHE_RADIUS_STEP
+    c_lat = (math.floor(lat / grid) + 0.5) * grid
+    c_lng = (math.floor(lng / grid) + 0.5) * grid
+    bucket = max(math.ceil(radius_km / step), 1) * step
+    # worst-case distance between a point and its cell centre
+    margin = (grid / 2) * KM_PER_DEG * math.sqrt(2)
+    return round(c_lat, 9), round(c_lng, 9), bucket, bucket + margin
+
+
+def cached_search(engine, lat, lng, radius_km, limit=None, after=None):
+    """engine.search(lat, lng, radius_km, limit, after), served from the cache when possible."""
+    c_lat, c_lng, bucket, candidate_radius = quantize(lat, lng, radius_km)
+    cells = _covered_cells(c_lat, c_lng, candidate_radius)
+    if cells is None:
+        return engine.search(lat, lng, radius_km, limit, after)
+
+    cache = _cache()
+    versions = _versions(cache, cells)
+    raw = f"{type(engine).__name__}|{c_lat}|{c_lng}|{bucket}|{','.join(versions)}"
+    key = 'shops:nearby:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    candidates = cache.get(key)
+    if candidates is None:
+        candidates = engine.search(c_lat, c_lng, candidate_radius)
+        for shop in candidates:
+            shop.pop('distance_km', None)
+        if len(candidates) <= MAX_CANDIDATES:
+            cache.set(key, candidates, settings.SHOPS_NEARBY_CACHE_TTL)
+
+    distances, _, top = haversine_batch_km(
+        lat, lng,
+        [s['latitude'] for s in candidates],
+        [s['longitude'] for s in candidates],
+        radius_km=radius_km,
+        k=limit if after is None else None,
+    )
+    results = [dict(candidates[i], distance_km=round(float(distances[i]), 3)) for i in top]
+    return window(results, limit, after)
+
+
+def invalidate(lat, lng):
+    _cache().set(_version_key(_cell(lat, lng)), uuid.uuid4().hex, None)
+
+
+def on_shop_saved(sender, shop, previous=None, **kwargs):
+    if not settings.SHOPS_NEARBY_CACHE:
+        return
+    invalidate(shop['latitude'], shop['longitude'])
+    if previous is not None and _cell(previous['latitude'], previous['longitude']) != \
+            _cell(shop['latitude'], shop['longitude']):
+        invalidate(previous['latitude'], previous['longitude'])
+
+
+def on_shop_deleted(sender, shop, **kwargs):
+    if settings.SHOPS_NEARBY_CACHE:
+        invalidate(shop['latitude'], shop['longitude'])
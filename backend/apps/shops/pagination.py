@@ -0,0 +1,144 @@
+"""
+Keyset (cursor) pagination for the vendor shop list and nearby results.
+
+Pages are ordered by (-created_at, -_id) and a cursor pins the boundary row,
+so fetching any page is a bounded index range scan instead of skip/limit.
+Cursors are opaque base64 tokens carrying that boundary and a direction.
+"""
+import base64
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+NEXT, PREVIOUS = 'n', 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _ms(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _pack(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _unpack(token):
+    return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+
+
+def encode_cursor(row, direction):
+    return _pack({'t': _ms(row['created_at']), 'id': str(row['id']), 'd': direction})
+
+
+def decode_cursor(token):
+    try:
+        payload = _unpack(token)
+        created_at = datetime.fromtimestamp(payload['t'] / 1000, tz=timezone.utc).replace(tzinfo=None)
+        oid = ObjectId(payload['id'])
+        direction = payload['d']
+    except (ValueError, TypeError, KeyError, InvalidId):
+        raise InvalidCursor('Invalid cursor.')
+    if direction not in (NEXT, PREVIOUS):
+        raise InvalidCursor('Invalid cursor.')
+    return created_at, oid, direction
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def page_params(params):
+    """
+    (page, page_size) from the query string: page_size clamped to
+    1..SHOPS_LIST_MAX_PAGE_SIZE (20 when absent or not a number), page to 1+.
+    """
+    page_size = min(max(_int(params.get('page_size') or 20, 20), 1), settings.SHOPS_LIST_MAX_PAGE_SIZE)
+    return max(_int(params.get('page') or 1, 1), 1), page_size
+
+
+NEWEST_FIRST = [('created_at', -1), ('_id', -1)]
+OLDEST_FIRST = [('created_at', 1), ('_id', 1)]
+
+
+def keyset_query(token):
+    """
+    (boundary filter, sort, direction) for the page after/before `token`;
+    direction is None for the first page. Fetch page_size + 1 rows with these
+    and hand them to split_page.
+    """
+    if not token:
+        return {}, NEWEST_FIRST, None
+    created_at, oid, direction = decode_cursor(token)
+    op = '$lt' if direction == NEXT else '$gt'
+    boundary = {'$or': [
+        {'created_at': {op: created_at}},
+        {'created_at': created_at, '_id': {op: oid}},
+    ]}
+    return boundary, (NEWEST_FIRST if direction == NEXT else OLDEST_FIRST), direction
+
+
+def split_page(rows, page_size, direction):
+    """Returns (rows, has_next, has_previous) from a page_size + 1 fetch."""
+    more = len(rows) > page_size
+    if direction is None:
+        return rows[:page_size], more, False
+    if direction == NEXT:
+        return rows[:page_size], more, bool(rows)
+    return rows[:page_size][::-1], bool(rows), more
+
+
+def page_links(request, items, has_next, has_previous):
+    url = remove_query_param(request.build_absolute_uri(), 'page')
+    next_url = previous_url = None
+    if items and has_next:
+        next_url = replace_query_param(url, 'cursor', encode_cursor(items[-1], NEXT))
+    if items and has_previous:
+        previous_url = replace_query_param(url, 'cursor', encode_cursor(items[0], PREVIOUS))
+    return next_url, previous_url
+
+
+
+# -- nearby ------------------------------------------------------------------
+# Nearby results are ordered by distance_km (as returned, rounded to metres).
+# A cursor pins the last distance of a page plus the ids already returned at
+# exactly that distance, so ties are neither repeated nor skipped.
+
+def encode_nearby_cursor(query, items, after=None):
+    distance = items[-1]['distance_km']
+    seen = [item['id'] for item in items if item['distance_km'] == distance]
+    if after is not None and after[0] == distance:
+        seen = sorted(after[1]) + seen
+    return _pack({'q': list(query), 'd': distance, 'ids': seen})
+
+
+def decode_nearby_cursor(token, query):
+    """`after` = (distance_km, ids) for a cursor issued for `query` (lat, lng, radius)."""
+    try:
+        payload = _unpack(token)
+        distance, seen = float(payload['d']), set(payload['ids'])
+        same_query = [float(v) for v in payload['q']] == [float(v) for v in query]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid cursor.')
+    if not same_query:
+        raise InvalidCursor('Cursor does not match this query.')
+    return distance, seen
+
+
+def nearby_links(request, query, items, has_next, after=None):
+    if not (items and has_next):
+        return None
+    url = request.build_absolute_uri()
+    return replace_query_param(url, 'cursor', encode_nearby_cursor(query, items, after))
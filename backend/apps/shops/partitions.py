@@ -0,0 +1,134 @@
+"""
+Geo partitioning of the shops collection.
+
+Every shop stores `geo_cell`, the geohash of its position (utils.geo_fields).
+It is the partition key:
+
+* Sharded cluster: shard on {geo_cell: 1, _id: 1} (zones can pin geohash
+  prefixes to regional shards) and set SHOPS_GEO_PARTITIONING. Nearby
+  queries then carry a geo_cell constraint for the cells covering the query
+  circle, so mongos only targets the shards that own them.
+* Per-region instances: SHOPS_GEO_PARTITIONS maps geohash prefixes to MongoDB
+  URIs, e.g. {"t": "mongodb://asia/shops", "u": "mongodb://eu/shops"}. The
+  default connection stays the system of record; each region holds a copy of
+  its shops, kept up to date from the shop signals (and
+  `manage.py sync_shop_partitions`). Nearby searches query the regions that
+  overlap the covering cells, in parallel, and merge the results. Cells no
+  prefix claims are read from the default connection, with any part of a
+  coarse cell that a longer prefix claims left out, so no shop is read twice.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import mongoengine as me
+from bson import ObjectId
+from django.conf import settings
+
+from . import db
+from .mongo_models import Shop
+from .utils import GEOHASH_ALPHABET, GEOHASH_PRECISION, business_type_key, geo_fields, geohash
+
+SHOP_FIELDS = ('vendor_id', 'name', 'owner_name', 'business_type', 'latitude', 'longitude',
+               'created_at', 'updated_at')
+
+
+def enabled():
+    return settings.SHOPS_GEO_PARTITIONING or bool(settings.SHOPS_GEO_PARTITIONS)
+
+
+def collection(alias):
+    if alias == db.ALIAS:
+        return Shop._get_collection()
+    return me.get_db(alias)[Shop._get_collection_name()]
+
+
+def ensure_indexes(coll):
+    """Indexes a regional copy needs to serve nearby searches."""
+    coll.create_index([('geo_cell', 1), ('latitude', 1), ('longitude', 1)])
+    coll.create_index([('location', '2dsphere')])
+
+
+def partition_of(cell):
+    """Connection alias owning a stored geo_cell: longest matching prefix, else the default."""
+    best = ''
+    for prefix in settings.SHOPS_GEO_PARTITIONS:
+        if cell.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return db.partition_alias(best) if best else db.ALIAS
+
+
+def _without(cell, claimed):
+    """Cells covering `cell` except the `claimed` prefixes under it."""
+    inside = [prefix for prefix in claimed if prefix.startswith(cell)]
+    if not inside:
+        return [cell]
+    if cell in inside:
+        return []
+    return [part for char in GEOHASH_ALPHABET for part in _without(cell + char, inside)]
+
+
+def route(cells):
+    """alias -> the covering cells it has to be queried for; every shop is in exactly one."""
+    targets = {}
+    for cell in cells:
+        owner = partition_of(cell)
+        # a longer prefix can claim part of a coarse covering cell
+        longer = [prefix for prefix in settings.SHOPS_GEO_PARTITIONS
+                  if len(prefix) > len(cell) and prefix.startswith(cell)]
+        for prefix in longer:
+            targets.setdefault(db.partition_alias(prefix), []).append(cell)
+        # a regional copy only holds its own shops, but the default connection
+        # holds them all: query it for the rest of the cell only
+        own = _without(cell, longer) if owner == db.ALIAS else [cell]
+        if own:
+            targets.setdefault(owner, []).extend(own)
+    return targets
+
+
+def cell_filter(cells):
+    if all(len(cell) == GEOHASH_PRECISION for cell in cells):
+        return {'geo_cell': {'$in': list(cells)}}
+    # coarser covering cells match every stored cell under them ('~' sorts after 'z')
+    return {'$or': [{'geo_cell': {'$gte': cell, '$lt': cell + '~'}} for cell in cells]}
+
+
+def fan_out(cells, fetch):
+    """Call fetch(collection, cells) on every partition the cells touch; one result per partition."""
+    if not settings.SHOPS_GEO_PARTITIONS:
+        return [fetch(collection(db.ALIAS), cells)]
+    jobs = [(collection(alias), part) for alias, part in route(cells).items()]
+    if len(jobs) == 1:
+        return [fetch(*jobs[0])]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        return list(pool.map(lambda job: fetch(*job), jobs))
+
+
+def partition_doc(shop):
+    """Stored document for a response-shaped shop dict."""
+    doc = {field: shop[field] for field in SHOP_FIELDS}
+    doc['_id'] = ObjectId(shop['id'])
+    doc['business_type_key'] = business_type_key(shop['business_type'])
+    doc.update(geo_fields(shop['latitude'], shop['longitude']))
+    return doc
+
+
+# -- signal receivers (connected in ShopsConfig.ready) ------------------------
+
+def on_shop_saved(sender, shop, previous=None, **kwargs):
+    if not settings.SHOPS_GEO_PARTITIONS:
+        return
+    doc = partition_doc(shop)
+    alias = partition_of(doc['geo_cell'])
+    if alias != db.ALIAS:
+        collection(alias).replace_one({'_id': doc['_id']}, doc, upsert=True)
+    if previous is not None:
+        old = partition_of(geohash(previous['latitude'], previous['longitude']))
+        if old not in (alias, db.ALIAS):
+            collection(old).delete_one({'_id': doc['_id']})
+
+
+def on_shop_deleted(sender, shop, **kwargs):
+    if not settings.SHOPS_GEO_PARTITIONS:
+        return
+    alias = partition_of(geohash(shop['latitude'], shop['longitude']))
+    if alias != db.ALIAS:
+        collection(alias).delete_one({'_id': ObjectId(shop['id'])})
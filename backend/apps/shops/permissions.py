@@ -1,7 +1,29 @@
+import hmac
+import ipaddress
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
+
+def ops_allowed(request):
+    """
+    True for operators: a request carrying `Authorization: Bearer <OPS_TOKEN>`
+    or coming from an address in OPS_ALLOWED_IPS (addresses or networks).
+    """
+    token = settings.OPS_TOKEN
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+    try:
+        addr = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(addr in ipaddress.ip_network(net, strict=False) for net in settings.OPS_ALLOWED_IPS)
+
+
 class IsOwner(BasePermission):
     message = 'You do not have permission to access this shop.'
 
     def has_object_permission(self, request, view, obj):
-        return getattr(obj, 'vendor_id', None) == request.user.id
\ No newline at end of file
+        return getattr(obj, 'vendor_id', None) == request.user.id
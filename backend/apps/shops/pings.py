@@ -0,0 +1,272 @@
+"""
+Coalesced location pings (POST /api/shops/{id}/location/).
+
+Mobile shops report their position every few seconds. A ping only records
+the latest (latitude, longitude) per shop in this process's buffer; a
+background thread flushes the buffer every SHOPS_PING_FLUSH_SECONDS. A
+flush costs one find of the pending shops' current rows, one unordered
+bulk_write of `$set` updates and one bulk_write of the vendors' shop stats
+(see stats.batched), however many pings came in.
+
+A ping is only accepted for a shop the vendor owns (404 / 403 otherwise).
+Owners are looked up once per shop and remembered by the buffer, so steady
+pings from a shop cost no round trip. Each update is still filtered on
+{_id, vendor_id, version}: a shop edited between the find and the write
+keeps that edit, and one deleted after its ping was accepted is counted as
+`dropped`. Pings older than the shop's last write are
+dropped; the next ping catches up. Every applied update sends shop_saved
+with the before/after rows, so the grid index, nearby cache, partitions,
+counts and list versions follow along exactly as for a PATCH.
+
+Memory is bounded by SHOPS_PING_MAX_PENDING shops. When the buffer is full,
+the request that needs a new slot flushes it inline, which is the
+backpressure. If that flush fails, the ping is refused and the view answers
+503. The buffer is flushed at interpreter exit; gunicorn workers exit
+through it on SIGTERM.
+
+Where the process may be frozen or reclaimed between requests (the
+serverless handler, API_ONLY), SHOPS_PING_WRITE_THROUGH writes each ping
+before responding instead: 204 once written, nothing is left buffered.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from pymongo import UpdateOne
+
+from . import stats
+from .mongo_models import Shop
+from .serializers import row_to_dict
+from .signals import shop_saved
+from .utils import geo_fields
+from .writes import FORBIDDEN, NOT_FOUND, WRITE_PROJECTION, object_id
+
+logger = logging.getLogger(__name__)
+
+OWNERS_MAX = 100000  # remembered shop owners per process
+ACCEPTED, WRITTEN, UNAVAILABLE, CONFLICT = 202, 204, 503, 409
+
+
+def _now():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # naive UTC, as rows come back
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+class PingBuffer:
+    def __init__(self, max_pending=10000, flush_seconds=2.0, batch_size=1000):
+        self.max_pending = max_pending
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._pending = {}  # shop ObjectId -> (vendor_id, latitude, longitude, received_at)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._owners = {}  # shop ObjectId -> vendor_id, for shops seen before
+        self._thread = None
+        self._pid = None
+        self.stats = {'received': 0, 'flushed': 0, 'stale': 0, 'dropped': 0, 'retried': 0, 'rejected': 0,
+                      'flush_errors': 0}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def owner_status(self, shop_id, vendor_id):
+        """None when the vendor owns the shop, else 404 or 403."""
+        owner = self._owners.get(shop_id)
+        if owner is None:
+            row = Shop._get_collection().find_one({'_id': shop_id}, {'vendor_id': 1})
+            if row is None:
+                return NOT_FOUND
+            if len(self._owners) > OWNERS_MAX:
+                self._owners.clear()
+            owner = self._owners[shop_id] = row['vendor_id']
+        return None if owner == vendor_id else FORBIDDEN
+
+    def write_now(self, shop_id, vendor_id, lat, lng):
+        """Writes one ping straight away (write-through mode); whether it landed."""
+        now = _now()
+        self.stats['received'] += 1
+        with self._flush_lock:
+            return self._write({shop_id: (vendor_id, lat, lng, now)}, now) == 1
+
+    def offer(self, shop_id, vendor_id, lat, lng):
+        """Queues a ping; False when the buffer is full and could not be flushed."""
+        self._ensure_thread()
+        with self._lock:
+            # stamped under the lock: a ping that misses a flush is never older than it
+            ping = (vendor_id, lat, lng, _now())
+            self.stats['received'] += 1
+            if shop_id in self._pending or len(self._pending) < self.max_pending:
+                self._pending[shop_id] = ping
+                return True
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Inline location flush failed')
+        with self._lock:
+            if len(self._pending) < self.max_pending:
+                self._pending[shop_id] = ping
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def flush(self):
+        """Writes every pending ping; returns the number of shops updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                flushed_at = _now()
+            if not pending:
+                return 0
+            try:
+                return self._write(pending, flushed_at)
+            except Exception:
+                self.stats['flush_errors'] += 1
+                self._requeue(pending)
+                raise
+
+    def _write(self, pending, now):
+        coll = Shop._get_collection()
+        flushed = 0
+        ids = list(pending)
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            rows = {row['_id']: row for row in coll.find({'_id': {'$in': batch}}, WRITE_PROJECTION)}
+            ops, updates = [], []
+            for shop_id in batch:
+                vendor_id, lat, lng, received_at = pending[shop_id]
+                row = rows.get(shop_id)
+                if row is None or row['vendor_id'] != vendor_id:
+                    # deleted since the ping was accepted
+                    self.stats['dropped'] += 1
+                    self._owners.pop(shop_id, None)
+                    continue
+                if row['updated_at'] > received_at:
+                    self.stats['stale'] += 1  # a newer write already landed
+                    continue
+                changes = {'latitude': lat, 'longitude': lng, **geo_fields(lat, lng), 'updated_at': now}
+                ops.append(UpdateOne(
+                    {'_id': shop_id, 'vendor_id': vendor_id, 'version': row.get('version')},
+                    {'$set': changes, '$inc': {'version': 1}},
+                ))
+                updates.append((shop_id, row, changes))
+            if not ops:
+                continue
+            result = coll.bulk_write(ops, ordered=False)
+            applied = {u[0] for u in updates}
+            if result.matched_count < len(ops):
+                # some shops were edited since the find; see which writes took
+                # (a concurrent edit bumps the version too, so compare what we wrote)
+                written = {r['_id']: r for r in coll.find({'_id': {'$in': list(applied)}},
+                                                          {'latitude': 1, 'longitude': 1, 'updated_at': 1})}
+                applied = {shop_id for shop_id, _, changes in updates
+                           if all(written.get(shop_id, {}).get(f) == changes[f]
+                                  for f in ('latitude', 'longitude', 'updated_at'))}
+                self.stats['stale'] += len(updates) - len(applied)
+            with stats.batched():
+                for shop_id, row, changes in updates:
+                    if shop_id in applied:
+                        after = dict(row, **{f: v for f, v in changes.items() if f in WRITE_PROJECTION})
+                        shop_saved.send(sender=Shop, shop=row_to_dict(after), previous=row_to_dict(row))
+                        flushed += 1
+        self.stats['flushed'] += flushed
+        return flushed
+
+    def _requeue(self, pings):
+        # after a failed flush; newer pings that arrived meanwhile win
+        with self._lock:
+            for shop_id, ping in pings.items():
+                if shop_id not in self._pending and len(self._pending) < self.max_pending:
+                    self._pending[shop_id] = ping
+                    self.stats['retried'] += 1
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='shops-ping-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Location flush failed; pings kept for the next one')
+
+    def snapshot(self):
+        return dict(self.stats, pending=len(self._pending), max_pending=self.max_pending)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = PingBuffer(
+                    max_pending=settings.SHOPS_PING_MAX_PENDING,
+                    flush_seconds=settings.SHOPS_PING_FLUSH_SECONDS,
+                    batch_size=settings.SHOPS_PING_BATCH_SIZE,
+                )
+    return _buffer
+
+
+def flush_on_exit():
+    if _buffer is not None and _buffer._pid == os.getpid():
+        try:
+            _buffer.flush()
+        except Exception:
+            logger.exception('Location flush at exit failed; %d pings lost', len(_buffer))
+
+
+def _after_fork_in_child():
+    # the parent's pings are the parent's to flush
+    global _buffer
+    _buffer = None
+
+
+atexit.register(flush_on_exit)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def parse_ping(data):
+    """(latitude, longitude) from a ping body; ValueError with the 400 message."""
+    try:
+        lat, lng = float(data['latitude']), float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('latitude and longitude are required floats.')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('latitude must be within [-90, 90] and longitude within [-180, 180].')
+    return lat, lng
+
+
+def queue_ping(pk, vendor_id, data):
+    """
+    Validates and records one ping. Returns the response status: 202
+    (buffered), 204 (written through), 404 / 403 (not the vendor's shop),
+    409 (not written: a concurrent edit or delete won; write-through only)
+    or 503 (buffer full).
+    Raises ValueError with the 400 message.
+    """
+    lat, lng = parse_ping(data)
+    shop_id = object_id(pk)
+    if shop_id is None:
+        return NOT_FOUND
+    buffer = get_buffer()
+    code = buffer.owner_status(shop_id, vendor_id)
+    if code is not None:
+        return code
+    if settings.SHOPS_PING_WRITE_THROUGH:
+        return WRITTEN if buffer.write_now(shop_id, vendor_id, lat, lng) else CONFLICT
+    return ACCEPTED if buffer.offer(shop_id, vendor_id, lat, lng) else UNAVAILABLE
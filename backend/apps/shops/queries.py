@@ -0,0 +1,67 @@
+"""
+Raw Mongo queries shared by the sync (MongoEngine) and async (PyMongo) views.
+"""
+from django.conf import settings
+
+from .serializers import READ_PROJECTION
+from .utils import business_type_key
+
+
+def business_type_keys(values):
+    """
+    Normalized business types from ?business_type= (repeatable and/or
+    comma-separated), de-duplicated and in a stable order.
+    """
+    keys = set()
+    for value in values:
+        for part in (value or '').split(','):
+            key = business_type_key(part)
+            if key:
+                keys.add(key)
+    return sorted(keys)
+
+
+def shop_list_filter(vendor_id, business_types=None):
+    query = {'vendor_id': vendor_id}
+    if business_types:
+        # exact matches on the normalized field; served by the compound list index
+        if len(business_types) == 1:
+            query['business_type_key'] = business_types[0]
+        else:
+            query['business_type_key'] = {'$in': list(business_types)}
+    return query
+
+
+def page_pipeline(query, sort, boundary=None, skip=0, limit=20):
+    """
+    One round trip for a list page and its total: the vendor filter and sort
+    run first (index-backed), then $facet splits the stream into the page
+    and a $count of everything matched.
+    """
+    results = []
+    if boundary:
+        results.append({'$match': boundary})
+    if skip:
+        results.append({'$skip': skip})
+    results.append({'$limit': limit})
+    return [
+        {'$match': query},
+        {'$sort': dict(sort)},
+        {'$project': READ_PROJECTION},
+        {'$facet': {'results': results, 'total': [{'$count': 'n'}]}},
+    ]
+
+
+def unpack_page(facet):
+    """(rows, total) from the single document page_pipeline returns."""
+    total = facet['total'][0]['n'] if facet['total'] else 0
+    return facet['results'], total
+
+
+def fetch_page(coll, query, sort, boundary=None, skip=0, limit=20, with_count=False):
+    """Returns (rows, total); total is None unless with_count."""
+    if with_count and settings.SHOPS_LIST_ENGINE == 'facet':
+        return unpack_page(next(coll.aggregate(page_pipeline(query, sort, boundary, skip, limit))))
+    total = coll.count_documents(query) if with_count else None
+    cursor = coll.find({**query, **(boundary or {})}, READ_PROJECTION).sort(sort).skip(skip).limit(limit)
+    return list(cursor), total
@@ -0,0 +1,240 @@
+"""
+Shared sliding-window rate limiting.
+
+Counters live in a store every worker process sees, so a quota holds across
+gunicorn workers and restarts:
+
+  sqlite:///path/file.db   one SQLite file (WAL) per host, the default
+  redis://host:6379/0      any Redis-compatible server (`pip install redis`)
+  memory://                per process; tests and single-worker dev only
+
+Each (scope, client) pair counts hits in fixed windows of the quota's period
+and the limit is checked against a sliding estimate:
+previous window * (1 - elapsed fraction) + current window. A store increment
+is a single atomic statement (SQLite UPSERT ... RETURNING, Redis INCRBY), and
+workers batch their hits locally, syncing every SHOPS_RATE_LIMIT_SYNC_HITS hits
+or SHOPS_RATE_LIMIT_SYNC_SECONDS, or on every hit once a client is near its
+quota, so most requests don't wait on the store at all.
+
+Quotas are per scope (SHOPS_RATE_LIMITS, e.g. {"shops.nearby": "30/m"}) with
+per-vendor overrides (SHOPS_RATE_LIMIT_VENDORS, {"<vendor id>": {scope: rate}}).
+Authenticated requests are counted per vendor, anonymous ones per client IP:
+REMOTE_ADDR, or the address REST_FRAMEWORK['NUM_PROXIES'] trusted proxies put
+in X-Forwarded-For. The header itself is never trusted beyond that.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+NEAR_LIMIT = 0.8  # sync on every hit above this share of the quota
+
+
+def parse_rate(rate):
+    """'30/m' -> (30, 60); '100/5m' -> (100, 300)."""
+    num, _, period = rate.partition('/')
+    unit = period[-1:]
+    if not num.isdigit() or unit not in PERIODS:
+        raise ValueError(f'Invalid rate {rate!r}; expected e.g. "30/m".')
+    multiplier = int(period[:-1]) if period[:-1] else 1
+    return int(num), multiplier * PERIODS[unit]
+
+
+# -- stores ------------------------------------------------------------------
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}  # key -> (count, expires)
+
+    def incr(self, key, amount, ttl):
+        now = time.time()
+        with self._lock:
+            count, expires = self._counts.get(key, (0, 0))
+            count = count + amount if expires > now else amount
+            self._counts[key] = (count, now + ttl)
+            if random.random() < 0.01:
+                self._counts = {k: v for k, v in self._counts.items() if v[1] > now}
+            return count
+
+    def get(self, key):
+        count, expires = self._counts.get(key, (0, 0))
+        return count if expires > time.time() else 0
+
+
+class SQLiteStore:
+    """Counters in a SQLite file shared by every process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters '
+                         '(key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def incr(self, key, amount, ttl):
+        now = time.time()
+        conn = self._conn()
+        (count,) = conn.execute(
+            'INSERT INTO counters (key, count, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            '  count = CASE WHEN expires > ? THEN count + excluded.count ELSE excluded.count END, '
+            '  expires = excluded.expires '
+            'RETURNING count',
+            (key, amount, now + ttl, now),
+        ).fetchone()
+        if random.random() < 0.001:
+            conn.execute('DELETE FROM counters WHERE expires <= ?', (now,))
+        return count
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT count FROM counters WHERE key = ? AND expires > ?', (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+
+class RedisStore:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def incr(self, key, amount, ttl):
+        pipe = self.client.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, ttl)
+        return pipe.execute()[0]
+
+    def get(self, key):
+        return int(self.client.get(key) or 0)
+
+
+def store_from_url(url):
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        return MemoryStore()
+    if parsed.scheme == 'sqlite':
+        return SQLiteStore(parsed.path or os.path.join(tempfile.gettempdir(), 'shops-ratelimit.sqlite3'))
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        return RedisStore(url)
+    raise ValueError(f'Unsupported SHOPS_RATE_LIMIT_STORE {url!r}')
+
+
+# -- limiter -----------------------------------------------------------------
+
+class SlidingWindowLimiter:
+    def __init__(self, store, sync_hits=1, sync_seconds=0.0):
+        self.store = store
+        self.sync_hits = max(int(sync_hits), 1)
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._windows = {}  # key -> [window, shared count, pending hits, synced at, previous count, period]
+
+    def hit(self, key, limit, period):
+        """Count one hit; (allowed, seconds until allowed again)."""
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        window, weight = int(window), 1 - elapsed / period
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or state[0] != window:
+                state = self._windows[key] = [window, 0, 0, 0.0, None, period]
+            state[2] += 1
+            estimate = (state[4] or 0) * weight + state[1] + state[2]
+            sync = (state[4] is None or state[2] >= self.sync_hits
+                    or now - state[3] >= self.sync_seconds or estimate >= limit * NEAR_LIMIT)
+            pending = state[2] if sync else 0
+            if sync:
+                state[2] = 0
+        if sync:
+            shared = self.store.incr(f'{key}:{window}', pending, 2 * period)
+            previous = state[4]
+            if previous is None:  # first sync of this window; the previous one is final
+                previous = self.store.get(f'{key}:{window - 1}')
+            with self._lock:
+                state[1], state[3], state[4] = shared, now, previous
+                estimate = previous * weight + shared + state[2]
+        if len(self._windows) > 10000:
+            self._prune(now)
+        if estimate <= limit:
+            return True, None
+        current = estimate - (state[4] or 0) * weight
+        if current >= limit or not state[4]:
+            return False, round((1 - elapsed / period) * period, 3)
+        # the previous window's share decays linearly until the estimate fits
+        fraction = 1 - (limit - current) / state[4]
+        return False, round(max(fraction - elapsed / period, 0.0) * period, 3)
+
+    def _prune(self, now):
+        # a window's state is only needed until the next one is over
+        with self._lock:
+            self._windows = {k: s for k, s in self._windows.items() if (s[0] + 2) * s[5] > now}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = SlidingWindowLimiter(
+                    store_from_url(settings.SHOPS_RATE_LIMIT_STORE),
+                    sync_hits=settings.SHOPS_RATE_LIMIT_SYNC_HITS,
+                    sync_seconds=settings.SHOPS_RATE_LIMIT_SYNC_SECONDS,
+                )
+    return _limiter
+
+
+def rate_for(scope, vendor_id=None):
+    if vendor_id is not None:
+        override = settings.SHOPS_RATE_LIMIT_VENDORS.get(str(vendor_id), {})
+        if scope in override:
+            return override[scope]
+    return settings.SHOPS_RATE_LIMITS.get(scope)
+
+
+def check(request, scope, user=None):
+    """(allowed, retry after seconds) for one request against `scope`'s quota."""
+    user = user if user is not None else getattr(request, 'user', None)
+    vendor_id = user.id if user is not None and user.is_authenticated else None
+    rate = rate_for(scope, vendor_id)
+    if not settings.SHOPS_RATE_LIMIT_ENABLED or not rate:
+        return True, None
+    ident = f'v{vendor_id}' if vendor_id is not None else f'ip{BaseThrottle().get_ident(request)}'
+    return get_limiter().hit(f'rl:{scope}:{ident}', *parse_rate(rate))
+
+
+class SharedRateThrottle(BaseThrottle):
+    """
+    DRF throttle over the shared limiter. The scope is the view's
+    `throttle_scope`, or `throttle_scopes[action]` on viewsets.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
+        scope = scope or getattr(view, 'throttle_scope', None)
+        if not scope:
+            return True
+        allowed, self._wait = check(request, scope)
+        return allowed
+
+    def wait(self):
+        return self._wait
@@ -6,8 +6,52 @@ class ShopSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=255)
     owner_name = serializers.CharField(max_length=255)
     business_type = serializers.CharField(max_length=100, allow_blank=True, required=False)
-    latitude = serializers.FloatField()
-    longitude = serializers.FloatField()
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
-    distance_km = serializers.FloatField(read_only=True, required=False)
\ No newline at end of file
+    distance_km = serializers.FloatField(read_only=True, required=False)
+
+
+# Fields fetched by the lean read path (plus _id); everything row_to_dict needs.
+READ_FIELDS = ('vendor_id', 'name', 'owner_name', 'business_type',
+               'latitude', 'longitude', 'created_at', 'updated_at')
+READ_PROJECTION = {f: 1 for f in READ_FIELDS}
+
+
+def shop_to_dict(doc, include_distance=False):
+    data = {
+        'id': str(doc.id),
+        'vendor_id': doc.vendor_id,
+        'name': doc.name,
+        'owner_name': doc.owner_name,
+        'business_type': doc.business_type or '',
+        'latitude': float(doc.latitude),
+        'longitude': float(doc.longitude),
+        'created_at': doc.created_at,
+        'updated_at': doc.updated_at,
+    }
+    if include_distance and hasattr(doc, 'distance_km'):
+        data['distance_km'] = doc.distance_km
+    return data
+
+
+def row_to_dict(row, include_distance=False):
+    """
+    Same response shape as shop_to_dict, built straight from a raw BSON row
+    (as_pymongo() / PyMongo with READ_PROJECTION), skipping document hydration.
+    """
+    data = {
+        'id': str(row['_id']),
+        'vendor_id': row['vendor_id'],
+        'name': row['name'],
+        'owner_name': row['owner_name'],
+        'business_type': row.get('business_type') or '',
+        'latitude': float(row['latitude']),
+        'longitude': float(row['longitude']),
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+    }
+    if include_distance and 'distance_km' in row:
+        data['distance_km'] = row['distance_km']
+    return data
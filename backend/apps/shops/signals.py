@@ -0,0 +1,12 @@
+"""
+Shop write notifications.
+
+ShopViewSet sends these after every successful write so in-process
+structures (nearby index, caches, ...) can follow along. `shop` and
+`previous` are response-shaped dicts (see serializers.shop_to_dict);
+`previous` is None on create.
+"""
+from django.dispatch import Signal
+
+shop_saved = Signal()    # kwargs: shop, previous
+shop_deleted = Signal()  # kwargs: shop
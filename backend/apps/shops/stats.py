@@ -0,0 +1,275 @@
+"""
+Per-vendor shop statistics (GET /api/shops/stats/): total shops, counts per
+business type and the bounding extent of their locations.
+
+A VendorShopStats document per vendor is kept current by the shop_saved /
+shop_deleted receivers below, one atomic update per write: `$inc` of the
+total and the type counts (a type change moves one shop between two counts)
+and `$min`/`$max` of the extent. Bulk imports and location flushes wrap
+their writes in `batched()`, which sums the changes per vendor and applies
+them in one bulk_write. Reading it is a single find_one.
+
+Only the extent can't be shrunk incrementally. When a shop that sat on its
+edge moves or is deleted the extent is flagged stale and the next read
+recomputes it from the vendor's shops, guarded by the document's revision so
+a recompute never overwrites a newer increment.
+
+Documents upserted by increments alone (vendors whose shops predate this, or
+a brand-new vendor) have no built_at and get one full recount on first read.
+`manage.py rebuild_vendor_shop_stats` recounts everything.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .mongo_models import Shop, VendorShopStats
+from .utils import business_type_key
+
+EXTENT_FIELDS = ('min_latitude', 'max_latitude', 'min_longitude', 'max_longitude')
+
+
+def collection():
+    return VendorShopStats._get_collection()
+
+
+def _escape(key):
+    # field names can't be empty, start with '$' or contain '.'
+    return '_' + key.replace('.', '\uff0e')
+
+
+def _unescape(field):
+    return field[1:].replace('\uff0e', '.')
+
+
+def _type_field(business_type):
+    return 'types.' + _escape(business_type_key(business_type))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def stats_to_dict(doc):
+    """Response shape of a stats document (or of no document at all)."""
+    doc = doc or {}
+    total = doc.get('total') or 0
+    has_extent = total > 0 and all(doc.get(f) is not None for f in EXTENT_FIELDS)
+    return {
+        'total': total,
+        'by_business_type': {_unescape(k): n for k, n in sorted((doc.get('types') or {}).items()) if n > 0},
+        'extent': {f: doc[f] for f in EXTENT_FIELDS} if has_extent else None,
+        'updated_at': doc.get('updated_at'),
+    }
+
+
+# -- full recounts ------------------------------------------------------------
+
+def summarize(match=None):
+    """{vendor_id: summary} for the shops matching `match`, in one aggregation."""
+    pipeline = [
+        {'$group': {
+            '_id': {'vendor_id': '$vendor_id', 'type': {'$ifNull': ['$business_type_key', '']}},
+            'count': {'$sum': 1},
+            'min_latitude': {'$min': '$latitude'},
+            'max_latitude': {'$max': '$latitude'},
+            'min_longitude': {'$min': '$longitude'},
+            'max_longitude': {'$max': '$longitude'},
+        }},
+    ]
+    if match:
+        pipeline.insert(0, {'$match': match})
+    summaries = {}
+    for group in Shop._get_collection().aggregate(pipeline):
+        vendor_id = group['_id']['vendor_id']
+        summary = summaries.setdefault(vendor_id, {'total': 0, 'types': {}})
+        summary['total'] += group['count']
+        field = _escape(group['_id']['type'])
+        summary['types'][field] = summary['types'].get(field, 0) + group['count']
+        for f in EXTENT_FIELDS:
+            pick = min if f.startswith('min') else max
+            summary[f] = group[f] if summary.get(f) is None else pick(summary[f], group[f])
+    return summaries
+
+
+def _extent_update(summary):
+    # an empty extent is unset, not null: $min/$max never move off a null
+    if summary.get('min_latitude') is None:
+        return {'$unset': {f: '' for f in EXTENT_FIELDS}}
+    return {'$set': {f: summary[f] for f in EXTENT_FIELDS}}
+
+
+def rebuild_op(vendor_id, revision, summary):
+    """
+    Update replacing a vendor's stats with `summary`, applied only while the
+    document is still at `revision` (None: while there is none). A miss
+    surfaces as a duplicate key error on the unique vendor_id.
+    """
+    summary = summary or {'total': 0, 'types': {}}
+    now = _now()
+    fields = {
+        'total': summary['total'],
+        'types': summary['types'],
+        'extent_stale': False,
+        'built_at': now,
+        'updated_at': now,
+    }
+    update = _extent_update(summary)
+    update.setdefault('$set', {}).update(fields)
+    update['$inc'] = {'revision': 1}
+    guard = {'$exists': False} if revision is None else revision
+    return UpdateOne({'vendor_id': vendor_id, 'revision': guard}, update, upsert=True)
+
+
+def rebuild(vendor_ids=None, batch_size=1000):
+    """
+    Recounts the given vendors (every vendor with shops or stats when None).
+    Returns the vendor ids whose stats changed under the recount; retry those.
+    """
+    match = {'vendor_id': {'$in': list(vendor_ids)}} if vendor_ids is not None else None
+    coll = collection()
+    revisions = {doc['vendor_id']: doc.get('revision') for doc in coll.find(match or {}, {'vendor_id': 1, 'revision': 1})}
+    summaries = summarize(match)
+    vendors = sorted(set(summaries) | set(revisions) | set(vendor_ids or ()))
+    conflicts = []
+    for start in range(0, len(vendors), batch_size):
+        batch = vendors[start:start + batch_size]
+        try:
+            coll.bulk_write([rebuild_op(v, revisions.get(v), summaries.get(v)) for v in batch], ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get('writeErrors', []):
+                if err.get('code') != 11000:
+                    raise
+                conflicts.append(batch[err['index']])
+    return conflicts
+
+
+def rebuild_vendor(vendor_id, attempts=3):
+    """Recounts one vendor and returns its stats document."""
+    coll = collection()
+    for _ in range(attempts):
+        if not rebuild([vendor_id]):
+            break
+    return coll.find_one({'vendor_id': vendor_id})
+
+
+def refresh_extent(doc):
+    """Recomputes a stale extent; the document with the fresh extent."""
+    vendor_id = doc['vendor_id']
+    summary = summarize({'vendor_id': vendor_id}).get(vendor_id, {})
+    update = _extent_update(summary)
+    update.setdefault('$set', {})['extent_stale'] = False
+    collection().update_one({'vendor_id': vendor_id, 'revision': doc.get('revision')}, update)
+    return dict(doc, **{f: summary.get(f) for f in EXTENT_FIELDS}, extent_stale=False)
+
+
+def get_stats(vendor_id):
+    doc = collection().find_one({'vendor_id': vendor_id})
+    if doc is None or doc.get('built_at') is None:
+        doc = rebuild_vendor(vendor_id)
+    elif doc.get('extent_stale'):
+        doc = refresh_extent(doc)
+    return stats_to_dict(doc)
+
+
+# -- incremental updates -----------------------------------------------------
+
+_local = threading.local()
+
+
+def _delta(vendor_id, inc, point=None, left=None, create=False):
+    # `point`: a position now taken (grows the extent); `left`: one given up
+    return {'vendor_id': vendor_id, 'inc': inc, 'point': point, 'left': left, 'create': create}
+
+
+def apply_many(deltas):
+    """
+    Applies the stats changes of many shop writes in one bulk_write: per
+    vendor, one update with the summed $inc and the $min/$max of the new
+    positions, then one marking the extent stale if a position given up sat
+    on its edge.
+    """
+    vendors = {}
+    for delta in deltas:
+        merged = vendors.setdefault(delta['vendor_id'], {'inc': Counter(), 'points': [], 'left': [], 'create': False})
+        merged['inc'].update(delta['inc'])
+        merged['points'] += [delta['point']] if delta['point'] else []
+        merged['left'] += [delta['left']] if delta['left'] else []
+        merged['create'] |= delta['create']
+
+    ops, now = [], _now()
+    for vendor_id, merged in vendors.items():
+        update = {'$inc': dict(merged['inc']), '$set': {'updated_at': now}}
+        if merged['points']:
+            lats, lngs = zip(*merged['points'])
+            update['$min'] = {'min_latitude': min(lats), 'min_longitude': min(lngs)}
+            update['$max'] = {'max_latitude': max(lats), 'max_longitude': max(lngs)}
+        # only creates start a document; other writes wait for the recount on first read
+        ops.append(UpdateOne({'vendor_id': vendor_id}, update, upsert=merged['create']))
+        if merged['left']:
+            lats, lngs = (sorted(set(c)) for c in zip(*merged['left']))
+            ops.append(UpdateOne(
+                {'vendor_id': vendor_id, 'extent_stale': {'$ne': True}, '$or': [
+                    {'min_latitude': {'$in': lats}}, {'max_latitude': {'$in': lats}},
+                    {'min_longitude': {'$in': lngs}}, {'max_longitude': {'$in': lngs}},
+                ]},
+                {'$set': {'extent_stale': True}, '$inc': {'revision': 1}},
+            ))
+    if ops:
+        # in order: the edge check has to see the extent after this batch grew it
+        collection().bulk_write(ops, ordered=True)
+
+
+@contextmanager
+def batched():
+    """
+    Collects the stats changes of the shop writes signalled inside the block
+    (in this thread) and applies them with one apply_many on exit. Used per
+    bulk import chunk and per location flush.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield  # already inside a batch
+        return
+    _local.pending = []
+    try:
+        yield
+    finally:
+        # the shop writes have landed either way
+        pending, _local.pending = _local.pending, None
+        if pending:
+            apply_many(pending)
+
+
+def _record(delta):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        apply_many([delta])
+    else:
+        pending.append(delta)
+
+
+# -- signal receivers (connected in ShopsConfig.ready) ------------------------
+
+def on_shop_saved(sender, shop, previous=None, **kwargs):
+    vendor_id, point = shop['vendor_id'], (shop['latitude'], shop['longitude'])
+    if previous is None:
+        _record(_delta(vendor_id, {'total': 1, _type_field(shop['business_type']): 1, 'revision': 1},
+                       point=point, create=True))
+        return
+    inc = {'revision': 1}
+    old, new = _type_field(previous['business_type']), _type_field(shop['business_type'])
+    if old != new:
+        inc[old], inc[new] = -1, 1
+    before = (previous['latitude'], previous['longitude'])
+    moved = before != point
+    if old == new and not moved:
+        return  # nothing counted here changed
+    _record(_delta(vendor_id, inc, point=point if moved else None, left=before if moved else None))
+
+
+def on_shop_deleted(sender, shop, **kwargs):
+    _record(_delta(shop['vendor_id'], {'total': -1, _type_field(shop['business_type']): -1, 'revision': 1},
+                   left=(shop['latitude'], shop['longitude'])))
@@ -0,0 +1,711 @@
+"""
+Shops API tests. They run against mongomock (pip install mongomock, see
+benchmarks/requirements.txt) and are skipped without it:
+
+    python manage.py test apps.shops
+"""
+import io
+import json
+import random
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+
+import mongoengine as me
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from bson import ObjectId
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.vendors import authentication
+
+from . import async_views, geo_index, partitions, pings, ratelimit
+from .compression import CompressionMiddleware
+from .instrumentation import InstrumentationMiddleware
+from .mongo_models import Shop, VendorShopStats
+from .nearby import BoundingBoxEngine, GridIndexEngine, search_many
+from .utils import geo_fields, haversine_km
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+@unittest.skipIf(mongomock is None, 'mongomock is not installed')
+@override_settings(SHOPS_RATE_LIMIT_ENABLED=False)
+class MongoTestCase(TestCase):
+    """Points the default MongoEngine alias at an empty mongomock database per test."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        me.disconnect_all()
+        me.connect('shops_tests', host='mongodb://localhost', alias='default',
+                   mongo_client_class=mongomock.MongoClient)
+
+    @classmethod
+    def tearDownClass(cls):
+        me.disconnect_all()
+        super().tearDownClass()
+
+    def setUp(self):
+        Shop.drop_collection()
+        VendorShopStats.drop_collection()
+        for cache in caches.all():
+            cache.clear()
+        geo_index._index = None
+        authentication._recent.clear()  # user ids are reused across tests
+
+    def client_for(self, username='vendor'):
+        user, _ = User.objects.get_or_create(username=username)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client, user
+
+    def insert_shops(self, points, vendor_id=1):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        result = Shop._get_collection().insert_many([
+            dict(vendor_id=vendor_id, name=f's{i}', owner_name='o', business_type='', business_type_key='',
+                 latitude=lat, longitude=lng, created_at=now, updated_at=now, version=0, **geo_fields(lat, lng))
+            for i, (lat, lng) in enumerate(points)
+        ])
+        return [str(_id) for _id in result.inserted_ids]
+
+
+class NearbyEngineTests(MongoTestCase):
+    # shops scattered around the antimeridian, both poles and an ordinary spot
+    CENTRES = [(0, 179.9), (0, -179.9), (89.9, 0), (-89.95, 120), (10, 10)]
+    QUERIES = [
+        (0, 180, 30), (0, -180, 30), (0, 179.95, 50),  # across the antimeridian
+        (90, 0, 40), (89.8, -170, 60), (-90, 0, 30), (-89.9, -60, 80),  # over a pole
+        (10, 10, 20), (0, 0, 500),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(1)
+        self.points = []
+        for lat, lng in self.CENTRES:
+            for _ in range(60):
+                p_lat = max(-90, min(90, lat + rng.uniform(-0.8, 0.8)))
+                p_lng = (lng + rng.uniform(-0.8, 0.8) + 180) % 360 - 180
+                self.points.append((p_lat, p_lng))
+        self.ids = self.insert_shops(self.points)
+
+    def brute_force(self, lat, lng, radius_km):
+        return sorted(_id for _id, (p_lat, p_lng) in zip(self.ids, self.points)
+                      if haversine_km(lat, lng, p_lat, p_lng) <= radius_km)
+
+    def test_grid_matches_bbox_and_brute_force(self):
+        bbox, grid = BoundingBoxEngine(), GridIndexEngine()
+        for query in self.QUERIES:
+            with self.subTest(query=query):
+                expected = self.brute_force(*query)
+                from_bbox = {r['id']: r['distance_km'] for r in bbox.search(*query)}
+                from_grid = {r['id']: r['distance_km'] for r in grid.search(*query)}
+                self.assertEqual(sorted(from_bbox), expected)
+                self.assertEqual(from_grid, from_bbox)
+
+    def test_grid_tracks_writes(self):
+        grid = GridIndexEngine()
+        self.assertTrue(grid.search(10, 10, 200))
+        client, user = self.client_for()
+        pk = client.post('/api/shops/', {'name': 'n', 'owner_name': 'o', 'latitude': 0, 'longitude': 179.99},
+                         format='json').data['id']
+        self.assertIn(pk, [r['id'] for r in grid.search(0, -179.99, 5)])
+        client.delete(f'/api/shops/{pk}/')
+        self.assertNotIn(pk, [r['id'] for r in grid.search(0, -179.99, 5)])
+
+    def test_reconcile_picks_up_late_commits(self):
+        grid = GridIndexEngine()
+        grid.search(10, 10, 5)  # loaded
+        index = geo_index.get_index()
+        # another worker's write, stamped before the newest row seen but committed after it
+        stamped = index._watermark - timedelta(seconds=2)
+        Shop._get_collection().update_one({'_id': ObjectId(self.ids[0])}, {'$set': {
+            'latitude': 45, 'longitude': 45, **geo_fields(45, 45), 'updated_at': stamped}})
+        index._synced_at = 0
+        self.assertIn(self.ids[0], [r['id'] for r in grid.search(45, 45, 1)])
+
+
+class CursorPaginationTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api, user = self.client_for()
+        ids = self.insert_shops([(10, 10)] * 25, vendor_id=user.id)
+        # two created_at values, so pages break both between and within ties
+        Shop._get_collection().update_many({'name': {'$in': [f's{i}' for i in range(0, 25, 2)]}},
+                                           {'$set': {'created_at': datetime(2020, 1, 1)}})
+        rows = Shop._get_collection().find({}, {'created_at': 1}).sort([('created_at', -1), ('_id', -1)])
+        self.expected = [str(row['_id']) for row in rows]
+        self.assertCountEqual(self.expected, ids)
+
+    def pages(self, url, link):
+        while url:
+            response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            yield [item['id'] for item in response.data['results']]
+            url = response.data[link]
+
+    def test_round_trip(self):
+        forward = list(self.pages('/api/shops/?cursor=&page_size=10', 'next'))
+        self.assertEqual([len(page) for page in forward], [10, 10, 5])
+        self.assertEqual(sum(forward, []), self.expected)
+
+        last = self.api.get('/api/shops/?cursor=&page_size=10').data
+        while last['next']:
+            last = self.api.get(last['next']).data
+        backward = list(self.pages(last['previous'], 'previous'))
+        self.assertEqual(sum(reversed(backward), []) + [item['id'] for item in last['results']], self.expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.api.get('/api/shops/?cursor=not-a-cursor').status_code, 400)
+
+
+class ConditionalWriteTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api, _ = self.client_for()
+        response = self.api.post('/api/shops/', {'name': 'a', 'owner_name': 'o', 'latitude': 1, 'longitude': 2},
+                                 format='json')
+        self.pk, self.etag = response.data['id'], response['ETag']
+        self.url = f'/api/shops/{self.pk}/'
+
+    def test_stale_if_match_is_412(self):
+        response = self.api.patch(self.url, {'name': 'b'}, format='json', HTTP_IF_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], self.etag)
+        # a second writer still holding the old version loses, and changes nothing
+        response = self.api.patch(self.url, {'name': 'c'}, format='json', HTTP_IF_MATCH=self.etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.api.delete(self.url, HTTP_IF_MATCH=self.etag).status_code, 412)
+        self.assertEqual(self.api.get(self.url).data['name'], 'b')
+
+    def test_stale_if_unmodified_since_is_412(self):
+        response = self.api.patch(self.url, {'name': 'b'}, format='json',
+                                  HTTP_IF_UNMODIFIED_SINCE='Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertEqual(response.status_code, 412)
+
+    def test_other_vendor_is_403(self):
+        other, _ = self.client_for('other')
+        self.assertEqual(other.patch(self.url, {'name': 'b'}, format='json').status_code, 403)
+        self.assertEqual(other.delete(self.url, HTTP_IF_MATCH=self.etag).status_code, 403)
+
+
+class LocationPingTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        pings._buffer = pings.PingBuffer(flush_seconds=3600)  # flushed by hand below
+        self.api, user = self.client_for()
+        self.ids = self.insert_shops([(10, 10), (20, 20)], vendor_id=user.id)
+        self.coll = Shop._get_collection()
+
+    def tearDown(self):
+        pings._buffer = None
+        super().tearDown()
+
+    def ping(self, pk, lat, lng, api=None):
+        return (api or self.api).post(f'/api/shops/{pk}/location/', {'latitude': lat, 'longitude': lng},
+                                      format='json')
+
+    def row(self, pk):
+        return self.coll.find_one({'_id': ObjectId(pk)})
+
+    def test_pings_coalesce_per_shop(self):
+        for i in range(5):
+            self.assertEqual(self.ping(self.ids[0], 11 + i, 11).status_code, 202)
+        self.assertEqual(self.ping(self.ids[1], 21, 21).status_code, 202)
+        buffer = pings.get_buffer()
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.flush(), 2)
+        row = self.row(self.ids[0])
+        self.assertEqual((row['latitude'], row['longitude'], row['version']), (15, 11, 1))
+        self.assertEqual(len(buffer), 0)
+
+    def test_newer_edit_wins_over_pending_ping(self):
+        self.assertEqual(self.ping(self.ids[0], 11, 11).status_code, 202)
+        self.api.patch(f'/api/shops/{self.ids[0]}/', {'latitude': 12, 'longitude': 12}, format='json')
+        self.assertEqual(pings.get_buffer().flush(), 0)
+        self.assertEqual(self.row(self.ids[0])['latitude'], 12)
+        self.assertEqual(pings.get_buffer().stats['stale'], 1)
+
+    def test_ownership_checked_before_accepting(self):
+        other, _ = self.client_for('other')
+        self.assertEqual(self.ping(self.ids[0], 11, 11, api=other).status_code, 403)
+        self.assertEqual(self.ping('0' * 24, 11, 11).status_code, 404)
+        self.assertEqual(len(pings.get_buffer()), 0)
+
+    @override_settings(SHOPS_PING_WRITE_THROUGH=True)
+    def test_write_through(self):
+        self.assertEqual(self.ping(self.ids[0], 11, 11).status_code, 204)
+        self.assertEqual(self.row(self.ids[0])['latitude'], 11)
+        self.assertEqual(len(pings.get_buffer()), 0)
+        # deleted behind the cached owner: nothing written, and the client is told
+        self.coll.delete_one({'_id': ObjectId(self.ids[0])})
+        self.assertEqual(self.ping(self.ids[0], 12, 12).status_code, 409)
+
+
+@override_settings(SHOPS_BULK_CHUNK_SIZE=40)
+class VendorStatsTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        pings._buffer = pings.PingBuffer(flush_seconds=3600)
+        self.api, self.user = self.client_for()
+        rows = [{'name': f'n{i}', 'owner_name': 'o', 'business_type': ['Cafe', 'Dept. Store', ''][i % 3],
+                 'latitude': 10 + i * 0.1, 'longitude': 20 - i * 0.1} for i in range(100)]
+        response = self.api.post('/api/shops/import/', data=''.join(json.dumps(row) + '\n' for row in rows),
+                                 content_type='application/x-ndjson')
+        self.assertEqual(response.data['inserted'], 100)
+        self.ids = [str(row['_id']) for row in Shop._get_collection().find({}, {'_id': 1}).sort('latitude', 1)]
+
+    def tearDown(self):
+        pings._buffer = None
+        super().tearDown()
+
+    def assertMatchesRebuild(self):
+        live = self.api.get('/api/shops/stats/').data
+        call_command('rebuild_vendor_shop_stats', stdout=io.StringIO())
+        rebuilt = self.api.get('/api/shops/stats/').data
+        live.pop('updated_at'), rebuilt.pop('updated_at')
+        self.assertEqual(live, rebuilt)
+        return live
+
+    def test_bulk_import(self):
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats['total'], 100)
+        self.assertEqual(stats['by_business_type'], {'': 33, 'cafe': 34, 'dept. store': 33})
+
+    def test_moves_and_deletes(self):
+        self.api.get('/api/shops/stats/')  # built
+        # the shops on the extent's edges move inwards or go away
+        self.api.patch(f'/api/shops/{self.ids[0]}/', {'latitude': 15, 'business_type': 'Bar'}, format='json')
+        self.api.delete(f'/api/shops/{self.ids[-1]}/')
+        for i, pk in enumerate(self.ids[1:50]):
+            pings.queue_ping(pk, self.user.id, {'latitude': -5 + i * 0.01, 'longitude': 21})
+        pings.get_buffer().flush()
+        self.api.post('/api/shops/', {'name': 'x', 'owner_name': 'o', 'business_type': 'Cafe',
+                                      'latitude': 50, 'longitude': 50}, format='json')
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats['total'], 100)
+        self.assertEqual(stats['extent']['min_latitude'], -5)
+        self.assertEqual(stats['by_business_type']['bar'], 1)
+
+
+@override_settings(SHOPS_RATE_LIMIT_ENABLED=True, SHOPS_RATE_LIMIT_STORE='memory://',
+                   SHOPS_RATE_LIMITS={'shops.nearby': '5/m'}, SHOPS_RATE_LIMIT_VENDORS={})
+class RateLimitTests(MongoTestCase):
+    URL = '/api/shops/nearby/?lat=10&lng=10&radius=5'
+
+    def setUp(self):
+        super().setUp()
+        ratelimit._limiter = None  # a fresh memory store per test
+
+    def tearDown(self):
+        ratelimit._limiter = None
+        super().tearDown()
+
+    def statuses(self, n, api=None, **extra):
+        api = api or APIClient()
+        return [api.get(self.URL, **extra).status_code for _ in range(n)]
+
+    def test_anonymous_quota_per_address(self):
+        self.assertEqual(self.statuses(7), [200] * 5 + [429] * 2)
+        response = APIClient().get(self.URL)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.statuses(1, REMOTE_ADDR='10.0.0.2'), [200])
+
+    def test_forwarded_for_does_not_reset_quota(self):
+        api = APIClient()
+        codes = [api.get(self.URL, HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code for i in range(7)]
+        self.assertEqual(codes, [200] * 5 + [429] * 2)
+
+    def test_vendors_have_their_own_quota(self):
+        self.statuses(5)
+        api, user = self.client_for()
+        self.assertEqual(self.statuses(6, api=api), [200] * 5 + [429])
+        with override_settings(SHOPS_RATE_LIMIT_VENDORS={str(user.id): {'shops.nearby': '100/m'}}):
+            self.assertEqual(self.statuses(1, api=api), [200])
+
+
+class EstimatedCountTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api, _ = self.client_for()
+        self.ids = [self.api.post('/api/shops/', {'name': f's{i}', 'owner_name': 'o', 'business_type': bt,
+                                                  'latitude': 1, 'longitude': 1}, format='json').data['id']
+                    for i, bt in enumerate(['', '', 'Cafe'])]
+
+    def counts(self, query=''):
+        exact = self.api.get(f'/api/shops/?count=exact{query}').data['count']
+        estimated = self.api.get(f'/api/shops/?count=estimated{query}').data['count']
+        return exact, estimated
+
+    def test_follows_creates_type_changes_and_deletes(self):
+        self.assertEqual(self.counts(), (3, 3))
+        self.assertEqual(self.counts('&business_type=cafe'), (1, 1))
+        # a blank type is not the vendor's total
+        self.api.patch(f'/api/shops/{self.ids[0]}/', {'business_type': 'Cafe'}, format='json')
+        self.assertEqual(self.counts(), (3, 3))
+        self.assertEqual(self.counts('&business_type=cafe'), (2, 2))
+        self.api.patch(f'/api/shops/{self.ids[0]}/', {'business_type': ''}, format='json')
+        self.assertEqual(self.counts(), (3, 3))
+        self.api.post('/api/shops/', {'name': 'n', 'owner_name': 'o', 'business_type': 'CAFE',
+                                      'latitude': 1, 'longitude': 1}, format='json')
+        self.api.delete(f'/api/shops/{self.ids[1]}/')
+        self.assertEqual(self.counts(), (3, 3))
+        self.assertEqual(self.counts('&business_type=cafe,bar'), (2, 2))
+
+    def test_none(self):
+        self.assertIsNone(self.api.get('/api/shops/?count=none').data['count'])
+        self.assertEqual(self.api.get('/api/shops/?count=bogus').status_code, 400)
+
+
+PARTITIONS = {'s0000': 'mongodb://localhost/region_s0000', 'u': 'mongodb://localhost/region_u'}
+
+
+@override_settings(SHOPS_GEO_PARTITIONS=PARTITIONS)
+class GeoPartitionTests(MongoTestCase):
+    # s0000 is a small cell inside the s0 cell covering a wide circle at (0, 0)
+    POINTS = [(0.01, 0.01), (0.02, 0.03), (0.1, 0.1), (-0.01, -0.01), (0.3, -0.2), (50, 10), (50.1, 10.1)]
+    QUERIES = [(0, 0, 5), (0, 0, 30), (0, 0, 100), (50, 10, 50), (25, 5, 3000)]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for prefix in PARTITIONS:
+            me.connect(f'region_{prefix}', host='mongodb://localhost', alias=f'shops-{prefix}',
+                       mongo_client_class=mongomock.MongoClient)
+
+    def setUp(self):
+        super().setUp()
+        for prefix in PARTITIONS:
+            partitions.collection(f'shops-{prefix}').drop()
+        self.api, _ = self.client_for()
+        self.ids = [self.api.post('/api/shops/', {'name': f's{i}', 'owner_name': 'o', 'latitude': lat,
+                                                  'longitude': lng}, format='json').data['id']
+                    for i, (lat, lng) in enumerate(self.POINTS)]
+
+    def regional_ids(self, prefix):
+        return sorted(str(row['_id']) for row in partitions.collection(f'shops-{prefix}').find({}, {'_id': 1}))
+
+    def test_writes_reach_their_region(self):
+        self.assertEqual(self.regional_ids('s0000'), sorted(self.ids[:2]))
+        self.assertEqual(self.regional_ids('u'), sorted(self.ids[5:]))
+        self.api.patch(f'/api/shops/{self.ids[0]}/', {'latitude': 50.2, 'longitude': 10.2}, format='json')
+        self.api.delete(f'/api/shops/{self.ids[5]}/')
+        self.assertEqual(self.regional_ids('s0000'), [self.ids[1]])
+        self.assertEqual(self.regional_ids('u'), sorted([self.ids[0], self.ids[6]]))
+
+    def test_route_reads_every_cell_once(self):
+        targets = partitions.route(['s0', 's1', 'u2'])
+        self.assertEqual(targets['shops-s0000'], ['s0'])
+        self.assertEqual(targets['shops-u'], ['u2'])
+        self.assertNotIn('s0', targets['default'])
+        self.assertNotIn('s000', targets['default'])
+        self.assertIn('s001', targets['default'])
+        self.assertIn('s1', targets['default'])
+
+    def test_partitioned_results_match_unpartitioned(self):
+        engine = BoundingBoxEngine()
+        for query in self.QUERIES:
+            with self.subTest(query=query):
+                found = [(r['distance_km'], r['id']) for r in engine.search(*query)]
+                with override_settings(SHOPS_GEO_PARTITIONS={}):
+                    expected = [(r['distance_km'], r['id']) for r in engine.search(*query)]
+                # same shops, each once, nearest first (ties in any order)
+                self.assertEqual(sorted(found), sorted(expected))
+                self.assertEqual(found, sorted(found, key=lambda hit: hit[0]))
+        batch = search_many(engine, self.QUERIES)
+        self.assertEqual([sorted(r['id'] for r in rows) for rows in batch],
+                         [sorted(r['id'] for r in engine.search(*query)) for query in self.QUERIES])
+
+
+class NearbyBatchTests(MongoTestCase):
+    URL = '/api/shops/nearby/batch/'
+
+    def setUp(self):
+        super().setUp()
+        self.ids = self.insert_shops([(10, 10), (10, 10.05), (10.5, 10.5), (20, 20)])
+
+    def post(self, body):
+        return APIClient().post(self.URL, body, format='json')
+
+    def test_one_list_per_point(self):
+        response = self.post({'points': [{'lat': 10, 'lng': 10}, {'lat': 10.5, 'lng': 10.5, 'radius': 1},
+                                         {'lat': 0, 'lng': 0}], 'radius': 10, 'fields': ['id', 'distance_km']})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([[r['id'] for r in found] for found in results],
+                         [self.ids[:2], [self.ids[2]], []])
+        self.assertEqual(results[0][0], {'id': self.ids[0], 'distance_km': 0.0})
+        single = APIClient().get('/api/shops/nearby/?lat=10&lng=10&radius=10').data
+        self.assertEqual([r['distance_km'] for r in results[0]], [r['distance_km'] for r in single])
+
+    def test_limits(self):
+        self.assertEqual(self.post({'points': []}).status_code, 400)
+        self.assertEqual(self.post({'points': [{'lat': 'nan', 'lng': 0}]}).status_code, 400)
+        with override_settings(SHOPS_NEARBY_BATCH_MAX_POINTS=2):
+            self.assertEqual(self.post({'points': [{'lat': 0, 'lng': 0}] * 3}).status_code, 400)
+        # 500 points x 500 km would cover ~393M km²
+        response = self.post({'points': [{'lat': 0, 'lng': i * 0.1} for i in range(500)], 'radius': 500})
+        self.assertEqual(response.status_code, 400)
+        with override_settings(SHOPS_NEARBY_BATCH_MAX_CANDIDATES=2):
+            self.assertEqual(self.post({'points': [{'lat': 10, 'lng': 10, 'radius': 100}]}).status_code, 400)
+            self.assertEqual(self.post({'points': [{'lat': 10, 'lng': 10, 'radius': 1}]}).status_code, 200)
+
+
+class AsyncPathTests(TestCase):
+    def test_bad_token_on_async_nearby_is_401(self):
+        request = RequestFactory().get('/api/shops/nearby/?lat=0&lng=0', HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = async_to_sync(async_views.shop_nearby)(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+        sync = APIClient().get('/api/shops/nearby/?lat=0&lng=0', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(sync.status_code, 401)
+
+    @override_settings(SHOPS_METRICS_ENABLED=True, SHOPS_METRICS_SAMPLE_RATE=1.0, SHOPS_COMPRESSION=True)
+    def test_middleware_stays_async(self):
+        async def view(request):
+            return HttpResponse(b'[' + b'0,' * 2000 + b'0]', content_type='application/json')
+
+        handler = InstrumentationMiddleware(CompressionMiddleware(view))
+        self.assertTrue(iscoroutinefunction(handler))
+        response = async_to_sync(handler)(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('total;dur=', response['Server-Timing'])
+        # and still plain callables under WSGI
+        sync_handler = InstrumentationMiddleware(CompressionMiddleware(lambda request: async_to_sync(view)(request)))
+        self.assertFalse(iscoroutinefunction(sync_handler))
+        response = sync_handler(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+@override_settings(SHOPS_NEARBY_CACHE=True)
+class NearbyCacheTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api, _ = self.client_for()
+        self.ids = self.insert_shops([(10, 10), (10.02, 10.01)])
+
+    def nearby(self, lat=10, lng=10, radius=5):
+        response = APIClient().get(f'/api/shops/nearby/?lat={lat}&lng={lng}&radius={radius}')
+        self.assertEqual(response.status_code, 200)
+        return [(r['id'], r['distance_km']) for r in response.data]
+
+    def test_exact_distances_for_snapped_queries(self):
+        for lat, lng, radius in [(10, 10, 5), (10.003, 9.998, 2.5), (10.019, 10.012, 0.5)]:
+            with self.subTest(lat=lat, lng=lng, radius=radius):
+                with override_settings(SHOPS_NEARBY_CACHE=False):
+                    expected = self.nearby(lat, lng, radius)
+                self.assertEqual(self.nearby(lat, lng, radius), expected)
+                self.assertEqual(self.nearby(lat, lng, radius), expected)  # from the cache
+
+    def test_writes_invalidate_their_cells(self):
+        self.assertEqual(len(self.nearby()), 2)
+        # a write that sends no signal is not seen until the entry goes...
+        self.insert_shops([(10.01, 10)])
+        self.assertEqual(len(self.nearby()), 2)
+        # ...and a signalled write in the same cell drops it
+        created = self.api.post('/api/shops/', {'name': 'n', 'owner_name': 'o', 'latitude': 10.03,
+                                                'longitude': 10.03}, format='json').data['id']
+        self.assertEqual(len(self.nearby()), 4)
+        self.api.patch(f'/api/shops/{created}/', {'latitude': 40, 'longitude': 40}, format='json')
+        self.assertNotIn(created, [i for i, _ in self.nearby()])
+        self.assertIn(created, [i for i, _ in self.nearby(40, 40, 1)])
+        self.api.delete(f'/api/shops/{created}/')
+        self.assertEqual(self.nearby(40, 40, 1), [])
+
+
+@override_settings(JWT_REVOCATION_CACHE='default', JWT_CHECK_REVOCATION=True, WEB_CONCURRENCY=1)
+class StatelessAuthTests(MongoTestCase):
+    URL = '/api/shops/?count=none'
+
+    def setUp(self):
+        super().setUp()
+        self.api, self.user = self.client_for()
+
+    def test_no_user_query_per_request(self):
+        self.assertEqual(self.api.get(self.URL).status_code, 200)
+        authentication._recent.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get(self.URL).status_code, 200)
+
+    def test_deactivated_and_deleted_users_are_refused(self):
+        self.assertEqual(self.api.get(self.URL).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.api.get(self.URL).status_code, 401)
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.api.get(self.URL).status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.api.get(self.URL).status_code, 401)
+
+    def test_bad_tokens(self):
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+        for token in ['not-a-token', str(expired)]:
+            response = APIClient().get(self.URL, HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(response.status_code, 401)
+
+    @override_settings(JWT_REVOCATION_CACHE=None)
+    def test_users_table_without_a_shared_cache(self):
+        # no signal, no cache: the lookup itself has to see it
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.api.get(self.URL).status_code, 401)
+
+    def test_unreachable_cache_fails_closed(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with mock.patch.object(caches['default'], 'get', side_effect=ConnectionError('down')):
+            self.assertEqual(self.api.get(self.URL).status_code, 401)
+
+    def test_process_local_cache_refused_behind_several_workers(self):
+        with override_settings(WEB_CONCURRENCY=2):
+            with self.assertRaises(ImproperlyConfigured):
+                authentication.check_revocation_store()
+        authentication.check_revocation_store()
+
+
+class BusinessTypeFilterTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api, self.user = self.client_for()
+        self.ids = {}
+        for name, business_type in [('a', 'Cafe'), ('b', '  CAFE '), ('c', 'Bakery'), ('d', '')]:
+            response = self.api.post('/api/shops/', {'name': name, 'owner_name': 'o', 'business_type': business_type,
+                                                     'latitude': 1, 'longitude': 1}, format='json')
+            self.ids[name] = response.data['id']
+
+    def names(self, query):
+        response = self.api.get(f'/api/shops/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(shop['name'] for shop in response.data['results'])
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.names('business_type=cafe'), ['a', 'b'])
+        self.assertEqual(self.names('business_type=%20CaFe'), ['a', 'b'])
+        self.assertEqual(self.names('business_type=CAFE,bakery'), ['a', 'b', 'c'])
+        self.assertEqual(self.names('business_type=cafe&business_type=Bakery'), ['a', 'b', 'c'])
+        self.assertEqual(self.names('business_type=,'), ['a', 'b', 'c', 'd'])
+        # the stored value keeps its spelling
+        self.assertEqual(self.api.get(f"/api/shops/{self.ids['a']}/").data['business_type'], 'Cafe')
+
+    def test_key_follows_writes(self):
+        self.api.patch(f"/api/shops/{self.ids['c']}/", {'business_type': 'CAFE'}, format='json')
+        self.assertEqual(self.names('business_type=cafe'), ['a', 'b', 'c'])
+        self.api.post('/api/shops/import/', data='{"name":"e","owner_name":"o","business_type":"Cafe",'
+                      '"latitude":1,"longitude":1}\n', content_type='application/x-ndjson')
+        self.assertEqual(self.names('business_type=cafe'), ['a', 'b', 'c', 'e'])
+
+    def test_backfill(self):
+        # shops written before the normalized field existed
+        Shop._get_collection().update_many({}, {'$unset': {'business_type_key': ''}})
+        self.assertEqual(self.names('business_type=cafe'), [])
+        call_command('backfill_business_type_key', stdout=io.StringIO())
+        self.assertEqual(self.names('business_type=cafe'), ['a', 'b'])
+
+
+class NearbyPagingTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(3)
+        points = [(10 + rng.uniform(-0.2, 0.2), 10 + rng.uniform(-0.2, 0.2)) for _ in range(40)]
+        points += [(10.05, 10)] * 3 + [(9.95, 10)] * 2  # ties at one distance
+        self.insert_shops(points)
+
+    def get(self, url):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_pages_and_streams_match_the_full_result(self):
+        base = '/api/shops/nearby/?lat=10&lng=10&radius=50'
+        for engine in ('bbox', 'grid'):
+            with self.subTest(engine=engine), override_settings(SHOPS_NEARBY_ENGINE=engine):
+                full = [(r['id'], r['distance_km']) for r in self.get(base).data]
+                self.assertEqual(len(full), 45)
+                self.assertEqual([d for _, d in full], sorted(d for _, d in full))
+
+                top = self.get(base + '&limit=5').data
+                self.assertEqual([(r['id'], r['distance_km']) for r in top['results']], full[:5])
+
+                paged, url = [], base + '&limit=4'
+                while url:
+                    page = self.get(url).data
+                    paged += [(r['id'], r['distance_km']) for r in page['results']]
+                    url = page['next']
+                # ties across page boundaries are neither repeated nor skipped
+                self.assertCountEqual(paged, full)
+                self.assertEqual([d for _, d in paged], [d for _, d in full])
+
+                response = self.get(base + '&output=ndjson&limit=7&fields=id,distance_km')
+                lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+                self.assertEqual([(r['id'], r['distance_km']) for r in lines], full[:7])
+                self.assertEqual(set(lines[0]), {'id', 'distance_km'})
+
+    def test_bad_parameters(self):
+        for query in ['limit=0', 'limit=x', 'limit=100000', 'fields=nope', 'cursor=bogus&limit=2']:
+            with self.subTest(query=query):
+                response = APIClient().get(f'/api/shops/nearby/?lat=10&lng=10&radius=5&{query}')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SHOPS_COMPRESS_MIN_BYTES=0)
+class ConditionalGetTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api, user = self.client_for()
+        self.ids = self.insert_shops([(10 + i / 100, 10) for i in range(30)], vendor_id=user.id)
+        self.coll = Shop._get_collection()
+
+    def test_retrieve_304_through_compression(self):
+        url = f'/api/shops/{self.ids[0]}/'
+        plain = self.api.get(url)
+        self.assertTrue(plain['ETag'].startswith('"'))
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+
+        gzipped = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        # the gzip bytes get a weak tag, which still revalidates either representation
+        self.assertEqual(gzipped['ETag'], 'W/' + plain['ETag'])
+        for etag in (gzipped['ETag'], plain['ETag']):
+            response = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+        self.assertEqual(self.api.get(url, HTTP_IF_MODIFIED_SINCE=plain['Last-Modified']).status_code, 304)
+
+        self.api.patch(url, {'name': 'renamed'}, format='json')
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=gzipped['ETag']).status_code, 200)
+
+    def test_list_304_until_a_write(self):
+        url = '/api/shops/?page_size=20'
+        first = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(self.api.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # another query string is another representation
+        self.assertEqual(self.api.get(url + '&page=2', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.api.patch(f'/api/shops/{self.ids[5]}/', {'name': 'renamed'}, format='json')
+        response = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_sees_a_write_from_another_worker(self):
+        # no shared cache here, so the version comes from the data: a write that
+        # never reached this process's signal receivers still busts the 304
+        url = '/api/shops/'
+        etag = self.api.get(url)['ETag']
+        self.coll.update_one({'_id': ObjectId(self.ids[3])},
+                             {'$set': {'name': 'x', 'updated_at': datetime.now(timezone.utc)}})
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.coll.delete_one({'_id': ObjectId(self.ids[4])})
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
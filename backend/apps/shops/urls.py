@@ -1,7 +1,30 @@
+from django.conf import settings
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
-from .views import ShopViewSet
+from .views import ShopViewSet, HealthView
 
 router = DefaultRouter()
 router.register(r'shops', ShopViewSet, basename='shop')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = [
+    path('health/', HealthView.as_view(), name='health'),
+] + router.urls
+
+if settings.SHOPS_ASYNC_VIEWS:
+    # async read paths in front of the router; anything else falls through to ShopViewSet
+    from . import async_views
+
+    urlpatterns = [
+        re_path(r'^shops/$', async_views.hybrid(
+            async_views.shop_list,
+            ShopViewSet.as_view({'get': 'list', 'post': 'create'}),
+        ), name='shop-list-async'),
+        re_path(r'^shops/nearby/$', async_views.hybrid(
+            async_views.shop_nearby,
+            ShopViewSet.as_view({'get': 'nearby'}, **ShopViewSet.nearby.kwargs),
+        ), name='shop-nearby-async'),
+        re_path(r'^shops/(?P<pk>[0-9a-fA-F]{24})/$', async_views.hybrid(
+            async_views.shop_retrieve,
+            ShopViewSet.as_view({'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
+        ), name='shop-detail-async'),
+    ] + urlpatterns
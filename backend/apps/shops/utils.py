@@ -1,25 +1,52 @@
 import math
-from typing import Tuple
+from typing import Optional, Tuple
+
+_np = False  # numpy module once loaded, None when not installed
 
 EARTH_RADIUS_KM = 6371.0
 
 
+def _numpy():
+    # imported on first use: NumPy is a large share of a cold start and most
+    # requests never rank distances. Optional: batch helpers fall back to the
+    # scalar path without it.
+    global _np
+    if _np is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _np = numpy
+    return _np
+
+
 def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
-    # Approximate degrees per km
-    lat_delta = radius_km / 111.0
-    cos_lat = math.cos(math.radians(lat))
-    # Avoid division by near-zero at the poles
-    if abs(cos_lat) < 1e-6:
-        lon_delta = radius_km / 111.0
-    else:
-        lon_delta = radius_km / (111.320 * cos_lat)
+    """
+    (lat_min, lat_max, lng_min, lng_max) enclosing the query circle. Latitudes
+    are clamped to [-90, 90]; longitudes are not wrapped, so the box may reach
+    past ±180 (see bounding_boxes). A circle around a pole covers every
+    longitude.
+    """
+    delta = radius_km / EARTH_RADIUS_KM  # angular radius
+    lat_delta = math.degrees(delta)
+    lat_min, lat_max = lat - lat_delta, lat + lat_delta
+    if lat_min <= -90.0 or lat_max >= 90.0 or delta >= math.pi / 2:
+        return max(lat_min, -90.0), min(lat_max, 90.0), lng - 180.0, lng + 180.0
+    # widest longitude reached by the circle (not the one at its centre's latitude)
+    lon_delta = math.degrees(math.asin(min(math.sin(delta) / math.cos(math.radians(lat)), 1.0)))
+    return lat_min, lat_max, lng - lon_delta, lng + lon_delta
+
 
-    return (
-        lat - lat_delta,
-        lat + lat_delta,
-        lng - lon_delta,
-        lng + lon_delta,
-    )
+def bounding_boxes(lat: float, lng: float, radius_km: float) -> list:
+    """bounding_box split at the antimeridian: one or two boxes within [-180, 180]."""
+    lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius_km)
+    if lng_max - lng_min >= 360.0:
+        return [(lat_min, lat_max, -180.0, 180.0)]
+    if lng_min < -180.0:
+        return [(lat_min, lat_max, lng_min + 360.0, 180.0), (lat_min, lat_max, -180.0, lng_max)]
+    if lng_max > 180.0:
+        return [(lat_min, lat_max, lng_min, 180.0), (lat_min, lat_max, -180.0, lng_max - 360.0)]
+    return [(lat_min, lat_max, lng_min, lng_max)]
 
 
 def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -27,4 +54,242 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     dlon = math.radians(lon2 - lon1)
     a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return EARTH_RADIUS_KM * c
\ No newline at end of file
+    return EARTH_RADIUS_KM * c
+
+def haversine_batch_km(lat: float, lng: float, lats, lngs,
+                       radius_km: Optional[float] = None, k: Optional[int] = None):
+    """
+    Distances from (lat, lng) to every candidate in `lats`/`lngs`.
+
+    Returns (distances, mask, top): `mask` flags candidates within radius_km
+    (all of them when radius_km is None) and `top` holds the indices of the k
+    nearest masked candidates, nearest first (every masked one when k is None).
+    With NumPy the inputs are taken as contiguous float64 arrays and the
+    results are arrays; without it, plain lists computed with haversine_km.
+    """
+    np = _numpy()
+    if np is None:
+        return _haversine_batch_scalar(lat, lng, lats, lngs, radius_km, k)
+
+    lats = np.ascontiguousarray(lats, dtype=np.float64)
+    lngs = np.ascontiguousarray(lngs, dtype=np.float64)
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = np.sin((phi2 - phi1) / 2)
+    dlmb = np.sin(np.radians(lngs - lng) / 2)
+    a = dphi * dphi + math.cos(phi1) * np.cos(phi2) * dlmb * dlmb
+    a = np.clip(a, 0.0, 1.0)
+    distances = 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    if radius_km is None:
+        mask = np.ones(distances.shape, dtype=bool)
+    else:
+        mask = distances <= radius_km
+    top = np.flatnonzero(mask)
+    if k is not None and k < top.size:
+        if k <= 0:
+            top = top[:0]
+        else:
+            top = top[np.argpartition(distances[top], k - 1)[:k]]
+    top = top[np.argsort(distances[top], kind='stable')]
+    return distances, mask, top
+
+
+def _haversine_batch_scalar(lat, lng, lats, lngs, radius_km, k):
+    distances = [haversine_km(lat, lng, a, b) for a, b in zip(lats, lngs)]
+    mask = [radius_km is None or d <= radius_km for d in distances]
+    top = sorted((i for i, ok in enumerate(mask) if ok), key=distances.__getitem__)
+    if k is not None:
+        top = top[:k]
+    return distances, mask, top
+
+
+def unit_vector(lat: float, lng: float) -> list:
+    """[x, y, z] of the point on the unit sphere; stored on shops as `xyz`."""
+    phi, lmb = math.radians(lat), math.radians(lng)
+    cos_phi = math.cos(phi)
+    return [cos_phi * math.cos(lmb), cos_phi * math.sin(lmb), math.sin(phi)]
+
+
+def chord2_limit(radius_km: float) -> float:
+    """Squared chord length between unit vectors `radius_km` apart on the surface."""
+    chord = 2 * math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2)
+    return chord * chord
+
+
+def chord2_to_km(chord2: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(chord2) / 2, 1.0))
+
+
+def chord_nearest_km(lat: float, lng: float, xyz,
+                     radius_km: Optional[float] = None, k: Optional[int] = None,
+                     min_km: Optional[float] = None):
+    """
+    Nearest candidates by precomputed unit vector (`xyz`, one [x, y, z] per
+    candidate). Filtering and ranking use the squared chord length, which is
+    monotonic in great-circle distance and needs no trig per candidate; only
+    the survivors are converted to km. `min_km` excludes candidates at or
+    inside that distance (the inner edge of a distance ring).
+
+    Returns (top, distances): candidate indices nearest first (at most k) and
+    their distances in km, in the same order.
+    """
+    qx, qy, qz = unit_vector(lat, lng)
+    limit = None if radius_km is None else chord2_limit(radius_km)
+    inner = None if not min_km else chord2_limit(min_km)
+    np = _numpy()
+    if np is None:
+        chord2 = [(x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2 for x, y, z in xyz]
+        top = sorted((i for i, c in enumerate(chord2)
+                      if (limit is None or c <= limit) and (inner is None or c > inner)),
+                     key=chord2.__getitem__)
+        if k is not None:
+            top = top[:k]
+        return top, [chord2_to_km(chord2[i]) for i in top]
+
+    diff = np.asarray(xyz, dtype=np.float64).reshape(-1, 3) - (qx, qy, qz)
+    chord2 = np.einsum('ij,ij->i', diff, diff)
+    mask = np.ones(chord2.shape, dtype=bool) if limit is None else chord2 <= limit
+    if inner is not None:
+        mask &= chord2 > inner
+    top = np.flatnonzero(mask)
+    if k is not None and k < top.size:
+        top = top[np.argpartition(chord2[top], k - 1)[:k]] if k > 0 else top[:0]
+    top = top[np.argsort(chord2[top], kind='stable')]
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(chord2[top]) / 2, 1.0))
+    return top, distances
+
+
+# points x candidates entries per block of the batched kernel (~32 MB of float64)
+BATCH_BLOCK_SIZE = 4_000_000
+
+
+def chord_nearest_km_many(points, xyz, radii, k: Optional[int] = None):
+    """
+    chord_nearest_km for many (lat, lng) query points over the same
+    candidates in one pass: on the unit sphere |p - c|^2 = 2 - 2 p.c, so a
+    block of points gets its squared chords to every candidate from a single
+    matrix product. `radii` holds each point's radius in km.
+
+    Returns one (top, distances) per point, as chord_nearest_km does.
+    """
+    np = _numpy()
+    if np is None or not len(xyz):
+        return [chord_nearest_km(lat, lng, xyz, radius_km=radius, k=k)
+                for (lat, lng), radius in zip(points, radii)]
+
+    candidates = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    queries = np.array([unit_vector(lat, lng) for lat, lng in points], dtype=np.float64).reshape(-1, 3)
+    limits = [chord2_limit(radius) for radius in radii]
+    block = max(BATCH_BLOCK_SIZE // len(candidates), 1)
+    results = []
+    for start in range(0, len(queries), block):
+        chord2 = 2.0 - 2.0 * (queries[start:start + block] @ candidates.T)
+        np.maximum(chord2, 0.0, out=chord2)  # rounding can dip just below zero
+        for row, limit in zip(chord2, limits[start:start + block]):
+            top = np.flatnonzero(row <= limit)
+            if k is not None and k < top.size:
+                top = top[np.argpartition(row[top], k - 1)[:k]] if k > 0 else top[:0]
+            top = top[np.argsort(row[top], kind='stable')]
+            results.append((top, 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(row[top]) / 2, 1.0))))
+    return results
+
+
+def merge_boxes(boxes):
+    """
+    Fewer (lat_min, lat_max, lng_min, lng_max) rectangles covering `boxes`.
+    Two rectangles are merged when their union is no larger than the two of
+    them apart, so overlapping boxes (stops along a route) collapse into one
+    while far-apart ones stay separate queries.
+    """
+    def area(box):
+        return (box[1] - box[0]) * (box[3] - box[2])
+
+    merged = sorted(boxes)
+    while True:
+        result = []
+        for box in merged:
+            for i, other in enumerate(result):
+                union = (min(box[0], other[0]), max(box[1], other[1]),
+                         min(box[2], other[2]), max(box[3], other[3]))
+                if area(union) <= area(box) + area(other):
+                    result[i] = union
+                    break
+            else:
+                result.append(box)
+        if len(result) == len(merged):
+            return result
+        merged = result
+
+
+def geo_point(lat: float, lng: float) -> dict:
+    # GeoJSON orders coordinates as [longitude, latitude]
+    return {'type': 'Point', 'coordinates': [float(lng), float(lat)]}
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 5  # stored geo_cell length, ~4.9 x 4.9 km at the equator
+
+
+def geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch, lng_lo = ch * 2 + 1, mid
+            else:
+                ch, lng_hi = ch * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = ch * 2 + 1, mid
+            else:
+                ch, lat_hi = ch * 2, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bits, ch = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(lat, lng) size in degrees of a geohash cell of the given length."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_cover(lat: float, lng: float, radius_km: float, max_cells: int = 32) -> list:
+    """
+    Geohash cells covering the bounding box of a query circle, at the finest
+    length (up to GEOHASH_PRECISION) that needs no more than `max_cells`.
+    Every stored geo_cell inside the box starts with one of the cells.
+    """
+    lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = geohash_cell_size(precision)
+        rows = math.floor(lat_max / dlat) - math.floor(lat_min / dlat) + 1
+        cols = min(math.floor(lng_max / dlng) - math.floor(lng_min / dlng) + 1, round(360.0 / dlng))
+        if rows * cols <= max_cells:
+            break
+    cells = set()
+    for i in range(rows):
+        cell_lat = min((math.floor(lat_min / dlat) + i + 0.5) * dlat, 90.0)
+        for j in range(cols):
+            cell_lng = (math.floor(lng_min / dlng) + j + 0.5) * dlng
+            cell_lng = (cell_lng + 180.0) % 360.0 - 180.0  # across the antimeridian
+            cells.add(geohash(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+def geo_fields(lat: float, lng: float) -> dict:
+    """Derived geo fields stored next to latitude/longitude on every shop."""
+    return {'location': geo_point(lat, lng), 'geo_cell': geohash(lat, lng), 'xyz': unit_vector(lat, lng)}
+
+
+def business_type_key(business_type: Optional[str]) -> str:
+    """Normalized form of business_type used for exact, index-backed filtering."""
+    return (business_type or '').strip().lower()
@@ -1,33 +1,34 @@
+import logging
+import math
+import os
 from datetime import datetime, timezone
-from bson import ObjectId
-from django.db.models import Q  # just to keep imports stable if needed
-from django.utils.decorators import method_decorator
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
+from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from django_ratelimit.decorators import ratelimit
 from .mongo_models import Shop
-from .serializers import ShopSerializer
-from .permissions import IsOwner  # still used for explicit object checks
-from .utils import bounding_box, haversine_km
-
-
-def _to_dict(doc: Shop, include_distance=False):
-    data = {
-        'id': str(doc.id),
-        'vendor_id': doc.vendor_id,
-        'name': doc.name,
-        'owner_name': doc.owner_name,
-        'business_type': doc.business_type or '',
-        'latitude': float(doc.latitude),
-        'longitude': float(doc.longitude),
-        'created_at': doc.created_at,
-        'updated_at': doc.updated_at,
-    }
-    if include_distance and hasattr(doc, 'distance_km'):
-        data['distance_km'] = doc.distance_km
-    return data
+from .serializers import ShopSerializer, shop_to_dict, row_to_dict
+from .permissions import ops_allowed
+from . import db
+from .bulk import parse_ndjson, parse_csv, import_rows, export_ndjson, export_csv
+from .instrumentation import phase
+from .nearby import (TooManyCandidates, get_engine, nearby_batch_params, nearby_params, ndjson_lines, search_many,
+                     select_fields)
+from .nearby_cache import cached_search
+from .conditional import is_not_modified, list_etag, list_version, not_modified
+from .counts import count_mode, estimated_count, EXACT, ESTIMATED
+from .queries import business_type_keys, shop_list_filter, fetch_page
+from .pings import CONFLICT, UNAVAILABLE, get_buffer, queue_ping
+from .pagination import InvalidCursor, NEWEST_FIRST, keyset_query, page_params, split_page, page_links, nearby_links
+from .signals import shop_saved, shop_deleted
+from .stats import get_stats
+from .writes import (DETAILS, WRITE_PROJECTION, PreconditionFailed, delete_shop, miss_status,
+                     object_id, preconditions, update_shop, validators)
+
+logger = logging.getLogger(__name__)
 
 
 class ShopViewSet(viewsets.ViewSet):
@@ -35,26 +36,74 @@ class ShopViewSet(viewsets.ViewSet):
     MongoEngine-backed ViewSet.
     """
     permission_classes = [IsAuthenticated]
+    # quotas per scope: settings.SHOPS_RATE_LIMITS (see ratelimit.py)
+    throttle_scopes = {
+        'list': 'shops.list',
+        'retrieve': 'shops.retrieve',
+        'create': 'shops.write',
+        'update': 'shops.write',
+        'partial_update': 'shops.write',
+        'destroy': 'shops.write',
+        'bulk_import': 'shops.import',
+        'bulk_export': 'shops.export',
+        'nearby': 'shops.nearby',
+        'nearby_batch': 'shops.nearby_batch',
+        'location': 'shops.location',
+        'stats': 'shops.stats',
+    }
 
     def list(self, request):
         vendor_id = request.user.id
-        qs = Shop.objects(vendor_id=vendor_id).order_by('-created_at')
-        bt = request.query_params.get('business_type')
-        if bt:
-            qs = qs.filter(business_type__iexact=bt)
-        # simple manual pagination compatible with DRF settings
-        page_size = int(request.query_params.get('page_size') or 20)
-        page = int(request.query_params.get('page') or 1)
-        total = qs.count()
-        start = (page - 1) * page_size
-        end = start + page_size
-        items = [ _to_dict(doc) for doc in qs[start:end] ]
+        # answered from the vendor's list version alone when the client is current
+        etag = list_etag(list_version(vendor_id), request.META)
+        if is_not_modified(request.META, etag):
+            return not_modified({'ETag': etag})
+        types = business_type_keys(request.query_params.getlist('business_type'))
+        query = shop_list_filter(vendor_id, types)
+        page, page_size = page_params(request.query_params)
+        cursor = request.query_params.get('cursor')
+        use_cursor = cursor is not None or settings.SHOPS_LIST_PAGINATION == 'cursor'
+        try:
+            mode = count_mode(request.query_params.get('count'), ESTIMATED if use_cursor else EXACT)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+
+        if use_cursor:
+            # keyset pagination on (created_at, _id): every page costs the same as page 1
+            try:
+                boundary, sort, direction = keyset_query(cursor)
+            except InvalidCursor as e:
+                return Response({'detail': str(e)}, status=400)
+            skip, limit = 0, page_size + 1
+        else:
+            # simple manual pagination compatible with DRF settings
+            boundary, sort, direction = None, NEWEST_FIRST, None
+            skip, limit = (page - 1) * page_size, page_size
+
+        # lean read path: projected raw rows, no Document hydration
+        coll = Shop._get_collection()
+        with phase('fetch'):
+            rows, total = fetch_page(coll, query, sort, boundary, skip, limit, with_count=mode == EXACT)
+        if mode == ESTIMATED:
+            with phase('count'):
+                total = estimated_count(
+                    vendor_id, types,
+                    lambda key: coll.count_documents(shop_list_filter(vendor_id, [key] if key else None)),
+                )
+
+        next_url = previous_url = None
+        if use_cursor:
+            rows, has_next, has_previous = split_page(rows, page_size, direction)
+        with phase('serialize'):
+            items = [ row_to_dict(row) for row in rows ]
+        if use_cursor:
+            next_url, previous_url = page_links(request, items, has_next, has_previous)
         return Response({
             'count': total,
-            'next': None,  # keep minimal; can compute URLs if needed
-            'previous': None,
+            'next': next_url,
+            'previous': previous_url,
             'results': items,
-        })
+        }, headers={'ETag': etag})
 
     def create(self, request):
         serializer = ShopSerializer(data=request.data)
@@ -70,87 +119,198 @@ class ShopViewSet(viewsets.ViewSet):
             created_at=now,
             updated_at=now,
         ).save()
-        return Response(_to_dict(doc), status=status.HTTP_201_CREATED)
+        data = shop_to_dict(doc)
+        shop_saved.send(sender=Shop, shop=data, previous=None)
+        return Response(data, status=status.HTTP_201_CREATED, headers=validators(data))
 
     def retrieve(self, request, pk=None):
-        try:
-            doc = Shop.objects.get(id=ObjectId(pk))
-        except Exception:
-            return Response({'detail': 'Not found'}, status=404)
-        if doc.vendor_id != request.user.id:
-            return Response({'detail': 'Forbidden'}, status=403)
-        return Response(_to_dict(doc))
+        _id = object_id(pk)
+        coll = Shop._get_collection()
+        row = coll.find_one({'_id': _id, 'vendor_id': request.user.id}, WRITE_PROJECTION) if _id else None
+        if row is None:
+            return self._miss(coll, pk, request.user.id)
+        headers = validators(row)
+        if is_not_modified(request.META, headers['ETag'], row['updated_at']):
+            return not_modified(headers)
+        return Response(row_to_dict(row), headers=headers)
 
     def update(self, request, pk=None):
-        try:
-            doc = Shop.objects.get(id=ObjectId(pk))
-        except Exception:
-            return Response({'detail': 'Not found'}, status=404)
-        if doc.vendor_id != request.user.id:
-            return Response({'detail': 'Forbidden'}, status=403)
-        serializer = ShopSerializer(data=request.data, partial=False)
-        serializer.is_valid(raise_exception=True)
-        for f in ['name', 'owner_name', 'business_type', 'latitude', 'longitude']:
-            setattr(doc, f, serializer.validated_data.get(f, getattr(doc, f)))
-        doc.updated_at = datetime.now(timezone.utc)
-        doc.save()
-        return Response(_to_dict(doc))
+        return self._write(request, pk, partial=False)
 
     def partial_update(self, request, pk=None):
-        try:
-            doc = Shop.objects.get(id=ObjectId(pk))
-        except Exception:
-            return Response({'detail': 'Not found'}, status=404)
-        if doc.vendor_id != request.user.id:
-            return Response({'detail': 'Forbidden'}, status=403)
-        serializer = ShopSerializer(data=request.data, partial=True)
+        return self._write(request, pk, partial=True)
+
+    def _write(self, request, pk, partial):
+        # ownership, preconditions and the $set in one find_one_and_update (see writes.py)
+        serializer = ShopSerializer(data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        for f, v in serializer.validated_data.items():
-            if f in ['name', 'owner_name', 'business_type', 'latitude', 'longitude']:
-                setattr(doc, f, v)
-        doc.updated_at = datetime.now(timezone.utc)
-        doc.save()
-        return Response(_to_dict(doc))
+        coll = Shop._get_collection()
+        try:
+            conditions = preconditions(request.headers)
+        except PreconditionFailed:
+            return self._miss(coll, pk, request.user.id)
+        with phase('write'):
+            result = update_shop(coll, pk, request.user.id, serializer.validated_data, conditions)
+        if result is None:
+            return self._miss(coll, pk, request.user.id)
+        previous, row = result
+        data = row_to_dict(row)
+        shop_saved.send(sender=Shop, shop=data, previous=row_to_dict(previous))
+        return Response(data, headers=validators(row))
 
     def destroy(self, request, pk=None):
+        coll = Shop._get_collection()
         try:
-            doc = Shop.objects.get(id=ObjectId(pk))
-        except Exception:
-            return Response({'detail': 'Not found'}, status=404)
-        if doc.vendor_id != request.user.id:
-            return Response({'detail': 'Forbidden'}, status=403)
-        doc.delete()
+            conditions = preconditions(request.headers)
+        except PreconditionFailed:
+            return self._miss(coll, pk, request.user.id)
+        with phase('write'):
+            row = delete_shop(coll, pk, request.user.id, conditions)
+        if row is None:
+            return self._miss(coll, pk, request.user.id)
+        shop_deleted.send(sender=Shop, shop=row_to_dict(row))
         return Response(status=204)
 
-    @method_decorator(ratelimit(key='ip', rate='30/m', block=True))
+    def _miss(self, coll, pk, vendor_id):
+        code = miss_status(coll, pk, vendor_id)
+        return Response({'detail': DETAILS[code]}, status=code)
+
+    @action(detail=True, methods=['post'], url_path='location')
+    def location(self, request, pk=None):
+        """
+        POST /api/shops/{id}/location/ {"latitude", "longitude"}: 202 once the
+        position is buffered; it is written with the next flush (see pings.py).
+        204 when SHOPS_PING_WRITE_THROUGH writes it before responding.
+        """
+        try:
+            code = queue_ping(pk, request.user.id, request.data)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        if code in DETAILS:
+            return Response({'detail': DETAILS[code]}, status=code)
+        if code == UNAVAILABLE:
+            return Response({'detail': 'Too many pending location updates; retry shortly.'}, status=503,
+                            headers={'Retry-After': str(math.ceil(settings.SHOPS_PING_FLUSH_SECONDS))})
+        if code == CONFLICT:
+            return Response({'detail': 'The shop changed while its location was written; send the next ping.'},
+                            status=409)
+        return Response(status=code)
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def stats(self, request):
+        """
+        GET /api/shops/stats/: the vendor's shop total, counts per business
+        type and bounding extent, from one precomputed document (see stats.py).
+        """
+        return Response(get_stats(request.user.id))
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        POST /api/shops/import/ with an NDJSON (application/x-ndjson) or CSV
+        (text/csv, header row required) body, one shop per line.
+        """
+        content_type = (request.content_type or '').split(';')[0].strip()
+        if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+            rows = parse_ndjson(request.stream or [])
+        elif content_type == 'text/csv':
+            rows = parse_csv(request.stream or [])
+        else:
+            return Response({'detail': 'Send application/x-ndjson or text/csv.'}, status=415)
+
+        inserted, errors = import_rows(
+            request.user.id, rows,
+            chunk_size=settings.SHOPS_BULK_CHUNK_SIZE,
+            max_rows=settings.SHOPS_BULK_MAX_ROWS,
+        )
+        if errors and not inserted:
+            code = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_201_CREATED
+        return Response({'inserted': inserted, 'errors': errors}, status=code)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def bulk_export(self, request):
+        """GET /api/shops/export/?output=ndjson|csv, streamed."""
+        output = request.query_params.get('output', 'ndjson')
+        if output == 'csv':
+            response = StreamingHttpResponse(export_csv(request.user.id), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="shops.csv"'
+        elif output == 'ndjson':
+            response = StreamingHttpResponse(export_ndjson(request.user.id), content_type='application/x-ndjson')
+        else:
+            return Response({'detail': 'output must be ndjson or csv.'}, status=400)
+        return response
+
     @action(detail=False, methods=['get'], url_path='nearby', permission_classes=[AllowAny])
     def nearby(self, request):
         # read & validate inputs
         try:
-            lat = float(request.query_params.get('lat'))
-            lng = float(request.query_params.get('lng'))
-        except (TypeError, ValueError):
-            return Response({'detail': 'lat and lng are required float query params.'}, status=400)
+            params = nearby_params(request.query_params)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        lat, lng, radius_km = params['lat'], params['lng'], params['radius_km']
+        limit, after, fields = params['limit'], params['after'], params['fields']
+
+        engine = get_engine()
+        if params['output'] == 'ndjson':
+            if settings.SHOPS_NEARBY_CACHE:
+                rows = cached_search(engine, lat, lng, radius_km, limit, after)
+            else:
+                rows = engine.iter_search(lat, lng, radius_km, limit, after)
+            return StreamingHttpResponse(ndjson_lines(rows, fields), content_type='application/x-ndjson')
+
+        # one extra row tells whether there is a next page
+        fetch = limit + 1 if limit is not None else None
+        if settings.SHOPS_NEARBY_CACHE:
+            data = cached_search(engine, lat, lng, radius_km, fetch, after)
+        else:
+            data = engine.search(lat, lng, radius_km, fetch, after)
+        if not params['paged']:
+            return Response(select_fields(data, fields), status=200)
+        has_next = limit is not None and len(data) > limit
+        data = data[:limit]
+        next_url = nearby_links(request, (lat, lng, radius_km), data, has_next, after)
+        return Response({'next': next_url, 'results': select_fields(data, fields)}, status=200)
 
-        radius_km = request.query_params.get('radius', 5)
+
+    @action(detail=False, methods=['post'], url_path='nearby/batch', permission_classes=[AllowAny])
+    def nearby_batch(self, request):
+        """
+        POST /api/shops/nearby/batch/ with {"points": [{"lat", "lng", "radius"}, ...],
+        "limit", "fields"}: one nearby result list per point, in order, from a
+        single candidate fetch (see nearby.search_many).
+        """
         try:
-            radius_km = float(radius_km)
-        except ValueError:
-            return Response({'detail': 'radius must be a float.'}, status=400)
-
-        # bounding box prefilter
-        lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius_km)
-        candidates = Shop.objects(
-            latitude__gte=lat_min, latitude__lte=lat_max,
-            longitude__gte=lng_min, longitude__lte=lng_max
-        )
+            params = nearby_batch_params(request.data)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        try:
+            results = search_many(get_engine(), params['points'], params['limit'],
+                                  max_candidates=settings.SHOPS_NEARBY_BATCH_MAX_CANDIDATES)
+        except TooManyCandidates as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response({'results': [select_fields(found, params['fields']) for found in results]})
+
+class HealthView(APIView):
+    """
+    GET /api/health/ -> whether Mongo answers a ping; 503 when it doesn't.
+    Operators (permissions.ops_allowed) also get the round-trip latency and
+    this worker's connection pool and location buffer stats. Errors are
+    logged, never returned.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
 
-        results = []
-        for doc in candidates:
-            d = haversine_km(lat, lng, float(doc.latitude), float(doc.longitude))
-            if d <= radius_km:
-                doc.distance_km = round(d, 3)
-                results.append(doc)
-        results.sort(key=lambda s: getattr(s, 'distance_km', 0.0))
-        data = [_to_dict(doc, include_distance=True) for doc in results]
-        return Response(data, status=200)
\ No newline at end of file
+    def get(self, request):
+        try:
+            mongo, code = {'ok': True, 'ping_ms': db.ping()}, 200
+        except Exception:
+            logger.exception('Health check: Mongo ping failed')
+            mongo, code = {'ok': False}, 503
+        if not ops_allowed(request):
+            return Response({'mongo': {'ok': mongo['ok']}}, status=code)
+        data = {'pid': os.getpid(), 'pool': db.pool_stats.snapshot(), 'pings': get_buffer().snapshot(), 'mongo': mongo}
+        return Response(data, status=code)
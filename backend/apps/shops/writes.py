@@ -0,0 +1,164 @@
+"""
+Single-round-trip, ownership-scoped shop writes.
+
+The owner is part of the filter ({_id, vendor_id}), so an update or delete
+either hits the vendor's own shop or nothing; only when nothing matched is
+the shop looked up again to tell 404 from 403 (or 412). Updates `$set` just
+the fields in the request, their derived fields, `updated_at` and a `$inc`
+of `version`, and get the pre-image back from the same find_one_and_update;
+the post-image is that row with the update applied. Concurrent editors of
+different fields therefore no longer overwrite each other.
+
+Optimistic concurrency: responses carry `ETag: "<version>"` and
+`Last-Modified`; a write sent with `If-Match` and/or `If-Unmodified-Since`
+only applies while the shop is still at that version / unmodified since
+then, and gets 412 otherwise.
+"""
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.utils.http import http_date, parse_http_date_safe
+from pymongo import ReturnDocument
+
+from .serializers import READ_PROJECTION
+from .utils import business_type_key, geo_fields
+
+WRITABLE_FIELDS = ('name', 'owner_name', 'business_type', 'latitude', 'longitude')
+WRITE_PROJECTION = dict(READ_PROJECTION, version=1)
+
+NOT_FOUND, FORBIDDEN, PRECONDITION_FAILED = 404, 403, 412
+DETAILS = {NOT_FOUND: 'Not found', FORBIDDEN: 'Forbidden', PRECONDITION_FAILED: 'Precondition failed'}
+
+
+class PreconditionFailed(Exception):
+    pass
+
+
+def object_id(pk):
+    """ObjectId of a URL pk, or None when it can't be one."""
+    try:
+        return ObjectId(pk)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _utc(dt):
+    # rows come back naive (UTC) from the driver
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def validators(row):
+    """ETag / Last-Modified headers for a shop row."""
+    return {
+        'ETag': f'"{row.get("version") or 0}"',
+        'Last-Modified': http_date(_utc(row['updated_at']).timestamp()),
+    }
+
+
+def preconditions(headers):
+    """
+    Filter conditions for If-Match / If-Unmodified-Since (HTTP semantics:
+    second precision dates, `*` matches any existing shop). Raises
+    PreconditionFailed for a header that can never match.
+    """
+    conditions = {}
+    if_match = headers.get('If-Match')
+    if if_match and if_match.strip() != '*':
+        versions = []
+        for tag in if_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):  # only because compression weakened our own tag
+                tag = tag[2:]
+            try:
+                versions.append(int(tag.strip('"')))
+            except ValueError:
+                continue
+        if not versions:
+            raise PreconditionFailed()
+        # shops written before versioning have no field yet, i.e. version 0
+        conditions['$or'] = [{'version': {'$in': versions}}] + (
+            [{'version': None}] if 0 in versions else []
+        )
+    since = headers.get('If-Unmodified-Since')
+    timestamp = parse_http_date_safe(since) if since else None
+    if timestamp is not None:
+        # unmodified since T: last modified before the end of that second
+        limit = datetime.fromtimestamp(timestamp, tz=timezone.utc) + timedelta(seconds=1)
+        conditions['updated_at'] = {'$lt': limit.replace(tzinfo=None)}
+    return conditions
+
+
+def changes_for(data, current=None):
+    """
+    $set document for validated `data`: the written fields plus the fields
+    derived from them. `current` supplies the other coordinate when only one
+    of latitude/longitude is written.
+    """
+    changes = {f: data[f] for f in WRITABLE_FIELDS if f in data}
+    if 'business_type' in changes:
+        changes['business_type_key'] = business_type_key(changes['business_type'])
+    if 'latitude' in changes or 'longitude' in changes:
+        lat = changes.get('latitude', current and current['latitude'])
+        lng = changes.get('longitude', current and current['longitude'])
+        changes.update(geo_fields(lat, lng))
+    now = datetime.now(timezone.utc)
+    changes['updated_at'] = now.replace(microsecond=now.microsecond // 1000 * 1000)  # stored as ms
+    return changes
+
+
+def update_shop(coll, pk, vendor_id, data, conditions=None, attempts=3):
+    """
+    Applies validated `data` to the vendor's shop in one round trip.
+    Returns (previous, row), raw rows before/after, or None when nothing
+    matched (see miss_status).
+    """
+    _id = object_id(pk)
+    if _id is None:
+        return None
+    query = {'_id': _id, 'vendor_id': vendor_id, **(conditions or {})}
+    for _ in range(attempts):
+        current = None
+        if ('latitude' in data) != ('longitude' in data):
+            # derived geo fields need both coordinates: read the other one and
+            # only write while it is still the same
+            current = coll.find_one(query, {'latitude': 1, 'longitude': 1})
+            if current is None:
+                return None
+        changes = changes_for(data, current)
+        guard = dict(query)
+        if current is not None:
+            kept = 'longitude' if 'latitude' in data else 'latitude'
+            guard[kept] = current[kept]
+        previous = coll.find_one_and_update(
+            guard, {'$set': changes, '$inc': {'version': 1}},
+            projection=WRITE_PROJECTION, return_document=ReturnDocument.BEFORE,
+        )
+        if previous is not None:
+            row = dict(previous, **{f: v for f, v in changes.items() if f in WRITE_PROJECTION})
+            row['version'] = (previous.get('version') or 0) + 1
+            return previous, row
+        if current is None:
+            return None
+        # the other coordinate moved in between; go again
+    return None
+
+
+def delete_shop(coll, pk, vendor_id, conditions=None):
+    """Deletes the vendor's shop; the deleted row, or None when nothing matched."""
+    _id = object_id(pk)
+    if _id is None:
+        return None
+    return coll.find_one_and_delete({'_id': _id, 'vendor_id': vendor_id, **(conditions or {})},
+                                    projection=WRITE_PROJECTION)
+
+
+def miss_status(coll, pk, vendor_id):
+    """Why an ownership-scoped write matched nothing: 404, 403 or 412."""
+    _id = object_id(pk)
+    row = coll.find_one({'_id': _id}, {'vendor_id': 1}) if _id is not None else None
+    if row is None:
+        return NOT_FOUND
+    if row['vendor_id'] != vendor_id:
+        return FORBIDDEN
+    return PRECONDITION_FAILED
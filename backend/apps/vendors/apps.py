@@ -5,4 +5,6 @@ class VendorsConfig(AppConfig):
     name = 'apps.vendors'
 
     def ready(self):
-        from . import signals  # noqa
\ No newline at end of file
+        from . import signals  # noqa
+        from .authentication import check_revocation_store
+        check_revocation_store()
\ No newline at end of file
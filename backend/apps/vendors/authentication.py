@@ -0,0 +1,112 @@
+"""
+Stateless JWT authentication for the hot API paths.
+
+The stock JWTAuthentication loads the User row on every request; the shop
+views only need the vendor id, which is already in the signed token. This
+backend verifies the signature/expiry and builds a VendorTokenUser from the
+claims, so no relational query is made. Users that are deactivated or
+deleted are written to a revocation list (see signals.py) and rejected until
+their outstanding access tokens expire.
+
+The list lives in its own cache (JWT_REVOCATION_CACHE_URL), which must be
+shared by every worker. Without one, or while it is unreachable, the users
+table is asked instead: at most one query per user per
+JWT_REVOCATION_CHECK_TTL seconds in each worker.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# user_id -> (revoked, checked_at); spares a cache round trip per request
+_recent = {}
+
+
+def _revoked_key(user_id):
+    return f"vendors:revoked:{user_id}"
+
+
+def _cache():
+    """The revocation cache, or None when the users table is the source."""
+    alias = settings.JWT_REVOCATION_CACHE
+    return caches[alias] if alias else None
+
+
+def check_revocation_store():
+    """Refuses a per-process revocation cache behind several workers."""
+    cache = _cache()
+    if (settings.JWT_CHECK_REVOCATION and settings.WEB_CONCURRENCY > 1
+            and isinstance(cache, (LocMemCache, DummyCache))):
+        raise ImproperlyConfigured(
+            "JWT_REVOCATION_CACHE_URL is process-local but WEB_CONCURRENCY > 1: a revocation "
+            "would only reach one worker. Point it at a shared cache or leave it unset."
+        )
+
+
+def revoke_user(user_id):
+    cache = _cache()
+    if cache is not None:
+        # tokens issued before this point are dead once ACCESS_TOKEN_LIFETIME passes
+        timeout = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        cache.set(_revoked_key(user_id), True, timeout)
+    _recent.pop(user_id, None)
+
+
+def unrevoke_user(user_id):
+    cache = _cache()
+    if cache is not None:
+        cache.delete(_revoked_key(user_id))
+    _recent.pop(user_id, None)
+
+
+def _revoked_in_db(user_id):
+    return not get_user_model().objects.filter(pk=user_id, is_active=True).exists()
+
+
+def is_revoked(user_id):
+    now = time.monotonic()
+    hit = _recent.get(user_id)
+    if hit is not None and now - hit[1] < settings.JWT_REVOCATION_CHECK_TTL:
+        return hit[0]
+    cache = _cache()
+    if cache is None:
+        revoked = _revoked_in_db(user_id)
+    else:
+        try:
+            revoked = bool(cache.get(_revoked_key(user_id)))
+        except Exception:
+            # never fail open: fall back to the users table
+            logger.warning('Revocation cache unavailable; checking user %s in the database', user_id, exc_info=True)
+            revoked = _revoked_in_db(user_id)
+    if len(_recent) > 10000:
+        _recent.clear()
+    _recent[user_id] = (revoked, now)
+    return revoked
+
+
+class VendorTokenUser(TokenUser):
+    """TokenUser whose id is the integer Django User.id used as vendor_id."""
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if settings.JWT_CHECK_REVOCATION and is_revoked(user.id):
+            raise AuthenticationFailed('User is inactive or deleted.', code='user_inactive')
+        return user
@@ -1,9 +1,26 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from .authentication import revoke_user, unrevoke_user
 from .models import Profile
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance, is_vendor=True)
\ No newline at end of file
+        Profile.objects.create(user=instance, is_vendor=True)
+
+
+@receiver(post_save, sender=User)
+def sync_revocation(sender, instance, created, **kwargs):
+    # stateless JWT auth never reads the User row, so tell it about deactivation
+    if created:
+        return
+    if instance.is_active:
+        unrevoke_user(instance.id)
+    else:
+        revoke_user(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user(sender, instance, **kwargs):
+    revoke_user(instance.id)
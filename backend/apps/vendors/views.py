@@ -3,6 +3,7 @@ from rest_framework import status
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 from .serializers import RegisterSerializer
 
@@ -14,6 +15,7 @@ class RegisterView(CreateAPIView):
     """
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'auth.register'
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -33,3 +35,8 @@ class RegisterView(CreateAPIView):
                 {"detail": "Username or email already exists."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+
+class LoginView(TokenObtainPairView):
+    """POST /api/auth/login/ -> JWT pair; simplejwt's view with a rate-limit scope."""
+    throttle_scope = 'auth.login'
@@ -0,0 +1,81 @@
+"""
+Micro-benchmarks for the nearby/list hot paths. From backend/:
+
+    pytest benchmarks/ --benchmark-json=bench.json
+"""
+import pytest
+from rest_framework.renderers import JSONRenderer
+
+from apps.shops.mongo_models import Shop
+from apps.shops.renderers import ORJSONRenderer
+from apps.shops.serializers import row_to_dict, shop_to_dict
+from apps.shops.utils import (bounding_box, chord_nearest_km, chord_nearest_km_many, haversine_km,
+                              haversine_batch_km)
+
+LAT, LNG = 28.6139, 77.2090
+
+
+def test_haversine_km(benchmark):
+    benchmark(haversine_km, LAT, LNG, 28.70, 77.10)
+
+
+def test_haversine_km_loop_10k(benchmark, rows):
+    lats = [r['latitude'] for r in rows]
+    lngs = [r['longitude'] for r in rows]
+    benchmark(lambda: [haversine_km(LAT, LNG, a, b) for a, b in zip(lats, lngs)])
+
+
+def test_haversine_batch_km_10k(benchmark, rows):
+    lats = [r['latitude'] for r in rows]
+    lngs = [r['longitude'] for r in rows]
+    benchmark(haversine_batch_km, LAT, LNG, lats, lngs, 5.0, 50)
+
+
+def test_chord_nearest_km_10k(benchmark, rows):
+    xyz = [r['xyz'] for r in rows]
+    benchmark(chord_nearest_km, LAT, LNG, xyz, 5.0, 50)
+
+
+def test_chord_nearest_km_100_points_loop_10k(benchmark, rows):
+    xyz = [r['xyz'] for r in rows]
+    points = [(LAT + i * 0.001, LNG) for i in range(100)]
+    benchmark(lambda: [chord_nearest_km(lat, lng, xyz, 5.0, 10) for lat, lng in points])
+
+
+def test_chord_nearest_km_many_100_points_10k(benchmark, rows):
+    xyz = [r['xyz'] for r in rows]
+    points = [(LAT + i * 0.001, LNG) for i in range(100)]
+    benchmark(chord_nearest_km_many, points, xyz, [5.0] * 100, 10)
+
+
+def test_bounding_box(benchmark):
+    benchmark(bounding_box, LAT, LNG, 5.0)
+
+
+def test_shop_to_dict_hydrated(benchmark, rows):
+    benchmark(lambda: shop_to_dict(Shop._from_son(rows[0])))
+
+
+def test_shop_to_dict_prebuilt_doc(benchmark, rows):
+    doc = Shop._from_son(rows[0])
+    benchmark(shop_to_dict, doc)
+
+
+def test_row_to_dict(benchmark, rows):
+    benchmark(row_to_dict, rows[0])
+
+
+def _nearby_payload(rows, n):
+    return [dict(row_to_dict(row), distance_km=round(i * 0.001, 3)) for i, row in enumerate(rows[:n])]
+
+
+@pytest.mark.parametrize('n', [1000, 10000])
+def test_render_nearby_drf_json(benchmark, rows, n):
+    payload = _nearby_payload(rows, n)
+    benchmark(JSONRenderer().render, payload)
+
+
+@pytest.mark.parametrize('n', [1000, 10000])
+def test_render_nearby_orjson(benchmark, rows, n):
+    payload = _nearby_payload(rows, n)
+    benchmark(ORJSONRenderer().render, payload)
@@ -0,0 +1,101 @@
+"""
+Cold-start profile of the API: a fresh interpreter boots Django and serves one
+request (the `/` redirect, which loads the settings, every app, the middleware
+and the whole URLconf with its views), under `python -X importtime`.
+
+Reports the wall time of that boot, the import time per top-level package and
+the slowest modules, and fails when the boot goes over the budget. From
+backend/:
+
+    python -m benchmarks.cold_start                      # API_ONLY=True, as on serverless
+    python -m benchmarks.cold_start --full --top 30      # with admin/sessions/browsable API
+    python -m benchmarks.cold_start --budget-ms 600 --out cold_start.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from .common import BACKEND_DIR
+
+# Target for a serverless cold start (import + first request), API_ONLY on.
+DEFAULT_BUDGET_MS = float(os.environ.get('COLD_START_BUDGET_MS', 750))
+
+BOOT = '''
+import io, sys, time
+started = time.perf_counter()
+from project.wsgi import application
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+}
+status = []
+b''.join(application(environ, lambda s, h, exc_info=None: status.append(s)))
+assert status[0].startswith('302'), status
+print((time.perf_counter() - started) * 1000)
+'''
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from `-X importtime` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def profile(api_only=True):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='project.settings', MONGODB_URI='',
+               API_ONLY=str(api_only))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = parse_importtime(proc.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split('.')[0]] += self_us
+    return {
+        'api_only': api_only,
+        'boot_ms': round(float(proc.stdout.strip().splitlines()[-1]), 1),
+        'import_ms': round(sum(m[1] for m in modules) / 1000, 1),
+        'modules': len(modules),
+        'packages_ms': {k: round(v / 1000, 1) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])},
+        'slowest_ms': [(name, round(cum / 1000, 1)) for name, _, cum in sorted(modules, key=lambda m: -m[2])],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='profile the default (non API_ONLY) configuration')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--repeat', type=int, default=3, help='boots to run; the fastest is reported')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--out', help='write the report as JSON')
+    args = parser.parse_args()
+
+    report = min((profile(api_only=not args.full) for _ in range(args.repeat)), key=lambda r: r['boot_ms'])
+    report['budget_ms'] = args.budget_ms
+    print(f"boot + first request: {report['boot_ms']} ms (budget {args.budget_ms} ms), "
+          f"imports: {report['import_ms']} ms over {report['modules']} modules")
+    print('\nby package (self time):')
+    for name, ms in list(report['packages_ms'].items())[:args.top]:
+        print(f'  {ms:8.1f} ms  {name}')
+    print('\nslowest modules (cumulative):')
+    for name, ms in report['slowest_ms'][:args.top]:
+        print(f'  {ms:8.1f} ms  {name}')
+    if args.out:
+        report['slowest_ms'] = report['slowest_ms'][:100]
+        with open(args.out, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    if report['boot_ms'] > args.budget_ms:
+        sys.exit(f"cold start over budget: {report['boot_ms']} ms > {args.budget_ms} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Shared setup for the benchmark scripts: Django settings plus a MongoEngine
+connection to either mongomock (default, in-process) or a real mongod.
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def setup_django(mongo_uri=None):
+    """Configure Django and point the default MongoEngine alias at the target."""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    # keep the app from registering the configured (production) MONGODB_URI
+    os.environ['MONGODB_URI'] = ''
+
+    import django
+    django.setup()
+
+    import mongoengine as me
+    me.disconnect_all()
+    if mongo_uri:
+        me.connect(host=mongo_uri, alias='default')
+    else:
+        import mongomock
+        me.connect('benchmarks', host='mongodb://localhost', alias='default',
+                   mongo_client_class=mongomock.MongoClient)
+
+
+def access_token(vendor_id):
+    """Signed access token for `vendor_id`, made without touching the User table."""
+    from rest_framework_simplejwt.tokens import AccessToken
+    from rest_framework_simplejwt.settings import api_settings
+
+    token = AccessToken()
+    token[api_settings.USER_ID_CLAIM] = vendor_id
+    return str(token)
@@ -0,0 +1,16 @@
+import pytest
+from bson import ObjectId
+
+from .common import setup_django
+
+setup_django()
+
+
+@pytest.fixture(scope='session')
+def rows():
+    from .dataset import generate
+
+    docs = list(generate(10000, seed=7))
+    for doc in docs:
+        doc['_id'] = ObjectId()
+    return docs
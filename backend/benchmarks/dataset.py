@@ -0,0 +1,89 @@
+"""
+Synthetic shop dataset: shops clustered around real city centres with a
+gaussian spread, spread over a configurable number of vendors.
+
+    python -m benchmarks.dataset --shops 100000                      # mongomock (dry run)
+    python -m benchmarks.dataset --shops 10000000 --mongo-uri mongodb://localhost/bench
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+# (name, lat, lng, weight, spread in degrees)
+CITIES = [
+    ('Delhi', 28.6139, 77.2090, 10, 0.15),
+    ('Mumbai', 19.0760, 72.8777, 9, 0.10),
+    ('Bengaluru', 12.9716, 77.5946, 7, 0.12),
+    ('Kolkata', 22.5726, 88.3639, 5, 0.10),
+    ('Chennai', 13.0827, 80.2707, 5, 0.10),
+    ('Hyderabad', 17.3850, 78.4867, 5, 0.12),
+    ('Pune', 18.5204, 73.8567, 3, 0.08),
+    ('Jaipur', 26.9124, 75.7873, 2, 0.07),
+]
+BUSINESS_TYPES = ['grocery', 'Cafe', 'restaurant', 'Pharmacy', 'electronics', 'bakery', 'salon', '']
+
+
+def generate(n, vendors=1000, seed=42):
+    """Yields `n` raw shop documents (including derived geo fields)."""
+    from apps.shops.utils import business_type_key, geo_fields
+
+    rng = random.Random(seed)
+    weights = [c[3] for c in CITIES]
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    for i in range(n):
+        _, lat0, lng0, _, spread = rng.choices(CITIES, weights)[0]
+        lat = max(-90.0, min(90.0, rng.gauss(lat0, spread)))
+        lng = max(-180.0, min(180.0, rng.gauss(lng0, spread)))
+        bt = rng.choice(BUSINESS_TYPES)
+        created = start + timedelta(seconds=i * 31_536_000 / max(n, 1))
+        yield {
+            'vendor_id': rng.randint(1, vendors),
+            'name': f'Shop {i}',
+            'owner_name': f'Owner {i % 9973}',
+            'business_type': bt,
+            'business_type_key': business_type_key(bt),
+            'latitude': lat,
+            'longitude': lng,
+            **geo_fields(lat, lng),
+            'created_at': created,
+            'updated_at': created,
+        }
+
+
+def seed(n, vendors=1000, batch_size=10000, drop=True, seed=42):
+    """Bulk-load `n` shops into the Shop collection; returns seconds taken."""
+    from apps.shops.mongo_models import Shop
+
+    coll = Shop._get_collection()
+    if drop:
+        coll.delete_many({})
+    Shop.ensure_indexes()
+    started = time.perf_counter()
+    batch = []
+    for doc in generate(n, vendors=vendors, seed=seed):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            coll.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        coll.insert_many(batch, ordered=False)
+    return time.perf_counter() - started
+
+
+def main():
+    from .common import setup_django
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shops', type=int, default=10000)
+    parser.add_argument('--vendors', type=int, default=1000)
+    parser.add_argument('--mongo-uri', help='seed a real mongod instead of mongomock')
+    args = parser.parse_args()
+
+    setup_django(args.mongo_uri)
+    took = seed(args.shops, vendors=args.vendors)
+    print(f"Seeded {args.shops} shops for {args.vendors} vendors in {took:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
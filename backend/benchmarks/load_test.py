@@ -0,0 +1,149 @@
+"""
+Closed-loop HTTP load generator for comparing the WSGI and ASGI deployments.
+
+Start the server under test (from backend/, same Mongo and .env for both):
+
+    # sync path
+    gunicorn project.wsgi:application -w 2 --bind 127.0.0.1:8000
+    # async path
+    SHOPS_ASYNC_VIEWS=True gunicorn project.asgi:application -w 2 \
+        -k uvicorn.workers.UvicornWorker --bind 127.0.0.1:8001
+
+then drive each one with the same mix and compare the JSON reports:
+
+    python -m benchmarks.load_test --base http://127.0.0.1:8000 --token $JWT \
+        --concurrency 64 --duration 30 --out wsgi.json
+    python -m benchmarks.load_test --base http://127.0.0.1:8001 --token $JWT \
+        --concurrency 64 --duration 30 --out asgi.json
+    python -m benchmarks.load_test --compare wsgi.json asgi.json
+
+The nearby endpoint is rate-limited per IP; raise or disable the limit on
+the server under test before measuring it.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = [
+    # (weight, path)
+    (6, '/api/shops/nearby/?lat={lat}&lng={lng}&radius=5'),
+    (3, '/api/shops/?page_size=20'),
+    (1, '/api/shops/?cursor=&page_size=20'),
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def worker(base, headers, mix, deadline, samples, errors, lock, center):
+    parts = urlsplit(base)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    conn = conn_cls(parts.netloc, timeout=30)
+    weights = [w for w, _ in mix]
+    paths = [p for _, p in mix]
+    local, local_errors = [], 0
+    while time.monotonic() < deadline:
+        path = random.choices(paths, weights)[0].format(
+            lat=center[0] + random.uniform(-0.2, 0.2),
+            lng=center[1] + random.uniform(-0.2, 0.2),
+        )
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 400:
+                local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = conn_cls(parts.netloc, timeout=30)
+            continue
+        local.append(time.perf_counter() - started)
+    with lock:
+        samples.extend(local)
+        errors[0] += local_errors
+
+
+def run(base, token, concurrency, duration, center):
+    headers = {'Accept': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    samples, errors, lock = [], [0], threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=worker, args=(base, headers, DEFAULT_MIX, deadline, samples, errors, lock, center))
+        for _ in range(concurrency)
+    ]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    samples.sort()
+    return {
+        'base': base,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(samples),
+        'errors': errors[0],
+        'rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            f'p{p}': round(percentile(samples, p) * 1000, 2) if samples else None
+            for p in (50, 90, 95, 99)
+        },
+    }
+
+
+def compare(before, after):
+    """Side-by-side table of two reports; the change is after relative to before."""
+    rows = [('requests/s', before['rps'], after['rps']), ('errors', before['errors'], after['errors'])]
+    rows += [(f'{p} ms', before['latency_ms'][p], after['latency_ms'][p]) for p in before['latency_ms']]
+    lines = [f"{'':<12}{before['base']:>24}{after['base']:>24}{'change':>10}"]
+    for name, a, b in rows:
+        change = f'{(b - a) / a * 100:+.1f}%' if a and b is not None else ''
+        lines.append(f'{name:<12}{a!s:>24}{b!s:>24}{change:>10}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base', default='http://127.0.0.1:8000')
+    parser.add_argument('--token', default='', help='JWT access token for the authenticated endpoints')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds')
+    parser.add_argument('--lat', type=float, default=28.61)
+    parser.add_argument('--lng', type=float, default=77.20)
+    parser.add_argument('--out', help='write the JSON report here as well')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='print two saved reports side by side instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as fh:
+                reports.append(json.load(fh))
+        print(compare(*reports))
+        return
+
+    report = run(args.base, args.token, args.concurrency, args.duration, (args.lat, args.lng))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Per-row cost of the two shop read paths:
+
+  hydrated: Shop._from_son(row) -> shop_to_dict(doc)   (MongoEngine documents)
+  lean:     row_to_dict(row)                            (as_pymongo / raw PyMongo)
+
+Runs on in-memory BSON rows, so it isolates the Python-side cost of a read
+and needs no MongoDB. From backend/:
+
+    python -m benchmarks.read_path --rows 10000
+"""
+import argparse
+import timeit
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from .common import setup_django
+
+setup_django()
+
+from apps.shops.mongo_models import Shop  # noqa: E402
+from apps.shops.serializers import shop_to_dict, row_to_dict  # noqa: E402
+
+
+def make_rows(n):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return [{
+        '_id': ObjectId(),
+        'vendor_id': i % 50,
+        'name': f'Shop {i}',
+        'owner_name': f'Owner {i}',
+        'business_type': 'grocery',
+        'latitude': 28.6 + (i % 1000) * 1e-4,
+        'longitude': 77.2 + (i % 1000) * 1e-4,
+        'created_at': now,
+        'updated_at': now,
+    } for i in range(n)]
+
+
+def hydrated(rows):
+    return [shop_to_dict(Shop._from_son(row)) for row in rows]
+
+
+def lean(rows):
+    return [row_to_dict(row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    assert hydrated(rows[:10]) == lean(rows[:10])
+    for name, fn in (('hydrated', hydrated), ('lean', lean)):
+        best = min(timeit.repeat(lambda: fn(rows), number=1, repeat=args.repeat))
+        print(f"{name:>9}: {best * 1e6 / args.rows:8.2f} us/row  ({best * 1000:.1f} ms for {args.rows} rows)")
+
+
+if __name__ == '__main__':
+    main()
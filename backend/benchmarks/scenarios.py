@@ -0,0 +1,145 @@
+"""
+End-to-end throughput/latency of every ShopViewSet action through Django's
+test client, against a seeded mongomock (default) or local mongod. Prints
+and optionally writes a JSON report for regression tracking.
+
+    python -m benchmarks.scenarios --shops 10000 --requests 200 --out scenarios.json
+    python -m benchmarks.scenarios --shops 1000000 --mongo-uri mongodb://localhost/bench
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+
+def _summary(name, timings, statuses):
+    timings = sorted(timings)
+
+    def pct(p):
+        return round(timings[min(len(timings) - 1, int(p / 100 * len(timings)))] * 1000, 3)
+
+    total = sum(timings)
+    return {
+        'scenario': name,
+        'requests': len(timings),
+        'errors': sum(1 for s in statuses if s >= 400),
+        'rps': round(len(timings) / total, 1) if total else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(timings) * 1000, 3),
+            'p50': pct(50), 'p95': pct(95), 'p99': pct(99), 'max': pct(100),
+        },
+    }
+
+
+def run(shops, requests, vendors, mongo_uri=None, seed=42):
+    from .common import setup_django, access_token
+    setup_django(mongo_uri)
+
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+    from apps.shops.mongo_models import Shop
+    from .dataset import CITIES, seed as seed_shops
+
+    seed_seconds = seed_shops(shops, vendors=vendors, seed=seed)
+    rng = random.Random(seed)
+    coll = Shop._get_collection()
+    # the busiest vendor makes the list scenarios representative of large catalogs
+    top = next(coll.aggregate([
+        {'$group': {'_id': '$vendor_id', 'n': {'$sum': 1}}},
+        {'$sort': {'n': -1}}, {'$limit': 1},
+    ]))
+    vendor_id = top['_id']
+    own_ids = [str(r['_id']) for r in coll.find({'vendor_id': vendor_id}, {'_id': 1}).limit(1000)]
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token(vendor_id)}')
+    anon = APIClient()
+
+    def near():
+        _, lat, lng, _, spread = rng.choice(CITIES)
+        return lat + rng.uniform(-spread, spread), lng + rng.uniform(-spread, spread)
+
+    created = []
+
+    def create():
+        resp = client.post('/api/shops/', {
+            'name': 'Bench', 'owner_name': 'Bench', 'business_type': 'Cafe',
+            'latitude': 28.6, 'longitude': 77.2,
+        }, format='json')
+        created.append(resp.data['id'])
+        return resp
+
+    def destroy():
+        # deletes what the create scenario made, so the dataset ends where it started
+        return client.delete(f'/api/shops/{created.pop()}/') if created else None
+
+    scenarios = {
+        'list_page1': lambda: client.get('/api/shops/?page_size=20'),
+        'list_deep_page': lambda: client.get(f'/api/shops/?page_size=20&page={max(top["n"] // 20, 1)}'),
+        'list_cursor': lambda: client.get('/api/shops/?cursor=&page_size=20'),
+        'list_filtered': lambda: client.get('/api/shops/?business_type=cafe'),
+        'retrieve': lambda: client.get(f'/api/shops/{rng.choice(own_ids)}/'),
+        'nearby_2km': lambda: anon.get('/api/shops/nearby/?lat=%f&lng=%f&radius=2' % near()),
+        'nearby_10km': lambda: anon.get('/api/shops/nearby/?lat=%f&lng=%f&radius=10' % near()),
+        'create': create,
+        'partial_update': lambda: client.patch(f'/api/shops/{rng.choice(own_ids)}/', {'name': 'Renamed'}, format='json'),
+        'update': lambda: client.put(f'/api/shops/{rng.choice(own_ids)}/', {
+            'name': 'Bench', 'owner_name': 'Bench', 'business_type': 'grocery',
+            'latitude': 28.61, 'longitude': 77.21,
+        }, format='json'),
+        'destroy': destroy,
+        # buffered; the flush happens in the background (see apps/shops/pings.py)
+        'location_ping': lambda: client.post(f'/api/shops/{rng.choice(own_ids)}/location/', {
+            'latitude': 28.6 + rng.uniform(-0.01, 0.01), 'longitude': 77.2 + rng.uniform(-0.01, 0.01),
+        }, format='json'),
+    }
+
+    results = []
+    with override_settings(SHOPS_RATE_LIMIT_ENABLED=False):
+        for name, call in scenarios.items():
+            call()  # warm-up
+            timings, statuses = [], []
+            for _ in range(requests):
+                started = time.perf_counter()
+                resp = call()
+                if resp is None:
+                    break
+                timings.append(time.perf_counter() - started)
+                statuses.append(resp.status_code)
+            if timings:
+                results.append(_summary(name, timings, statuses))
+
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'backend': 'mongod' if mongo_uri else 'mongomock',
+        'shops': shops,
+        'vendors': vendors,
+        'seed_seconds': round(seed_seconds, 2),
+        'vendor_catalog_size': top['n'],
+        'scenarios': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shops', type=int, default=10000)
+    parser.add_argument('--vendors', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--mongo-uri', help='use a real mongod instead of mongomock')
+    parser.add_argument('--out', help='write the JSON report here as well')
+    args = parser.parse_args()
+
+    report = run(args.shops, args.requests, args.vendors, args.mongo_uri)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,11 @@ CORS_ALLOWED_ORIGINS = env.list("CORS_ALLOWED_ORIGINS", default=["http://localho
 # In dev, allow all CORS if you prefer (comment out if not desired)
 CORS_ALLOW_ALL_ORIGINS = DEBUG and not CORS_ALLOWED_ORIGINS
 
+# API-only mode (serverless, see api/index.py): leave out the admin, sessions,
+# messages and static files stacks and the browsable API so a cold start
+# imports only what the JSON API needs.
+API_ONLY = env.bool("API_ONLY", default=False)
+
 # -----------------------------------------------------------------------------
 # Applications
 # -----------------------------------------------------------------------------
@@ -56,6 +61,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.shops.instrumentation.InstrumentationMiddleware",  # outermost: times the whole stack
+    "apps.shops.compression.CompressionMiddleware",  # gzip/brotli for large JSON bodies
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # serve static files in prod
@@ -67,6 +74,22 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+if API_ONLY:
+    _BROWSER_ONLY_APPS = {
+        "django.contrib.admin",
+        "django.contrib.sessions",
+        "django.contrib.messages",
+        "django.contrib.staticfiles",
+    }
+    _BROWSER_ONLY_MIDDLEWARE = {
+        "whitenoise.middleware.WhiteNoiseMiddleware",
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",  # needs sessions; DRF authenticates itself
+        "django.contrib.messages.middleware.MessageMiddleware",
+    }
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in _BROWSER_ONLY_APPS]
+    MIDDLEWARE = [mw for mw in MIDDLEWARE if mw not in _BROWSER_ONLY_MIDDLEWARE]
+
 ROOT_URLCONF = "project.urls"
 
 TEMPLATES = [
@@ -79,8 +102,7 @@ TEMPLATES = [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
-                "django.contrib.messages.context_processors.messages",
-            ],
+            ] + ([] if API_ONLY else ["django.contrib.messages.context_processors.messages"]),
         },
     },
 ]
@@ -97,6 +119,23 @@ DATABASES = {
     }
 }
 
+# -----------------------------------------------------------------------------
+# Caches (URLs per django-environ, e.g. locmemcache://, filecache:///tmp/x,
+# rediscache://host:6379/1)
+# -----------------------------------------------------------------------------
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+    "nearby": env.cache("NEARBY_CACHE_URL", default="locmemcache://nearby"),
+}
+CACHES["nearby"].setdefault("OPTIONS", {}).setdefault(
+    "MAX_ENTRIES", env.int("NEARBY_CACHE_MAX_ENTRIES", default=2000)
+)
+
+# Worker processes per host (gunicorn takes its default --workers from it).
+# Process-local caches are refused or worked around where several workers
+# would each see only their own writes.
+WEB_CONCURRENCY = env.int("WEB_CONCURRENCY", default=1)
+
 # -----------------------------------------------------------------------------
 # Password validation
 # -----------------------------------------------------------------------------
@@ -132,9 +171,30 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    # Stateless: verifies the token and trusts its claims, no User lookup per request.
+    # Set JWT_STATELESS_AUTH=False to go back to simplejwt's JWTAuthentication.
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "apps.vendors.authentication.StatelessJWTAuthentication"
+        if env.bool("JWT_STATELESS_AUTH", default=True)
+        else "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    # orjson when installed, DRF's stdlib json otherwise (see apps/shops/renderers.py)
+    "DEFAULT_RENDERER_CLASSES": (
+        ("apps.shops.renderers.ORJSONRenderer",)
+        if API_ONLY
+        else ("apps.shops.renderers.ORJSONRenderer", "rest_framework.renderers.BrowsableAPIRenderer")
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "apps.shops.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+    # shared sliding-window quotas per throttle scope (see apps/shops/ratelimit.py)
+    "DEFAULT_THROTTLE_CLASSES": ("apps.shops.ratelimit.SharedRateThrottle",),
+    # anonymous quotas are per client IP: REMOTE_ADDR unless set to the number of
+    # proxies in front of the app that append to X-Forwarded-For (a client can
+    # write anything into the header itself, so never more than there are)
+    "NUM_PROXIES": env.int("NUM_PROXIES", default=0),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
 }
@@ -148,8 +208,20 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=REFRESH_DAYS),
     # You can override signing key via env if needed:
     "SIGNING_KEY": env("JWT_SIGNING_KEY", default=SECRET_KEY),
+    "TOKEN_USER_CLASS": "apps.vendors.authentication.VendorTokenUser",
 }
 
+# Revocation list for stateless auth (deactivated/deleted users), in a cache of
+# its own so hot shop keys never evict it. Without JWT_REVOCATION_CACHE_URL the
+# users table is checked instead; a process-local URL is refused when
+# WEB_CONCURRENCY > 1 (see apps/vendors/authentication.py).
+JWT_CHECK_REVOCATION = env.bool("JWT_CHECK_REVOCATION", default=True)
+JWT_REVOCATION_CACHE = None
+if env("JWT_REVOCATION_CACHE_URL", default=""):
+    CACHES["revocation"] = env.cache("JWT_REVOCATION_CACHE_URL")
+    JWT_REVOCATION_CACHE = "revocation"
+JWT_REVOCATION_CHECK_TTL = env.int("JWT_REVOCATION_CHECK_TTL", default=5)  # seconds a lookup is reused in-process
+
 # -----------------------------------------------------------------------------
 # CORS / CSRF
 # -----------------------------------------------------------------------------
@@ -160,14 +232,112 @@ CORS_ALLOW_CREDENTIALS = True
 # -----------------------------------------------------------------------------
 # MongoDB (MongoEngine) — for Shops domain data
 # -----------------------------------------------------------------------------
+# The connection is registered lazily per worker process by apps.shops.db
+# (no network I/O at import time); pool/timeouts are tunable per deployment.
 MONGODB_URI = env("MONGODB_URI", default="")
-if MONGODB_URI:
-    try:
-        from mongoengine import connect
-        connect(host=MONGODB_URI, alias="default")
-    except Exception as e:
-        # Avoid crashing at import-time in case of ephemeral envs; log to stdout
-        print(f"[MongoEngine] Connection deferred/failed: {e}")
+MONGODB_MAX_POOL_SIZE = env.int("MONGODB_MAX_POOL_SIZE", default=100)
+MONGODB_MIN_POOL_SIZE = env.int("MONGODB_MIN_POOL_SIZE", default=0)
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = env.int("MONGODB_WAIT_QUEUE_TIMEOUT_MS", default=5000)
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = env.int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", default=5000)
+MONGODB_CONNECT_TIMEOUT_MS = env.int("MONGODB_CONNECT_TIMEOUT_MS", default=5000)
+MONGODB_READ_PREFERENCE = env("MONGODB_READ_PREFERENCE", default="primary")  # e.g. secondary_preferred
+MONGODB_COMPRESSORS = env("MONGODB_COMPRESSORS", default="")  # e.g. "zstd,snappy,zlib"
+
+# Async serving mode: run under an ASGI server, e.g.
+#   gunicorn project.asgi:application -k uvicorn.workers.UvicornWorker
+# and shop reads (list/retrieve/nearby) use native async views on the async
+# PyMongo driver. Leave off for the plain WSGI deployment.
+SHOPS_ASYNC_VIEWS = env.bool("SHOPS_ASYNC_VIEWS", default=False)
+MONGODB_ASYNC_MAX_POOL_SIZE = env.int("MONGODB_ASYNC_MAX_POOL_SIZE", default=MONGODB_MAX_POOL_SIZE)
+
+# Nearby search engine:
+#   "bbox"    bounding box in Mongo + Python haversine
+#   "geonear" server-side $geoNear on the 2dsphere `location` index (run
+#             `python manage.py backfill_shop_geo` once before switching)
+#   "grid"    per-process in-memory grid index, reconciled from Mongo
+SHOPS_NEARBY_ENGINE = env("SHOPS_NEARBY_ENGINE", default="bbox")
+SHOPS_GRID_CELL_DEG = env.float("SHOPS_GRID_CELL_DEG", default=0.1)
+SHOPS_GRID_RECONCILE_SECONDS = env.int("SHOPS_GRID_RECONCILE_SECONDS", default=60)
+SHOPS_GRID_RECONCILE_LAG_SECONDS = env.int("SHOPS_GRID_RECONCILE_LAG_SECONDS", default=10)  # re-scanned per poll
+SHOPS_NEARBY_MAX_LIMIT = env.int("SHOPS_NEARBY_MAX_LIMIT", default=500)  # largest ?limit= per page
+SHOPS_NEARBY_MAX_RADIUS_KM = env.float("SHOPS_NEARBY_MAX_RADIUS_KM", default=500.0)  # largest ?radius=
+SHOPS_NEARBY_BATCH_MAX_POINTS = env.int("SHOPS_NEARBY_BATCH_MAX_POINTS", default=500)  # per batch request
+# total area of a batch request's circles, and shops it may read (400 above either)
+SHOPS_NEARBY_BATCH_MAX_AREA_KM2 = env.float("SHOPS_NEARBY_BATCH_MAX_AREA_KM2", default=100000.0)
+SHOPS_NEARBY_BATCH_MAX_CANDIDATES = env.int("SHOPS_NEARBY_BATCH_MAX_CANDIDATES", default=50000)
+
+# Geo partitioning (see apps/shops/partitions.py). SHOPS_GEO_PARTITIONING
+# constrains nearby queries to the geohash cells covering the circle (for a
+# collection sharded on geo_cell); SHOPS_GEO_PARTITIONS (JSON, geohash prefix
+# -> MongoDB URI) additionally routes them to per-region instances.
+SHOPS_GEO_PARTITIONING = env.bool("SHOPS_GEO_PARTITIONING", default=False)
+SHOPS_GEO_PARTITIONS = env.json("SHOPS_GEO_PARTITIONS", default={})
+
+# Nearby response cache (see apps/shops/nearby_cache.py)
+SHOPS_NEARBY_CACHE = env.bool("SHOPS_NEARBY_CACHE", default=False)
+SHOPS_NEARBY_CACHE_ALIAS = "nearby"
+SHOPS_NEARBY_CACHE_TTL = env.int("SHOPS_NEARBY_CACHE_TTL", default=60)
+SHOPS_NEARBY_CACHE_GRID_DEG = env.float("SHOPS_NEARBY_CACHE_GRID_DEG", default=0.01)     # query snapping
+SHOPS_NEARBY_CACHE_RADIUS_STEP = env.float("SHOPS_NEARBY_CACHE_RADIUS_STEP", default=1.0)  # km
+SHOPS_NEARBY_CACHE_CELL_DEG = env.float("SHOPS_NEARBY_CACHE_CELL_DEG", default=0.5)      # invalidation cells
+
+# Vendor shop list: "page" (?page=N, exact count) or "cursor" (keyset
+# pagination on created_at/_id). Passing ?cursor= opts into cursor mode.
+SHOPS_LIST_PAGINATION = env("SHOPS_LIST_PAGINATION", default="page")
+# "facet": page + exact total in one $facet aggregation; "queries": find + count_documents
+SHOPS_LIST_ENGINE = env("SHOPS_LIST_ENGINE", default="facet")
+SHOPS_LIST_COUNT_TTL = env.int("SHOPS_LIST_COUNT_TTL", default=300)  # seconds a count=estimated total is cached
+# largest ?page_size=; keeps the single $facet result far below 16MB
+SHOPS_LIST_MAX_PAGE_SIZE = env.int("SHOPS_LIST_MAX_PAGE_SIZE", default=100)
+# Conditional GET: a vendor's list ETag comes from a version token in the
+# default cache, replaced on every write; derived from the vendor's shops when
+# that cache is process-local (see apps/shops/conditional.py)
+SHOPS_LIST_VERSION_TTL = env.int("SHOPS_LIST_VERSION_TTL", default=300)
+
+# Compression of JSON / NDJSON responses (see apps/shops/compression.py);
+# brotli needs `pip install brotli`, gzip is always available
+SHOPS_COMPRESSION = env.bool("SHOPS_COMPRESSION", default=True)
+SHOPS_COMPRESS_MIN_BYTES = env.int("SHOPS_COMPRESS_MIN_BYTES", default=1024)
+SHOPS_GZIP_LEVEL = env.int("SHOPS_GZIP_LEVEL", default=6)
+SHOPS_BROTLI_QUALITY = env.int("SHOPS_BROTLI_QUALITY", default=5)
+
+# Bulk import (POST /api/shops/import/)
+SHOPS_BULK_CHUNK_SIZE = env.int("SHOPS_BULK_CHUNK_SIZE", default=500)
+SHOPS_BULK_MAX_ROWS = env.int("SHOPS_BULK_MAX_ROWS", default=50000)
+
+# Location pings (POST /api/shops/{id}/location/, see apps/shops/pings.py):
+# the latest position per shop is buffered per process and written every
+# SHOPS_PING_FLUSH_SECONDS with one bulk_write
+SHOPS_PING_FLUSH_SECONDS = env.float("SHOPS_PING_FLUSH_SECONDS", default=2.0)
+SHOPS_PING_MAX_PENDING = env.int("SHOPS_PING_MAX_PENDING", default=10000)  # shops; a full buffer flushes inline
+SHOPS_PING_BATCH_SIZE = env.int("SHOPS_PING_BATCH_SIZE", default=1000)     # updates per bulk_write
+# write each ping before responding (204) instead of buffering it; the default
+# under API_ONLY, where a serverless function can be frozen between invocations
+SHOPS_PING_WRITE_THROUGH = env.bool("SHOPS_PING_WRITE_THROUGH", default=API_ONLY)
+
+# Rate limits (see apps/shops/ratelimit.py). Scopes: shops.list, shops.retrieve,
+# shops.write, shops.location, shops.import, shops.export, shops.nearby,
+# shops.nearby_batch, auth.register, auth.login. Counters are shared by all
+# workers through the store:
+# sqlite:///path (one file per host), redis://host:6379/0 or memory://.
+SHOPS_RATE_LIMIT_ENABLED = env.bool("SHOPS_RATE_LIMIT_ENABLED", default=True)
+SHOPS_RATE_LIMITS = env.json("SHOPS_RATE_LIMITS", default={"shops.nearby": "30/m", "shops.nearby_batch": "30/m"})
+SHOPS_RATE_LIMIT_VENDORS = env.json("SHOPS_RATE_LIMIT_VENDORS", default={})  # {"<vendor id>": {scope: rate}}
+SHOPS_RATE_LIMIT_STORE = env("SHOPS_RATE_LIMIT_STORE", default="sqlite://")  # sqlite:// = file in the temp dir
+SHOPS_RATE_LIMIT_SYNC_HITS = env.int("SHOPS_RATE_LIMIT_SYNC_HITS", default=10)
+SHOPS_RATE_LIMIT_SYNC_SECONDS = env.float("SHOPS_RATE_LIMIT_SYNC_SECONDS", default=0.5)
+
+# Request instrumentation: per-route latency histograms for every request;
+# Mongo command / view phase breakdown (Server-Timing header + /metrics) for a
+# sampled fraction of requests.
+SHOPS_METRICS_ENABLED = env.bool("SHOPS_METRICS_ENABLED", default=True)
+SHOPS_METRICS_SAMPLE_RATE = env.float("SHOPS_METRICS_SAMPLE_RATE", default=0.1)
+
+# Operator endpoints (/metrics, the details of /api/health/): open to requests
+# with `Authorization: Bearer <OPS_TOKEN>` or from OPS_ALLOWED_IPS (addresses or
+# CIDR networks, matched against REMOTE_ADDR)
+OPS_TOKEN = env("OPS_TOKEN", default="")
+OPS_ALLOWED_IPS = env.list("OPS_ALLOWED_IPS", default=["127.0.0.1", "::1"])
 
 # -----------------------------------------------------------------------------
 # Production security hardening (safe defaults; tune per-host)
@@ -190,4 +360,5 @@ elif env_file_backend.exists():
     ENV_FILE = env_file_backend
 else:
     ENV_FILE = None
-print(f"[settings] DEBUG={DEBUG} | ENV_FILE={ENV_FILE} | BASE_DIR={BASE_DIR}")
+if not API_ONLY:  # keep serverless cold starts quiet
+    print(f"[settings] DEBUG={DEBUG} | ENV_FILE={ENV_FILE} | BASE_DIR={BASE_DIR}")
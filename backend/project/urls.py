@@ -1,9 +1,10 @@
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 from django.views.generic import RedirectView
+from apps.shops.instrumentation import metrics_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape target
     path('', RedirectView.as_view(url='/api/', permanent=False)),
 
     path('api/auth/', include('apps.vendors.urls')),
@@ -12,3 +13,7 @@ urlpatterns = [
     path('api/', include('apps.shops.urls')),
     path('api', include('apps.shops.urls')),
 ]
+
+if apps.is_installed('django.contrib.admin'):  # left out with API_ONLY
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))